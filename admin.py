@@ -1,14 +1,17 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import MqttTopic, MqttMessage, MqttConnection
+from .models import MqttTopic, MqttMessage, MqttMessageArchive, MqttConnection, MqttOutboxMessage, MqttPayloadDictionary, MqttReading, MqttRollup
+from .payloads import ENCODING_JSON
+from .search import parse_query, search_index
 
 
 @admin.register(MqttTopic)
 class MqttTopicAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'is_active', 'qos', 'message_count_display', 'latest_message_display', 'created_at']
-    list_filter = ['is_active', 'qos', 'created_at']
+    list_filter = ['is_active', 'qos', 'payload_codec', 'created_at']
     search_fields = ['name', 'description']
     readonly_fields = ['created_at', 'updated_at', 'message_count_display', 'latest_message_display']
     
@@ -17,7 +20,18 @@ class MqttTopicAdmin(admin.ModelAdmin):
             'fields': ('name', 'description')
         }),
         ('Configuration', {
-            'fields': ('is_active', 'qos')
+            'fields': ('is_active', 'qos', 'connections')
+        }),
+        ('Payload', {
+            'fields': ('payload_codec', 'value_path', 'payload_compression'),
+        }),
+        ('Search', {
+            'fields': ('search_enabled', 'search_keys'),
+            'classes': ('collapse',)
+        }),
+        ('Retention', {
+            'fields': ('max_messages', 'max_age', 'max_bytes'),
+            'classes': ('collapse',)
         }),
         ('Statistics', {
             'fields': ('message_count_display', 'latest_message_display'),
@@ -36,25 +50,29 @@ class MqttTopicAdmin(admin.ModelAdmin):
             return format_html('<a href="{}">{} messages</a>', url, count)
         return '0 messages'
     message_count_display.short_description = 'Messages'
+    message_count_display.admin_order_field = 'message_count'
     
     def latest_message_display(self, obj):
-        latest = obj.latest_message
-        if latest:
+        if obj.last_received_at:
             return format_html(
                 '<span title="{}">{}</span>',
-                latest.payload[:200],
-                latest.received_at.strftime('%Y-%m-%d %H:%M:%S')
+                obj.last_payload[:200],
+                obj.last_received_at.strftime('%Y-%m-%d %H:%M:%S')
             )
         return 'No messages'
     latest_message_display.short_description = 'Latest Message'
+    latest_message_display.admin_order_field = 'last_received_at'
 
 
 @admin.register(MqttMessage)
 class MqttMessageAdmin(admin.ModelAdmin):
     list_display = ['topic', 'payload_preview', 'qos', 'retain', 'timestamp', 'received_at']
     list_filter = ['topic', 'qos', 'retain', 'received_at']
-    search_fields = ['topic__name', 'payload']
-    readonly_fields = ['topic', 'payload', 'qos', 'retain', 'timestamp', 'received_at', 'payload_formatted']
+    # The topic column would otherwise cost one query per row
+    list_select_related = ['topic']
+    # Payloads are searched through the search index, see get_search_results
+    search_fields = ['topic__name']
+    readonly_fields = ['topic', 'payload', 'payload_encoding', 'payload_compression', 'qos', 'retain', 'timestamp', 'received_at', 'payload_formatted']
     date_hierarchy = 'received_at'
     
     fieldsets = (
@@ -62,10 +80,21 @@ class MqttMessageAdmin(admin.ModelAdmin):
             'fields': ('topic', 'timestamp', 'received_at')
         }),
         ('Content', {
-            'fields': ('payload_formatted', 'qos', 'retain')
+            'fields': ('payload_formatted', 'payload_encoding', 'payload_compression', 'qos', 'retain')
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        """Topic name matches plus payload matches from the full-text index (``key=value`` uses the key index)"""
+        # The changelist queryset, already narrowed by list_filter and date_hierarchy
+        filtered = queryset
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return queryset, may_have_duplicates
+        query, keys = parse_query(search_term)
+        matches = search_index.filter(filtered, query, keys)
+        return queryset | matches, may_have_duplicates
+    
     def payload_preview(self, obj):
         return obj.payload_preview
     payload_preview.short_description = 'Payload Preview'
@@ -73,14 +102,14 @@ class MqttMessageAdmin(admin.ModelAdmin):
     def payload_formatted(self, obj):
         """Display payload in a formatted way"""
         import json
-        try:
-            # Try to format as JSON if possible
-            parsed = json.loads(obj.payload)
-            formatted = json.dumps(parsed, indent=2)
-            return format_html('<pre style="white-space: pre-wrap;">{}</pre>', formatted)
-        except (json.JSONDecodeError, TypeError):
-            # If not JSON, display as plain text
-            return format_html('<pre style="white-space: pre-wrap;">{}</pre>', obj.payload)
+        # Decided on the stored encoding alone (no topic lookup); text and base64 are shown as stored
+        if obj.payload_encoding == ENCODING_JSON:
+            try:
+                formatted = json.dumps(json.loads(obj.payload_text), indent=2)
+                return format_html('<pre style="white-space: pre-wrap;">{}</pre>', formatted)
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', obj.payload_text)
     payload_formatted.short_description = 'Payload'
     
     def has_add_permission(self, request):
@@ -88,15 +117,108 @@ class MqttMessageAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(MqttMessageArchive)
+class MqttMessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'qos', 'retain', 'timestamp', 'received_at', 'archived_at']
+    list_filter = ['topic', 'qos']
+    readonly_fields = ['topic', 'payload_display', 'payload_size', 'payload_compression', 'qos', 'retain', 'timestamp', 'received_at', 'archived_at']
+    exclude = ['payload', 'payload_blob']
+    date_hierarchy = 'received_at'
+    
+    def payload_display(self, obj):
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', obj.payload_text)
+    payload_display.short_description = 'Payload'
+    
+    def has_add_permission(self, request):
+        # Archived messages are moved here from MqttMessage
+        return False
+
+
+@admin.register(MqttPayloadDictionary)
+class MqttPayloadDictionaryAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'compression', 'size_display', 'sample_count', 'created_at']
+    list_filter = ['compression', 'topic']
+    readonly_fields = ['topic', 'compression', 'size_display', 'sample_count', 'created_at']
+    exclude = ['data']
+    
+    def size_display(self, obj):
+        return f'{len(obj.data)} bytes'
+    size_display.short_description = 'Size'
+    
+    def has_add_permission(self, request):
+        # Dictionaries are built with the mqtt_train_dictionary command
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        # Stored payloads reference their dictionary, it is needed to read them
+        return False
+
+
+@admin.register(MqttReading)
+class MqttReadingAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'value', 'ts']
+    list_filter = ['topic']
+    readonly_fields = ['topic', 'ts', 'value']
+    date_hierarchy = 'ts'
+    
+    def has_add_permission(self, request):
+        # Readings are extracted from messages at ingest
+        return False
+
+
+@admin.register(MqttRollup)
+class MqttRollupAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'resolution', 'bucket', 'count', 'min', 'max', 'avg']
+    list_filter = ['resolution', 'topic']
+    readonly_fields = ['topic', 'resolution', 'bucket', 'count', 'sum', 'min', 'max']
+    date_hierarchy = 'bucket'
+    
+    def has_add_permission(self, request):
+        # Rollups are maintained at ingest
+        return False
+
+
+@admin.register(MqttOutboxMessage)
+class MqttOutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'connection', 'qos', 'retain', 'attempts', 'created_at']
+    list_filter = ['qos', 'connection']
+    search_fields = ['topic']
+    readonly_fields = ['attempts', 'last_error', 'created_at']
+
+
+class MqttConnectionForm(forms.ModelForm):
+    """Broker password is write-only: never rendered, left blank keeps the stored value"""
+    password = forms.CharField(
+        required=False,
+        widget=forms.PasswordInput(render_value=False),
+        help_text="Leave blank to keep the current password",
+    )
+
+    class Meta:
+        model = MqttConnection
+        fields = '__all__'
+
+    def clean_password(self):
+        password = self.cleaned_data.get('password')
+        if not password and self.instance.pk:
+            return self.instance.password
+        return password
+
+
 @admin.register(MqttConnection)
 class MqttConnectionAdmin(admin.ModelAdmin):
-    list_display = ['broker_host', 'broker_port', 'status', 'last_connected', 'created_at']
-    list_filter = ['status', 'broker_host', 'created_at']
-    readonly_fields = ['broker_host', 'broker_port', 'status', 'last_connected', 'last_error', 'created_at', 'updated_at']
+    form = MqttConnectionForm
+    list_display = ['name', 'broker_host', 'broker_port', 'is_enabled', 'status', 'last_connected', 'created_at']
+    list_filter = ['is_enabled', 'status', 'broker_host', 'created_at']
+    readonly_fields = ['status', 'last_connected', 'last_error', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Connection Information', {
-            'fields': ('broker_host', 'broker_port', 'status')
+            'fields': ('name', 'broker_host', 'broker_port', 'is_enabled', 'status')
+        }),
+        ('Client', {
+            'fields': ('username', 'password', 'client_id', 'keepalive'),
+            'classes': ('collapse',)
         }),
         ('Status Details', {
             'fields': ('last_connected', 'last_error')
@@ -107,12 +229,8 @@ class MqttConnectionAdmin(admin.ModelAdmin):
         }),
     )
     
-    def has_add_permission(self, request):
-        # Connections are created automatically
-        return False
-    
     def has_delete_permission(self, request, obj=None):
-        # Don't allow deletion of connection records
+        # Don't allow deletion of connection records, disable them instead
         return False
 
 
@@ -11,6 +11,8 @@ class MqttConfig(AppConfig):
     
     def ready(self):
         """Initialize MQTT client when Django starts"""
+        from . import signals  # noqa: F401 - registers model signal receivers
+        
         # Only initialize in production/runserver, not during migrations
         import sys
         if 'migrate' in sys.argv or 'makemigrations' in sys.argv:
@@ -22,7 +24,8 @@ class MqttConfig(AppConfig):
             
             # Only setup client, don't auto-connect to avoid database access
             auto_connect = getattr(settings, 'MQTT_AUTO_CONNECT', False)
-            if auto_connect:
+            # The asyncio engine is started by the ASGI lifespan (apps.mqtt.asgi.MqttLifespan)
+            if auto_connect and getattr(settings, 'MQTT_ENGINE', 'thread') != 'asyncio':
                 # Delay the connection to avoid database access during app initialization
                 import threading
                 def delayed_connect():
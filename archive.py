@@ -0,0 +1,60 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+
+from django.db import transaction
+
+from .models import MqttMessage, MqttMessageArchive
+from .stats import decrement_message_counts
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'topic_id', 'payload', 'payload_size', 'payload_encoding', 'qos', 'retain', 'timestamp',
+                  'received_at', 'payload_compression', 'payload_blob', 'payload_file', 'payload_dictionary_id')
+
+
+def archive_messages(before: datetime, topic_ids: Optional[Iterable[int]] = None,
+                     exclude_topic_ids: Optional[Iterable[int]] = None, batch_size: int = 5000) -> int:
+    """Move messages received before ``before`` into MqttMessageArchive
+
+    Works oldest first in chunks, each chunk copied and deleted in its own
+    transaction so the hot table shrinks steadily without long locks.
+    Returns the number of archived messages.
+    """
+    queryset = MqttMessage.objects.filter(received_at__lt=before)
+    if topic_ids is not None:
+        queryset = queryset.filter(topic_id__in=list(topic_ids))
+    if exclude_topic_ids:
+        queryset = queryset.exclude(topic_id__in=list(exclude_topic_ids))
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.order_by('received_at').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            MqttMessageArchive.objects.bulk_create([
+                MqttMessageArchive(
+                    topic_id=row['topic_id'],
+                    payload=row['payload'],
+                    payload_size=row['payload_size'],
+                    payload_encoding=row['payload_encoding'],
+                    qos=row['qos'],
+                    retain=row['retain'],
+                    timestamp=row['timestamp'],
+                    received_at=row['received_at'],
+                    # Compressed and offloaded payloads are moved as stored
+                    payload_compression=row['payload_compression'],
+                    payload_blob=row['payload_blob'],
+                    payload_file=row['payload_file'],
+                    payload_dictionary_id=row['payload_dictionary_id'],
+                )
+                for row in rows
+            ])
+            MqttMessage.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            decrement_message_counts(Counter(row['topic_id'] for row in rows))
+        archived += len(rows)
+        logger.debug(f"Archived {archived} MQTT messages")
+
+    return archived
@@ -0,0 +1,56 @@
+import logging
+
+from .async_engine import ENGINE_ASYNCIO, engine_name, get_engine
+
+logger = logging.getLogger(__name__)
+
+
+class MqttLifespan:
+    """ASGI wrapper running the asyncio MQTT engine for the lifetime of the server
+
+    Django's ASGI handler does not implement the lifespan protocol, so this
+    wrapper answers lifespan events itself and passes everything else to the
+    wrapped application::
+
+        application = MqttLifespan(get_asgi_application())
+
+    The engine is only started when ``MQTT_ENGINE = 'asyncio'``; the client
+    then shares the server's event loop.
+    """
+
+    def __init__(self, app, engine=None):
+        self.app = app
+        self.engine = engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.error(f"Failed to start MQTT engine: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self.shutdown()
+                except Exception as e:
+                    logger.error(f"Failed to stop MQTT engine: {e}")
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        if engine_name() != ENGINE_ASYNCIO:
+            return
+        if self.engine is None:
+            self.engine = get_engine()
+        await self.engine.start()
+
+    async def shutdown(self):
+        if self.engine is not None and self.engine.is_running:
+            await self.engine.stop()
@@ -0,0 +1,283 @@
+import asyncio
+import functools
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ENGINE_THREAD = 'thread'
+ENGINE_ASYNCIO = 'asyncio'
+
+
+class SocketBridge:
+    """Drive one paho client from an asyncio loop through paho's external loop API
+
+    The socket is watched with ``add_reader``/``add_writer`` and keepalives
+    are handled by a ``loop_misc`` task, so no paho network thread is
+    started. paho may open, close or want to write to the socket from other
+    threads (publishing from a view, connecting in an executor), so every
+    registration is marshalled onto the loop.
+    """
+
+    # paho expects loop_misc about once a second for keepalive pings and retries
+    MISC_INTERVAL = 1.0
+
+    def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+        self._sock = None
+        self._misc_task: Optional[asyncio.Task] = None
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _call(self, func, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call(self._open, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call(self._close, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call(self._register_write, sock)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call(self._unregister_write, sock)
+
+    def _open(self, sock):
+        self._sock = sock
+        self.loop.add_reader(sock, self._read)
+        if self._misc_task is None or self._misc_task.done():
+            self._misc_task = self.loop.create_task(self._misc())
+
+    def _close(self, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        if self._sock is sock:
+            self._sock = None
+
+    def _register_write(self, sock):
+        self.loop.add_writer(sock, self._write)
+
+    def _unregister_write(self, sock):
+        self.loop.remove_writer(sock)
+
+    @property
+    def closed(self) -> bool:
+        return self._sock is None
+
+    def _read(self):
+        self.client.loop_read()
+
+    def _write(self):
+        self.client.loop_write()
+
+    async def _misc(self):
+        while True:
+            if self._sock is not None:
+                self.client.loop_misc()
+            await asyncio.sleep(self.MISC_INTERVAL)
+
+    def close(self):
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+        if self._sock is not None:
+            self._close(self._sock)
+
+
+class AsyncMqttEngine:
+    """Run MqttClientService instances on one asyncio loop instead of paho's loop_start thread
+
+    Socket I/O happens on the loop, so a slow database call can no longer
+    delay keepalives. Everything that touches the database (connection
+    records, subscribing to active topics, outbox replay) is handed to the
+    loop's default executor; received messages still only go into the ingest
+    pipelines, whose writer threads do the inserts. One engine can hold many
+    services, e.g. one per broker, each with its own socket.
+
+    Use ``start``/``stop`` from async code (the ASGI lifespan wrapper in
+    ``apps.mqtt.asgi`` or ``mqtt_client --engine asyncio``).
+    """
+
+    # Seconds stop() waits for sockets to close after disconnecting
+    CLOSE_TIMEOUT = 2.0
+
+    def __init__(self, services: Optional[Iterable] = None):
+        if services is None:
+            from .mqtt_client import mqtt_service
+            services = [mqtt_service]
+        self.services = list(services)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bridges: Dict[int, SocketBridge] = {}
+        self._reconnecting: Dict[int, asyncio.Task] = {}
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self) -> list:
+        """Connect every service, returns whether each got a socket (failed ones keep retrying)"""
+        self.loop = asyncio.get_running_loop()
+        self._running = True
+        for service in self.services:
+            service.engine = self
+        return await asyncio.gather(*(self.connect(service) for service in self.services))
+
+    async def stop(self):
+        """Disconnect every service and flush their pipelines"""
+        self._running = False
+        for task in self._reconnecting.values():
+            task.cancel()
+        self._reconnecting.clear()
+        await asyncio.gather(*(self._run_sync(service.disconnect) for service in self.services),
+                             return_exceptions=True)
+        # Let the loop flush the DISCONNECT packets before the sockets are unregistered
+        for _ in range(int(self.CLOSE_TIMEOUT / 0.05)):
+            if all(bridge.closed for bridge in self._bridges.values()):
+                break
+            await asyncio.sleep(0.05)
+        for service in self.services:
+            bridge = self._bridges.pop(id(service), None)
+            if bridge:
+                bridge.close()
+            service.engine = None
+
+    async def connect(self, service) -> bool:
+        """Prepare the service (in the executor) and open its socket on this loop"""
+        try:
+            host, port, keepalive = await self._run_sync(service.prepare_connect)
+        except Exception as e:
+            await self._run_sync(service.connect_failed, e)
+            return False
+
+        self._attach(service)
+        try:
+            # The TCP/TLS handshake blocks, the socket is registered on the loop from on_socket_open
+            await self.loop.run_in_executor(
+                None, functools.partial(service.client.connect, host, port, keepalive, **service.connect_options())
+            )
+        except Exception as e:
+            await self._run_sync(service.connect_failed, e)
+            self._schedule_reconnect(service)
+            return False
+        logger.info(f"Connecting to MQTT broker at {host}:{port} (asyncio engine)")
+        return True
+
+    def connect_threadsafe(self, service) -> bool:
+        """``MqttClientService.connect`` from another thread, e.g. the dashboard connect view"""
+        if self.loop is None or not self._running:
+            return False
+        asyncio.run_coroutine_threadsafe(self.connect(service), self.loop)
+        return True
+
+    def _attach(self, service):
+        """Route the service's callbacks so database work leaves the loop"""
+        client = service.client
+        bridge = self._bridges.get(id(service))
+        if bridge and bridge.client is client:
+            return
+        self._bridges[id(service)] = SocketBridge(client, self.loop)
+
+        def on_connect(client, userdata, flags, rc, properties=None):
+            self._submit(service._on_connect, client, userdata, flags, rc, properties)
+
+        def on_disconnect(client, userdata, rc, properties=None):
+            self._submit(service._on_disconnect, client, userdata, rc, properties)
+            if rc != 0:
+                self._schedule_reconnect(service)
+
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+
+    def _submit(self, func, *args):
+        """Run a blocking service callback in the executor without awaiting it"""
+        def submit():
+            future = self.loop.run_in_executor(None, self._in_thread, func, args)
+            future.add_done_callback(self._log_failure)
+        self._call_on_loop(submit)
+
+    def _schedule_reconnect(self, service):
+        if not self._running or id(service) in self._reconnecting:
+            return
+        self._call_on_loop(self._start_reconnect, service)
+
+    def _start_reconnect(self, service):
+        if id(service) not in self._reconnecting:
+            self._reconnecting[id(service)] = self.loop.create_task(self._reconnect(service))
+
+    def _call_on_loop(self, func, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    async def _reconnect(self, service):
+        """Reconnect with the service's jittered backoff until it succeeds or the engine stops"""
+        try:
+            while self._running and not service.is_connected:
+                await asyncio.sleep(service.backoff.next_delay())
+                metrics.reconnect_attempts.inc(service.label)
+                try:
+                    await self.loop.run_in_executor(None, service.client.reconnect)
+                    logger.info("Reconnecting to MQTT broker (asyncio engine)")
+                    return
+                except Exception as e:
+                    logger.error(f"MQTT reconnect to {service.label} failed: {e}")
+        finally:
+            self._reconnecting.pop(id(service), None)
+
+    async def _run_sync(self, func, *args):
+        return await self.loop.run_in_executor(None, self._in_thread, func, args)
+
+    @staticmethod
+    def _in_thread(func, args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception():
+            logger.error(f"Error in MQTT callback: {future.exception()}")
+
+
+_engine_lock = threading.Lock()
+_engine: Optional[AsyncMqttEngine] = None
+
+
+def get_engine() -> AsyncMqttEngine:
+    """Process-wide engine for the global mqtt_service"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncMqttEngine()
+        return _engine
+
+
+def engine_name() -> str:
+    return getattr(settings, 'MQTT_ENGINE', ENGINE_THREAD)
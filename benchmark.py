@@ -0,0 +1,305 @@
+import itertools
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import paho.mqtt.client as mqtt
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .fake_broker import FakeBroker
+from .models import MqttTopic, MqttMessage, MqttConnection
+from .pagination import encode_cursor, keyset_page
+
+BENCH_TOPIC_PREFIX = 'bench/'
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+@contextmanager
+def explicit_received_at():
+    """Allow seeding MqttMessage.received_at instead of auto_now_add"""
+    field = MqttMessage._meta.get_field('received_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def seed_messages(rows: int, topics: int, days: float = 30, payload_size: int = 64,
+                  batch_size: int = 10000, progress: Callable[[int], None] = None) -> List[int]:
+    """Insert synthetic messages spread evenly over the last ``days``, returns topic ids"""
+    topic_objs = [MqttTopic(name=f'{BENCH_TOPIC_PREFIX}{i}', description='Benchmark topic') for i in range(topics)]
+    MqttTopic.objects.bulk_create(topic_objs, ignore_conflicts=True)
+    topic_ids = list(MqttTopic.objects.filter(name__startswith=BENCH_TOPIC_PREFIX).values_list('id', flat=True))
+
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    step = (now - start) / max(1, rows)
+    payload = 'x' * payload_size
+
+    with explicit_received_at():
+        inserted = 0
+        while inserted < rows:
+            count = min(batch_size, rows - inserted)
+            MqttMessage.objects.bulk_create([
+                MqttMessage(
+                    topic_id=topic_ids[(inserted + i) % len(topic_ids)],
+                    payload=payload,
+                    payload_size=payload_size,
+                    timestamp=start + step * (inserted + i),
+                    received_at=start + step * (inserted + i),
+                )
+                for i in range(count)
+            ])
+            inserted += count
+            if progress:
+                progress(inserted)
+
+    return topic_ids
+
+
+def cleanup_benchmark_data() -> int:
+    """Remove benchmark topics and their messages"""
+    topic_ids = list(MqttTopic.objects.filter(name__startswith=BENCH_TOPIC_PREFIX).values_list('id', flat=True))
+    deleted = MqttMessage.objects.filter(topic_id__in=topic_ids).delete()[0]
+    MqttTopic.objects.filter(id__in=topic_ids).delete()
+    return deleted
+
+
+def time_query(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Run fn ``repeat`` times, returns p50/p99/max latency in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50': statistics.median(samples),
+        'p99': percentile(samples, 99),
+        'max': max(samples),
+    }
+
+
+def run_query_benchmark(topic_ids: List[int], repeat: int = 20, page_size: int = 50) -> Dict[str, Dict[str, float]]:
+    """Time the read paths used by the dashboard, the topic messages API and the admin"""
+    rng = random.Random(42)
+    per_topic = MqttMessage.objects.filter(topic_id=topic_ids[0]).count()
+    deep_offset = max(0, per_topic // 2)
+
+    def pick():
+        return rng.choice(topic_ids)
+
+    def keyset_deep():
+        topic_id = pick()
+        messages = MqttMessage.objects.filter(topic_id=topic_id)
+        cursor_row = messages.order_by('-received_at', '-id').values('received_at', 'id')[deep_offset:deep_offset + 1].first()
+        cursor = encode_cursor(cursor_row['received_at'], cursor_row['id']) if cursor_row else None
+        # Only the page fetch is what the API pays per request, the cursor comes from the client
+        return lambda: keyset_page(messages, ['id', 'payload'], page_size, before=cursor)
+
+    queries = {
+        'latest_message': lambda: MqttMessage.objects.filter(topic_id=pick()).order_by('-received_at').first(),
+        'topic_page_first': lambda: list(MqttMessage.objects.filter(topic_id=pick())[:page_size]),
+        'topic_page_deep': lambda: list(MqttMessage.objects.filter(topic_id=pick())[deep_offset:deep_offset + page_size]),
+        'topic_page_keyset_deep': keyset_deep(),
+        'dashboard_recent': lambda: list(MqttMessage.objects.select_related('topic')[:20]),
+        'admin_topic_filter': lambda: list(MqttMessage.objects.filter(topic_id=pick()).order_by('-received_at')[:100]),
+        'time_range_last_hour': lambda: list(MqttMessage.objects.filter(
+            received_at__gte=timezone.now() - timedelta(hours=1))[:1000]),
+        'retention_cutoff': lambda: MqttMessage.objects.filter(topic_id=pick()).order_by('-received_at').values_list(
+            'received_at', flat=True)[1000:1001].first(),
+    }
+    return {name: time_query(fn, repeat) for name, fn in queries.items()}
+
+
+class QueryCounter:
+    """Count SQL statements on every database connection, including worker threads"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self._connections.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self._on_connection_created)
+        return self
+
+    def __exit__(self, *exc):
+        connection_created.disconnect(self._on_connection_created)
+        for connection in self._connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size of this process in MB (Linux), peak RSS elsewhere"""
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_payload(seq: int, size: int) -> bytes:
+    """Payload starting with a 10 digit sequence number used to match latency samples"""
+    return (b'%010d' % seq).ljust(size, b'x')
+
+
+def run_ingest_benchmark(messages: int = 20000, payload_size: int = 64, topics: int = 10, qos: int = 0,
+                         rate: float = 0, mode: str = 'direct', timeout: float = 120) -> Dict[str, float]:
+    """Push ``messages`` through MqttClientService and measure ingest
+
+    ``direct`` calls ``_on_message`` with paho message objects; ``broker``
+    runs the full ``setup_client``/``connect`` path against an in-process
+    FakeBroker and publishes through it. ``rate`` is the target msg/s (0 for
+    as fast as possible). Latency is from publish until the message callback
+    fires, which happens after the batch is committed.
+    """
+    from .mqtt_client import MqttClientService
+
+    cleanup_benchmark_data()
+    MqttTopic.objects.bulk_create([
+        MqttTopic(name=f'{BENCH_TOPIC_PREFIX}{i}', description='Benchmark topic', is_active=False)
+        for i in range(topics)
+    ])
+
+    sent = [0.0] * messages
+    latencies = []
+    done = threading.Event()
+    last_received = [0.0]
+
+    def on_message(topic, message):
+        now = time.perf_counter()
+        latencies.append(now - sent[int(message.payload[:10])])
+        last_received[0] = now
+        if len(latencies) >= messages:
+            done.set()
+
+    service = MqttClientService()
+    service.add_message_callback(on_message)
+    broker = None
+    settings_override = None
+    rss_before = rss_mb()
+
+    with QueryCounter() as queries:
+        try:
+            if mode == 'broker':
+                MqttTopic.objects.create(name=f'{BENCH_TOPIC_PREFIX}#', description='Benchmark subscription', qos=qos)
+                broker = FakeBroker().start()
+                settings_override = override_settings(
+                    MQTT_BROKER_HOST=broker.host, MQTT_BROKER_PORT=broker.port,
+                    MQTT_BROKER_USERNAME=None, MQTT_BROKER_PASSWORD=None,
+                    MQTT_PROTOCOL='3.1.1', MQTT_CLIENT_ID=None, MQTT_SINKS=[],
+                )
+                settings_override.enable()
+                service.setup_client()
+                if not service.connect():
+                    raise RuntimeError('Failed to connect to the fake broker')
+                deadline = time.monotonic() + 10
+                while not broker.subscribed(f'{BENCH_TOPIC_PREFIX}0'):
+                    if time.monotonic() > deadline:
+                        raise RuntimeError('Client did not subscribe to the benchmark topics')
+                    time.sleep(0.01)
+                publish = broker.publish
+            else:
+                settings_override = override_settings(MQTT_SINKS=[])
+                settings_override.enable()
+                service.topic_cache.warm()
+
+                def publish(topic, payload, qos):
+                    msg = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+                    msg.payload = payload
+                    msg.qos = qos
+                    service._on_message(None, None, msg)
+
+            queries.count = 0
+            payloads = [make_payload(seq, payload_size) for seq in range(messages)]
+            topic_names = [f'{BENCH_TOPIC_PREFIX}{i}' for i in range(topics)]
+            started = time.perf_counter()
+            for seq in range(messages):
+                if rate:
+                    delay = started + seq / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sent[seq] = time.perf_counter()
+                publish(topic_names[seq % topics], payloads[seq], qos)
+
+            done.wait(timeout)
+            elapsed = (last_received[0] or time.perf_counter()) - started
+        finally:
+            if mode == 'broker':
+                service.disconnect()
+            else:
+                if service.pipeline:
+                    service.pipeline.stop()
+                if service.sinks:
+                    service.sinks.stop()
+            if broker:
+                MqttConnection.objects.filter(broker_host=broker.host, broker_port=broker.port).delete()
+                broker.stop()
+            if settings_override:
+                settings_override.disable()
+
+    samples = [latency * 1000 for latency in latencies]
+    rss_after = rss_mb()
+    cleanup_benchmark_data()
+    return {
+        'mode': mode,
+        'messages': messages,
+        'received': len(latencies),
+        'payload_size': payload_size,
+        'topics': topics,
+        'qos': qos,
+        'rate': rate,
+        'msg_per_s': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': statistics.median(samples) if samples else 0.0,
+        'p99_ms': percentile(samples, 99),
+        'max_ms': max(samples) if samples else 0.0,
+        'queries_per_msg': queries.count / max(1, len(latencies)),
+        'rss_mb': rss_after,
+        'rss_delta_mb': rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+    }
+
+
+def run_ingest_suite(messages: int = 20000, payload_sizes: Iterable[int] = (64,), topic_counts: Iterable[int] = (10,),
+                     qos_levels: Iterable[int] = (0,), rate: float = 0, mode: str = 'direct',
+                     progress: Callable[[dict], None] = None) -> List[Dict[str, float]]:
+    """Run run_ingest_benchmark for every payload size / topic count / QoS combination"""
+    results = []
+    for payload_size, topics, qos in itertools.product(payload_sizes, topic_counts, qos_levels):
+        result = run_ingest_benchmark(messages, payload_size, topics, qos, rate, mode)
+        results.append(result)
+        if progress:
+            progress(result)
+    return results
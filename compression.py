@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_NONE = ''
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+
+COMPRESSION_CHOICES = [
+    (COMPRESSION_NONE, 'None'),
+    (COMPRESSION_ZLIB, 'zlib'),
+    (COMPRESSION_ZSTD, 'Zstandard'),
+]
+
+# zlib only looks back 32 KB, a longer preset dictionary is wasted
+ZLIB_MAX_DICTIONARY = 32 * 1024
+
+# Columns needed to read a stored payload back, for values() queries
+STORED_PAYLOAD_FIELDS = ('payload', 'payload_blob', 'payload_compression', 'payload_file', 'payload_dictionary_id')
+
+# Offloaded payloads live under <prefix>/<YYYY>/<MM>/<DD>/, the day directories are swept as a whole
+FILE_PREFIX = 'mqtt/payloads'
+
+
+def compress(data: bytes, method: str, dictionary: Optional[bytes] = None) -> bytes:
+    if method == COMPRESSION_ZSTD:
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=getattr(settings, 'MQTT_PAYLOAD_ZSTD_LEVEL', 3),
+                                        dict_data=zdict).compress(data)
+    if method == COMPRESSION_ZLIB:
+        level = getattr(settings, 'MQTT_PAYLOAD_ZLIB_LEVEL', 6)
+        if dictionary:
+            compressor = zlib.compressobj(level, zdict=dictionary)
+            return compressor.compress(data) + compressor.flush()
+        return zlib.compress(data, level)
+    return data
+
+
+def decompress(data: bytes, method: str, dictionary: Optional[bytes] = None) -> bytes:
+    if method == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('Payload is zstd compressed but the zstandard package is not installed')
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=zdict).decompress(data)
+    if method == COMPRESSION_ZLIB:
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary)
+            return decompressor.decompress(data) + decompressor.flush()
+        return zlib.decompress(data)
+    return data
+
+
+def train_dictionary(samples: List[bytes], method: str, size: int) -> bytes:
+    """Dictionary for ``method`` from sample payloads
+
+    zstd trains one with ``zstandard.train_dictionary``. zlib has no trainer,
+    its preset dictionary is the tail of the concatenated samples (newest
+    last), which holds the keys and structure the payloads repeat.
+    """
+    if method == COMPRESSION_ZSTD:
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    return b''.join(samples)[-min(size, ZLIB_MAX_DICTIONARY):]
+
+
+class PackedPayload:
+    """How one payload is stored: inline text, compressed blob or offloaded file"""
+    __slots__ = ('payload', 'blob', 'compression', 'file', 'dictionary_id')
+
+    def __init__(self, payload: str = '', blob: Optional[bytes] = None, compression: str = COMPRESSION_NONE,
+                 file: Optional[str] = None, dictionary_id: Optional[int] = None):
+        self.payload = payload
+        self.blob = blob
+        self.compression = compression
+        self.file = file
+        self.dictionary_id = dictionary_id
+
+
+class PayloadStore:
+    """Per-topic compression of stored payloads, with large ones offloaded to file storage
+
+    Topics with ``payload_compression`` store payloads of at least
+    MQTT_PAYLOAD_COMPRESS_MIN_SIZE bytes compressed in ``payload_blob``
+    (with the topic's newest MqttPayloadDictionary, if any) and leave
+    ``payload`` empty. Stored data larger than MQTT_PAYLOAD_OFFLOAD_SIZE
+    bytes, compressed or not, goes to the MQTT_PAYLOAD_STORAGE storage and
+    only its name is kept in ``payload_file``. Readers decompress on access
+    (``MqttMessage.payload_text``). Topic settings are loaded with one query
+    and reloaded like the codec registry.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'MQTT_CODEC_REFRESH_INTERVAL', 30)
+        self.refresh_interval = refresh_interval
+        self._topics: Dict[int, Tuple[str, Optional[int]]] = {}
+        self._dictionaries: Dict[int, bytes] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'compressed': 0,
+            'offloaded': 0,
+            'bytes_in': 0,
+            'bytes_stored': 0,
+        }
+
+    @property
+    def storage(self):
+        return storages[getattr(settings, 'MQTT_PAYLOAD_STORAGE', 'default')]
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def refresh(self):
+        from .models import MqttPayloadDictionary, MqttTopic
+
+        topics = dict(MqttTopic.objects.exclude(payload_compression=COMPRESSION_NONE)
+                      .values_list('id', 'payload_compression'))
+        if COMPRESSION_ZSTD in topics.values() and zstandard is None:
+            logger.error("Topics use zstd compression but the zstandard package is not installed, using zlib")
+        # Newest dictionary per topic and method
+        newest = {}
+        for dictionary_id, topic_id, method in MqttPayloadDictionary.objects.filter(
+            topic_id__in=list(topics)
+        ).order_by('id').values_list('id', 'topic_id', 'compression'):
+            newest[(topic_id, method)] = dictionary_id
+        settings_by_topic = {}
+        for topic_id, method in topics.items():
+            if method == COMPRESSION_ZSTD and zstandard is None:
+                method = COMPRESSION_ZLIB
+            settings_by_topic[topic_id] = (method, newest.get((topic_id, method)))
+        with self._lock:
+            self._topics = settings_by_topic
+            self._loaded_at = time.monotonic()
+
+    def compression_for(self, topic_id: int) -> Tuple[str, Optional[int]]:
+        """(method, dictionary id) used for new payloads of a topic"""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_interval:
+            self.refresh()
+        return self._topics.get(topic_id, (COMPRESSION_NONE, None))
+
+    def dictionary(self, dictionary_id: int) -> bytes:
+        data = self._dictionaries.get(dictionary_id)
+        if data is None:
+            from .models import MqttPayloadDictionary
+
+            data = bytes(MqttPayloadDictionary.objects.values_list('data', flat=True).get(pk=dictionary_id))
+            self._dictionaries[dictionary_id] = data
+        return data
+
+    def pack(self, topic_id: int, text: str, received_at: datetime) -> PackedPayload:
+        """Storage form of a decoded payload (runs on the ingest writer thread)"""
+        method, dictionary_id = self.compression_for(topic_id)
+        offload_size = getattr(settings, 'MQTT_PAYLOAD_OFFLOAD_SIZE', None)
+        if method == COMPRESSION_NONE and offload_size is None:
+            return PackedPayload(text)
+
+        # The thresholds are in bytes, multi-byte text is longer than its character count
+        data = text.encode('utf-8')
+        if method == COMPRESSION_NONE and len(data) <= offload_size:
+            return PackedPayload(text)
+        self.stats['bytes_in'] += len(data)
+        packed = PackedPayload(blob=data)
+        if method != COMPRESSION_NONE and len(data) >= getattr(settings, 'MQTT_PAYLOAD_COMPRESS_MIN_SIZE', 256):
+            dictionary = self.dictionary(dictionary_id) if dictionary_id else None
+            compressed = compress(data, method, dictionary)
+            # Incompressible payloads stay as they are
+            if len(compressed) < len(data):
+                packed = PackedPayload(blob=compressed, compression=method, dictionary_id=dictionary_id)
+
+        if offload_size is not None and len(packed.blob) > offload_size:
+            name = f'{FILE_PREFIX}/{received_at:%Y/%m/%d}/{topic_id}-{uuid.uuid4().hex}'
+            packed.file = self.storage.save(name, ContentFile(packed.blob))
+            packed.blob = None
+            self.stats['offloaded'] += 1
+        elif packed.compression == COMPRESSION_NONE:
+            # Below the offload size and not worth compressing: inline text
+            self.stats['bytes_stored'] += len(data)
+            return PackedPayload(text)
+        else:
+            self.stats['bytes_stored'] += len(packed.blob)
+        if packed.compression != COMPRESSION_NONE:
+            self.stats['compressed'] += 1
+        return packed
+
+    def unpack(self, payload: str, blob, compression: str, file: Optional[str],
+               dictionary_id: Optional[int]) -> str:
+        """Text of a stored payload from its columns"""
+        if file:
+            with self.storage.open(file, 'rb') as fh:
+                blob = fh.read()
+        elif blob is None:
+            return payload
+        dictionary = self.dictionary(dictionary_id) if dictionary_id else None
+        return decompress(bytes(blob), compression, dictionary).decode('utf-8')
+
+    def unpack_row(self, row: dict) -> str:
+        """Text of a stored payload from a values() row with STORED_PAYLOAD_FIELDS"""
+        return self.unpack(row['payload'], row['payload_blob'], row['payload_compression'], row['payload_file'],
+                           row['payload_dictionary_id'])
+
+    def sweep(self, before: datetime) -> int:
+        """Delete offloaded files no longer referenced by a message, in day directories before ``before``
+
+        Retention deletes rows with range deletes, so the files of deleted
+        messages are removed here instead of per row. Returns files deleted.
+        """
+        from .models import MqttMessage, MqttMessageArchive
+
+        storage = self.storage
+        deleted = 0
+        for directory in self._day_directories(storage):
+            day = datetime.strptime(directory[len(FILE_PREFIX) + 1:], '%Y/%m/%d').date()
+            if day >= before.date():
+                continue
+            _, files = storage.listdir(directory)
+            names = [f'{directory}/{name}' for name in files]
+            referenced = set()
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                for model in (MqttMessage, MqttMessageArchive):
+                    referenced.update(model.objects.filter(payload_file__in=chunk).values_list('payload_file', flat=True))
+            for name in names:
+                if name not in referenced:
+                    storage.delete(name)
+                    deleted += 1
+        return deleted
+
+    @staticmethod
+    def _day_directories(storage) -> Iterable[str]:
+        if not storage.exists(FILE_PREFIX):
+            return
+        for year in sorted(storage.listdir(FILE_PREFIX)[0]):
+            for month in sorted(storage.listdir(f'{FILE_PREFIX}/{year}')[0]):
+                for day in sorted(storage.listdir(f'{FILE_PREFIX}/{year}/{month}')[0]):
+                    yield f'{FILE_PREFIX}/{year}/{month}/{day}'
+
+
+# Global payload store
+payload_store = PayloadStore()
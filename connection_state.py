@@ -0,0 +1,101 @@
+import logging
+import threading
+from collections import deque
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import MqttConnection
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionStateWriter:
+    """Connection status kept in memory and written to MqttConnection in the background
+
+    Transitions update the in-memory record right away (``get_status``, the
+    status snapshot and ``/mqtt/brokers/`` read it from there) and are
+    persisted at most once per MQTT_CONNECTION_FLUSH_DELAY seconds, from a
+    timer thread, as an UPDATE of the changed columns only. A flapping link
+    costs one write per delay instead of one per transition, and the paho
+    network thread never waits for the database. Every transition is also
+    kept in a ring buffer of MQTT_CONNECTION_HISTORY_SIZE events.
+    """
+
+    def __init__(self, delay: Optional[float] = None, history_size: Optional[int] = None):
+        self.delay = delay if delay is not None else getattr(settings, 'MQTT_CONNECTION_FLUSH_DELAY', 2.0)
+        if history_size is None:
+            history_size = getattr(settings, 'MQTT_CONNECTION_HISTORY_SIZE', 100)
+        self.history = deque(maxlen=history_size)
+        self.stats = {
+            'transitions': 0,
+            'writes': 0,
+        }
+        self._record: Optional[MqttConnection] = None
+        self._dirty = set()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def transition(self, record: MqttConnection, event: str, **fields):
+        """Apply ``fields`` to ``record`` in memory, log ``event`` and schedule the write"""
+        if self._record is not None and record is not self._record:
+            # Another row (e.g. the broker changed), persist what is pending for the old one
+            self.flush()
+        with self._lock:
+            for name, value in fields.items():
+                setattr(record, name, value)
+            self._record = record
+            self._dirty.update(fields)
+            self.history.append({
+                'at': timezone.now().isoformat(),
+                'event': event,
+                'status': record.status,
+                'error': fields.get('last_error') or '',
+            })
+            self.stats['transitions'] += 1
+            flush_now = self.delay <= 0
+            if not flush_now and self._timer is None:
+                self._schedule()
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        """Write pending changes now (also called on disconnect so shutdown state is kept)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            record, dirty = self._record, self._dirty
+            self._dirty = set()
+            if record is None or not dirty:
+                return
+            values = {name: getattr(record, name) for name in dirty}
+        try:
+            MqttConnection.objects.filter(pk=record.pk).update(updated_at=timezone.now(), **values)
+            self.stats['writes'] += 1
+        except Exception as e:
+            logger.error(f"Error saving MQTT connection status: {e}")
+            with self._lock:
+                self._dirty.update(dirty)
+                if self.delay > 0 and self._timer is None:
+                    self._schedule()
+
+    def events(self) -> List[dict]:
+        """Connection events, oldest first"""
+        with self._lock:
+            return list(self.history)
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.delay, self._flush_in_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_in_timer(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            # Timer threads are not reused, do not leave their connection open
+            connection.close()
@@ -0,0 +1,146 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+from . import metrics
+from .models import MqttConnection
+from .mqtt_client import MqttClientService, mqtt_service
+
+logger = logging.getLogger(__name__)
+
+
+def _config(connection: MqttConnection) -> tuple:
+    return (connection.broker_host, connection.broker_port, connection.username, connection.password,
+            connection.client_id, connection.keepalive)
+
+
+class ConnectionManager:
+    """One MqttClientService per enabled MqttConnection row
+
+    The row matching MQTT_BROKER_HOST/PORT is served by the global
+    ``mqtt_service`` (which is also started when that row does not exist
+    yet). Every other row gets its own service, created on first use and
+    reused afterwards, with its own paho client, ingest pipelines, outbox and
+    connection status. Topics are subscribed on the brokers listed in
+    ``MqttTopic.connections``, or on every broker when the list is empty.
+    """
+
+    def __init__(self, default_service: Optional[MqttClientService] = None):
+        self.default_service = default_service or mqtt_service
+        self._services: Dict[int, MqttClientService] = {}
+        self._lock = threading.Lock()
+
+    def service_for(self, connection: Union[int, MqttConnection]) -> MqttClientService:
+        """Service for a connection row or id (raises MqttConnection.DoesNotExist)"""
+        if not isinstance(connection, MqttConnection):
+            connection = MqttConnection.objects.get(pk=connection)
+        if connection.is_default():
+            return self.default_service
+        with self._lock:
+            service = self._services.get(connection.pk)
+            if service is None:
+                service = self._services[connection.pk] = MqttClientService(broker=connection)
+            return service
+
+    def services(self) -> List[MqttClientService]:
+        """Default service first, then every broker service created so far"""
+        with self._lock:
+            return [self.default_service] + list(self._services.values())
+
+    def enabled_services(self, connection_ids: Optional[Iterable[int]] = None) -> List[MqttClientService]:
+        """Services for enabled rows (all, or only ``connection_ids``), including the default broker"""
+        rows = MqttConnection.objects.all()
+        if connection_ids is not None:
+            rows = rows.filter(pk__in=list(connection_ids))
+        services = []
+        default_seen = False
+        for row in rows:
+            if row.is_default():
+                if default_seen:
+                    continue
+                default_seen = True
+            if row.is_enabled:
+                service = self.service_for(row)
+                if service not in services:
+                    services.append(service)
+        if connection_ids is None and not default_seen:
+            services.insert(0, self.default_service)
+        return services
+
+    def start(self, connection_ids: Optional[Iterable[int]] = None) -> Dict[str, bool]:
+        """Connect every enabled broker that is not connected yet, returns label -> success"""
+        results = {}
+        for service in self.enabled_services(connection_ids):
+            if service.is_connected:
+                results[service.label] = True
+                continue
+            if not service.client:
+                service.setup_client()
+            results[service.label] = service.connect()
+        return results
+
+    def sync(self) -> Dict[str, bool]:
+        """Apply changed rows: stop disabled, removed or reconfigured brokers, start new ones"""
+        rows = {row.pk: row for row in MqttConnection.objects.all()}
+        with self._lock:
+            managed = list(self._services.items())
+        for pk, service in managed:
+            row = rows.get(pk)
+            if row is not None and row.is_enabled and _config(row) == _config(service.broker):
+                continue
+            logger.info(f"Stopping MQTT client for broker {service.label}")
+            service.disconnect()
+            with self._lock:
+                self._services.pop(pk, None)
+        return self.start()
+
+    def stop(self):
+        for service in self.services():
+            try:
+                service.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting MQTT client for broker {service.label}: {e}")
+
+    def status(self) -> List[dict]:
+        """Every configured broker with the live status of its service in this process"""
+        with self._lock:
+            services = dict(self._services)
+        brokers = []
+        for row in MqttConnection.objects.all():
+            service = self.default_service if row.is_default() else services.get(row.pk)
+            live = service is not None and service.connection_record is not None \
+                and service.connection_record.pk == row.pk
+            record = service.connection_record if live else row
+            brokers.append({
+                'id': row.pk,
+                'name': row.name,
+                'broker_host': row.broker_host,
+                'broker_port': row.broker_port,
+                'is_enabled': row.is_enabled,
+                'is_default': row.is_default(),
+                'is_connected': bool(live and service.is_connected),
+                'status': record.status,
+                'last_connected': record.last_connected.isoformat() if record.last_connected else None,
+                'last_error': record.last_error,
+                'last_recovery_seconds': service.last_recovery_seconds if live else None,
+                'history': service.connection_state.events() if live else [],
+                'queue_depth': sum(pipeline.depth for _, pipeline in service.pipelines()) if live else 0,
+            })
+        return brokers
+
+    def collect_metrics(self):
+        """Per-broker connection state, plus ingest queues of the non-default brokers"""
+        services = self.services()
+        yield ('mqtt_broker_connected', 'gauge', 'Whether the client for a broker is connected',
+               [(('broker',), (service.label,), int(service.is_connected)) for service in services])
+        pipelines = [item for service in services[1:] for item in service.pipelines()]
+        yield ('mqtt_ingest_queue_depth', 'gauge', 'Messages waiting in an ingest queue',
+               [(('pipeline',), (name,), pipeline.depth) for name, pipeline in pipelines])
+        yield ('mqtt_ingest_records_total', 'counter', 'Ingest queue records by outcome',
+               [(('pipeline', 'state'), (name, state), pipeline.stats[state])
+                for name, pipeline in pipelines for state in ('enqueued', 'written', 'dropped', 'spilled')])
+
+
+# Global connection manager
+connection_manager = ConnectionManager()
+metrics.registry.register_collector(connection_manager.collect_metrics)
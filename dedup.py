@@ -0,0 +1,121 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+
+# MQTT_DEDUP_KEY values
+DEDUP_KEY_PACKET = 'packet'
+DEDUP_KEY_PAYLOAD = 'payload'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for ``capacity`` keys at ``error_rate`` false positives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.size = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self.bits = bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes):
+        # Double hashing over two 64-bit halves of one digest
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def add(self, digest: bytes):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class MessageDeduplicator:
+    """Drops QoS 1/2 redeliveries before they are queued for the database
+
+    A redelivered PUBLISH carries the DUP flag and the same packet identifier
+    as the original, so with MQTT_DEDUP_KEY = 'packet' the key is topic +
+    payload hash + packet id and only DUP messages are dropped; every other
+    message is just remembered. Packet ids are 16 bit and wrap, so a repeated
+    reading can reuse the key of an earlier one and must not be dropped on
+    the key alone. With 'payload' the packet id is left out and any repeat
+    is dropped, which also catches publishers resending on their side, for
+    payloads that carry their own timestamp or sequence number. QoS 0
+    messages are never redelivered and are not checked.
+
+    Keys live in two Bloom filters of MQTT_DEDUP_CAPACITY keys each; the
+    older one is discarded every MQTT_DEDUP_WINDOW seconds, so a key is
+    remembered for one to two windows in fixed memory. A false positive
+    (at most MQTT_DEDUP_ERROR_RATE per generation) drops a genuine message.
+    """
+
+    def __init__(self, window: Optional[float] = None, capacity: Optional[int] = None,
+                 error_rate: Optional[float] = None, key: Optional[str] = None):
+        self.window = window if window is not None else getattr(settings, 'MQTT_DEDUP_WINDOW', 600)
+        self.capacity = capacity if capacity is not None else getattr(settings, 'MQTT_DEDUP_CAPACITY', 100000)
+        self.error_rate = error_rate if error_rate is not None else getattr(settings, 'MQTT_DEDUP_ERROR_RATE', 0.0001)
+        self.key = key if key is not None else getattr(settings, 'MQTT_DEDUP_KEY', DEDUP_KEY_PACKET)
+        self.hash_window = getattr(settings, 'MQTT_DEDUP_HASH_WINDOW', 3600)
+        self.stats = {
+            'checked': 0,
+            'duplicates': 0,
+        }
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._previous: Optional[BloomFilter] = None
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def digest(self, topic: str, payload: bytes, packet_id: int) -> bytes:
+        hasher = hashlib.blake2b(topic.encode('utf-8'), digest_size=16)
+        hasher.update(b'\0')
+        hasher.update(payload)
+        if self.key == DEDUP_KEY_PACKET:
+            hasher.update(packet_id.to_bytes(2, 'big'))
+        return hasher.digest()
+
+    def drops(self, dup: bool) -> bool:
+        """Whether a message with this DUP flag is dropped when its key was seen"""
+        return dup or self.key == DEDUP_KEY_PAYLOAD
+
+    def is_duplicate(self, topic: str, payload: bytes, qos: int, packet_id: int, dup: bool = False) -> bool:
+        """Whether the message is a redelivery seen within the window (remembers it otherwise)"""
+        if qos == 0:
+            return False
+        digest = self.digest(topic, payload, packet_id)
+        with self._lock:
+            now = time.monotonic()
+            # Also rotate when a generation is full, its false positive rate would climb past error_rate
+            if now - self._rotated_at >= self.window or self._current.count >= self.capacity:
+                self._previous, self._current = self._current, BloomFilter(self.capacity, self.error_rate)
+                self._rotated_at = now
+            self.stats['checked'] += 1
+            if self.drops(dup) and (digest in self._current
+                                    or (self._previous is not None and digest in self._previous)):
+                self.stats['duplicates'] += 1
+                return True
+            self._current.add(digest)
+        return False
+
+    def content_hash(self, topic: str, payload: bytes, packet_id: int, timestamp: datetime) -> str:
+        """Value for MqttMessage.content_hash, the same key plus the MQTT_DEDUP_HASH_WINDOW bucket of ``timestamp``
+
+        The unique column catches what the filter cannot, e.g. redeliveries
+        after a restart, when the in-memory filter starts empty. Like the
+        filter, a stored hash only drops messages that ``drops``.
+        """
+        bucket = int(timestamp.timestamp() // self.hash_window)
+        hasher = hashlib.sha256(self.digest(topic, payload, packet_id))
+        hasher.update(str(bucket).encode('ascii'))
+        return hasher.hexdigest()
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._current.bits) * 2
+
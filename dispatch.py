@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+
+from . import metrics
+from .topics import TopicTrie
+
+logger = logging.getLogger(__name__)
+
+
+class MessageHandler:
+    """A callback registered for one topic filter, with timing stats"""
+
+    def __init__(self, callback: Callable, topic_filter: str):
+        self.callback = callback
+        self.topic_filter = topic_filter
+        self.name = getattr(callback, '__qualname__', repr(callback))
+        self.calls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, items):
+        """Call the handler for each (topic, message), in order"""
+        for topic, message in items:
+            started = time.perf_counter()
+            failed = False
+            try:
+                self.callback(topic, message)
+            except Exception as e:
+                failed = True
+                logger.error(f"Error in message callback {self.name}: {e}")
+            elapsed = time.perf_counter() - started
+            metrics.callback_seconds.observe(elapsed, self.name)
+            with self._lock:
+                self.calls += 1
+                self.errors += failed
+                self.total_time += elapsed
+                self.max_time = max(self.max_time, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            'handler': self.name,
+            'topic_filter': self.topic_filter,
+            'calls': self.calls,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'avg_ms': self.total_time / self.calls * 1000 if self.calls else 0.0,
+            'max_ms': self.max_time * 1000,
+        }
+
+
+class MessageDispatcher:
+    """Route stored messages to callbacks registered per topic filter
+
+    Handlers are indexed in a TopicTrie, so finding the handlers for a topic
+    costs O(topic depth). Each handler gets one task per batch on a thread
+    pool (MQTT_CALLBACK_WORKERS threads, 0 runs them inline), which keeps
+    slow callbacks off the ingest writer thread. Order is kept within a batch;
+    handlers that are still busy with an earlier batch may run concurrently,
+    so callbacks must be thread-safe. Once MQTT_CALLBACK_QUEUE_SIZE messages
+    are pending, further messages are dropped and counted per handler.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        if max_workers is None:
+            max_workers = getattr(settings, 'MQTT_CALLBACK_WORKERS', 4)
+        if max_pending is None:
+            max_pending = getattr(settings, 'MQTT_CALLBACK_QUEUE_SIZE', 10000)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._trie = TopicTrie()
+        self._handlers: List[MessageHandler] = []
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+
+    def __len__(self):
+        return len(self._handlers)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def add(self, callback: Callable, topic_filter: str = '#') -> MessageHandler:
+        handler = MessageHandler(callback, topic_filter)
+        with self._lock:
+            self._handlers.append(handler)
+        self._trie.add(topic_filter, handler)
+        return handler
+
+    def remove(self, callback: Callable, topic_filter: Optional[str] = None) -> int:
+        """Remove handlers for callback (only for topic_filter if given), returns how many"""
+        with self._lock:
+            handlers = [handler for handler in self._handlers if handler.callback == callback
+                        and (topic_filter is None or handler.topic_filter == topic_filter)]
+            for handler in handlers:
+                self._handlers.remove(handler)
+        for handler in handlers:
+            self._trie.remove(handler.topic_filter, handler)
+        return len(handlers)
+
+    def dispatch(self, messages: list):
+        """Queue callbacks for stored messages (each has ``topic`` with ``name``)"""
+        if not self._handlers:
+            return
+
+        matches: Dict[str, list] = {}
+        work = defaultdict(list)
+        for message in messages:
+            name = message.topic.name
+            handlers = matches.get(name)
+            if handlers is None:
+                handlers = matches[name] = self._trie.match(name)
+            for handler in handlers:
+                work[handler].append((message.topic, message))
+
+        for handler, items in work.items():
+            if self.max_workers <= 0:
+                handler.run(items)
+                continue
+            with self._lock:
+                if self._pending + len(items) > self.max_pending:
+                    handler.dropped += len(items)
+                    continue
+                self._pending += len(items)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='mqtt-callback')
+                executor = self._executor
+            executor.submit(self._run, handler, items)
+
+    def _run(self, handler: MessageHandler, items):
+        try:
+            handler.run(items)
+        finally:
+            with self._lock:
+                self._pending -= len(items)
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            handlers = list(self._handlers)
+        return [handler.stats() for handler in handlers]
+
+    def shutdown(self, wait: bool = True):
+        """Finish queued callbacks and stop the pool (it is recreated on the next dispatch)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
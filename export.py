@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .compression import STORED_PAYLOAD_FIELDS, payload_store
+from .models import MqttMessage, MqttMessageArchive, MqttTopic
+from .topics import is_wildcard, topic_matches
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = (FORMAT_CSV, FORMAT_NDJSON)
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv',
+    FORMAT_NDJSON: 'application/x-ndjson',
+}
+
+COLUMNS = ('id', 'topic', 'payload', 'payload_encoding', 'qos', 'retain', 'timestamp', 'received_at')
+
+# Rows are encoded into chunks of about this many characters before they are yielded
+CHUNK_CHARS = 64 * 1024
+
+
+def parse_bound(value: str) -> datetime:
+    """ISO datetime or date (midnight) for ``since``/``until``, naive values in the current time zone
+
+    Raises ValueError when ``value`` is neither.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid datetime: {value}')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def resolve_topics(topic_filters: Iterable[str]) -> Dict[int, str]:
+    """Topic id -> name of the topics matching any filter (MQTT wildcards allowed)"""
+    topic_filters = list(topic_filters)
+    exact = [topic_filter for topic_filter in topic_filters if not is_wildcard(topic_filter)]
+    patterns = [topic_filter for topic_filter in topic_filters if is_wildcard(topic_filter)]
+    topics = dict(MqttTopic.objects.filter(name__in=exact).values_list('id', 'name')) if exact else {}
+    if patterns:
+        for topic_id, name in MqttTopic.objects.values_list('id', 'name').iterator():
+            if any(topic_matches(pattern, name) for pattern in patterns):
+                topics[topic_id] = name
+    return topics
+
+
+def export_rows(topics: Dict[int, str], since: Optional[datetime] = None, until: Optional[datetime] = None,
+                archive: bool = False, chunk_size: Optional[int] = None) -> Iterator[dict]:
+    """Messages of ``topics`` received in [since, until), oldest first, as dicts of COLUMNS
+
+    Rows come from ``.iterator(chunk_size)``, a server-side cursor on
+    PostgreSQL, so memory does not grow with the number of rows. Payloads
+    are decompressed (or read from storage) one row at a time.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MQTT_EXPORT_CHUNK_SIZE', 2000)
+    model = MqttMessageArchive if archive else MqttMessage
+    messages = model.objects.filter(topic_id__in=list(topics))
+    if since is not None:
+        messages = messages.filter(received_at__gte=since)
+    if until is not None:
+        messages = messages.filter(received_at__lt=until)
+    rows = messages.order_by('received_at', 'id').values_list(
+        'id', 'topic_id', 'payload_encoding', 'qos', 'retain', 'timestamp', 'received_at', *STORED_PAYLOAD_FIELDS
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        message_id, topic_id, encoding, qos, retain, timestamp, received_at = row[:7]
+        yield {
+            'id': message_id,
+            'topic': topics[topic_id],
+            'payload': payload_store.unpack(*row[7:]),
+            'payload_encoding': encoding,
+            'qos': qos,
+            'retain': retain,
+            'timestamp': timestamp.isoformat(),
+            'received_at': received_at.isoformat(),
+        }
+
+
+def _encode_csv(rows: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow([row[column] for column in COLUMNS])
+        if buffer.tell() >= CHUNK_CHARS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _encode_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    lines: List[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_CHARS:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    yield ''.join(lines)
+
+
+def encode(rows: Iterable[dict], export_format: str, gzip: bool = False) -> Iterator[bytes]:
+    """Encoded chunks of ``rows`` in ``export_format``, optionally as one gzip stream"""
+    chunks = _encode_csv(rows) if export_format == FORMAT_CSV else _encode_ndjson(rows)
+    if not gzip:
+        for chunk in chunks:
+            if chunk:
+                yield chunk.encode('utf-8')
+        return
+    # wbits 31 writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def aiterate(chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+    """Async iterator over blocking ``chunks``, fetching one chunk at a time in the sync thread
+
+    Django consumes a sync iterator under ASGI by reading it into a list
+    first, which would hold the whole export in memory.
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            chunk = await sync_to_async(next, thread_sensitive=True)(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            # Releases the server-side cursor when the client goes away
+            await sync_to_async(close, thread_sensitive=True)()
@@ -0,0 +1,288 @@
+import logging
+import socket
+import struct
+import threading
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+from .topics import topic_matches
+
+logger = logging.getLogger(__name__)
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def encode_length(length: int) -> bytes:
+    """MQTT variable length encoding of the remaining length"""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def packet(packet_type: int, body: bytes = b'', flags: int = 0) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + encode_length(len(body)) + body
+
+
+class BrokerSession:
+    """One connected client"""
+
+    def __init__(self, broker: 'FakeBroker', sock: socket.socket):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ''
+        self.clean_session = True
+        self.subscriptions: Dict[str, int] = {}
+        self._write_lock = threading.Lock()
+        self._packet_ids = count(1)
+
+    def send(self, data: bytes):
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool = False):
+        """Send a PUBLISH to this client"""
+        body = encode_string(topic)
+        if qos:
+            body += struct.pack('!H', next(self._packet_ids) % 65535 + 1)
+        self.send(packet(PUBLISH, body + payload, (qos << 1) | int(retain)))
+
+    def granted_qos(self, topic: str) -> Optional[int]:
+        granted = [qos for topic_filter, qos in list(self.subscriptions.items()) if topic_matches(topic_filter, topic)]
+        return max(granted) if granted else None
+
+    def _read_exact(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('client closed the connection')
+            data.extend(chunk)
+        return bytes(data)
+
+    def _read_packet(self) -> Tuple[int, int, bytes]:
+        header = self._read_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header >> 4, header & 0x0F, self._read_exact(length) if length else b''
+
+    def serve(self):
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type == DISCONNECT:
+                    break
+                self.handle(packet_type, flags, body)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.remove_session(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def handle(self, packet_type: int, flags: int, body: bytes):
+        if packet_type == CONNECT:
+            name_length = struct.unpack('!H', body[:2])[0]
+            offset = 2 + name_length + 4
+            connect_flags = body[2 + name_length + 1]
+            id_length = struct.unpack('!H', body[offset:offset + 2])[0]
+            self.client_id = body[offset + 2:offset + 2 + id_length].decode('utf-8')
+            self.clean_session = bool(connect_flags & 0x02)
+            session_present = self.broker.resume_session(self)
+            self.send(packet(CONNACK, bytes([int(session_present), 0])))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic_length = struct.unpack('!H', body[:2])[0]
+            topic = body[2:2 + topic_length].decode('utf-8')
+            offset = 2 + topic_length
+            packet_id = body[offset:offset + 2]
+            if qos:
+                offset += 2
+            self.broker.publish(topic, body[offset:], qos, bool(flags & 0x01))
+            if qos == 1:
+                self.send(packet(PUBACK, packet_id))
+            elif qos == 2:
+                self.send(packet(PUBREC, packet_id))
+        elif packet_type == PUBREL:
+            self.send(packet(PUBCOMP, body[:2]))
+        elif packet_type == PUBREC:
+            self.send(packet(PUBREL, body[:2], 0x02))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, []
+            new_filters = []
+            self.broker.subscribe_packets += 1
+            while offset < len(body):
+                length = struct.unpack('!H', body[offset:offset + 2])[0]
+                topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+                qos = min(body[offset + 2 + length] & 0x03, 2)
+                offset += 3 + length
+                self.subscriptions[topic_filter] = qos
+                new_filters.append(topic_filter)
+                granted.append(qos)
+            self.send(packet(SUBACK, packet_id + bytes(granted)))
+            self.broker.send_retained(self, new_filters)
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                length = struct.unpack('!H', body[offset:offset + 2])[0]
+                self.subscriptions.pop(body[offset + 2:offset + 2 + length].decode('utf-8'), None)
+                offset += 2 + length
+            self.send(packet(UNSUBACK, body[:2]))
+        elif packet_type == PINGREQ:
+            self.send(packet(PINGRESP))
+        # PUBACK and PUBCOMP from subscribers need no reply
+
+
+class FakeBroker:
+    """Minimal in-process MQTT 3.1.1 broker for benchmarks and local testing
+
+    Supports CONNECT, PUBLISH (QoS 0-2, retained messages), SUBSCRIBE with
+    ``+``/``#`` wildcards, UNSUBSCRIBE and PINGREQ. Subscriptions of clients
+    connecting with clean session off are kept and resumed (session present)
+    when the same client id reconnects, including after ``stop``/``start``;
+    messages are not queued for offline clients. There is no authentication or
+    in-flight limit. ``publish`` can be called directly to inject messages
+    without a second client.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self._server: Optional[socket.socket] = None
+        self._sessions: List[BrokerSession] = []
+        self._retained: Dict[str, Tuple[bytes, int]] = {}
+        # client id -> subscriptions of disconnected clean_session=0 clients
+        self._stored_sessions: Dict[str, Dict[str, int]] = {}
+        self.subscribe_packets = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self.published = 0
+
+    def start(self) -> 'FakeBroker':
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(16)
+        self.port = self._server.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept, name='mqtt-fake-broker', daemon=True).start()
+        logger.info(f"Fake MQTT broker listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._server:
+            try:
+                # Wakes the accept thread, otherwise it keeps the port bound
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            self._server = None
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    def subscribed(self, topic: str) -> bool:
+        """Whether any connected client would receive ``topic``"""
+        with self._lock:
+            sessions = list(self._sessions)
+        return any(session.granted_qos(topic) is not None for session in sessions)
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        """Route a message to every matching subscriber"""
+        if retain:
+            with self._lock:
+                if payload:
+                    self._retained[topic] = (payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            granted = session.granted_qos(topic)
+            if granted is None:
+                continue
+            try:
+                session.deliver(topic, payload, min(qos, granted))
+            except OSError:
+                pass
+        self.published += 1
+
+    def send_retained(self, session: BrokerSession, topic_filters: List[str]):
+        with self._lock:
+            retained = list(self._retained.items())
+        for topic, (payload, qos) in retained:
+            granted = [session.subscriptions[topic_filter] for topic_filter in topic_filters
+                       if topic_matches(topic_filter, topic)]
+            if granted:
+                session.deliver(topic, payload, min(qos, max(granted)), retain=True)
+
+    def resume_session(self, session: BrokerSession) -> bool:
+        """Restore stored subscriptions on CONNECT, returns the session present flag"""
+        with self._lock:
+            stored = self._stored_sessions.pop(session.client_id, None)
+        if session.clean_session or stored is None:
+            return False
+        session.subscriptions.update(stored)
+        return True
+
+    def remove_session(self, session: BrokerSession):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            if not session.clean_session and session.client_id:
+                self._stored_sessions[session.client_id] = dict(session.subscriptions)
+
+    def _accept(self):
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = BrokerSession(self, sock)
+            with self._lock:
+                self._sessions.append(session)
+            threading.Thread(target=session.serve, name='mqtt-fake-broker-session', daemon=True).start()
@@ -0,0 +1,227 @@
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_DROP_OLDEST = 'drop_oldest'
+BACKPRESSURE_SPILL = 'spill'
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_SPILL)
+
+
+class IngestRecord:
+    """Raw MQTT message waiting to be persisted"""
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'timestamp', 'packet_id', 'dup')
+
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool, timestamp: datetime,
+                 packet_id: int = 0, dup: bool = False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.timestamp = timestamp
+        # MQTT packet identifier (0 for QoS 0), kept by redeliveries
+        self.packet_id = packet_id
+        # DUP flag, set on redeliveries
+        self.dup = dup
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'topic': self.topic,
+            'payload': base64.b64encode(self.payload).decode('ascii'),
+            'qos': self.qos,
+            'retain': self.retain,
+            'timestamp': self.timestamp.isoformat(),
+            'packet_id': self.packet_id,
+            'dup': self.dup,
+        })
+
+    @classmethod
+    def from_json(cls, line: str) -> 'IngestRecord':
+        data = json.loads(line)
+        return cls(
+            topic=data['topic'],
+            payload=base64.b64decode(data['payload']),
+            qos=data['qos'],
+            retain=data['retain'],
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            packet_id=data.get('packet_id', 0),
+            dup=data.get('dup', False),
+        )
+
+
+class IngestPipeline:
+    """Bounded queue drained by a writer thread in size- or time-triggered batches
+
+    The network thread only calls ``submit``; ``handler`` receives a list of
+    ``IngestRecord`` on the writer thread and is responsible for persistence.
+    """
+
+    def __init__(self, handler: Callable[[List[IngestRecord]], None], batch_size: int = 500,
+                 flush_interval: float = 1.0, max_queue_size: int = 10000,
+                 backpressure: str = BACKPRESSURE_BLOCK, spill_dir: Optional[str] = None,
+                 name: str = 'ingest'):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+
+        self.handler = handler
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue_size = max(self.batch_size, max_queue_size)
+        self.backpressure = backpressure
+        self.name = name
+        self.spill_path = os.path.join(spill_dir or tempfile.gettempdir(), f'mqtt-{name}.spill.jsonl')
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._spill_lock = threading.Lock()
+        self._has_spill = os.path.exists(self.spill_path)
+
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'failed_batches': 0,
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """Start the writer thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=f'mqtt-{self.name}-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the writer thread after flushing everything still queued"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, record: IngestRecord, block: bool = True) -> bool:
+        """Enqueue a record, applying the backpressure policy when the queue is full
+
+        With ``block=False`` (callers on an event loop) the block policy
+        spills instead of waiting for room.
+        """
+        with self._cond:
+            if len(self._queue) >= self.max_queue_size:
+                if self.backpressure == BACKPRESSURE_BLOCK and block:
+                    while len(self._queue) >= self.max_queue_size and self._running:
+                        self._cond.wait()
+                elif self.backpressure == BACKPRESSURE_DROP_OLDEST:
+                    self._queue.popleft()
+                    self.stats['dropped'] += 1
+                else:
+                    self._spill(record)
+                    return False
+
+            self._queue.append(record)
+            self.stats['enqueued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _spill(self, record: IngestRecord):
+        """Append a record to the on-disk overflow file"""
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, 'a', encoding='utf-8') as fh:
+                    fh.write(record.to_json() + '\n')
+                self._has_spill = True
+            self.stats['spilled'] += 1
+        except OSError as e:
+            self.stats['dropped'] += 1
+            logger.error(f"Failed to spill MQTT message to {self.spill_path}: {e}")
+
+    def _take_batch(self) -> List[IngestRecord]:
+        """Wait until a batch is due and pop it from the queue"""
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while self._running and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            if batch:
+                self._cond.notify_all()
+            return batch
+
+    def _write(self, batch: List[IngestRecord]):
+        try:
+            with metrics.batch_flush_seconds.time(self.name):
+                self.handler(batch)
+            metrics.batch_size.observe(len(batch), self.name)
+            self.stats['written'] += len(batch)
+        except Exception as e:
+            self.stats['failed_batches'] += 1
+            logger.error(f"Error writing batch of {len(batch)} MQTT messages: {e}")
+
+    def _replay_spill(self):
+        """Feed spilled records back through the handler once the queue has room"""
+        replay_path = self.spill_path + '.replay'
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                self._has_spill = False
+                return
+            os.replace(self.spill_path, replay_path)
+            self._has_spill = False
+
+        batch = []
+        with open(replay_path, encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    batch.append(IngestRecord.from_json(line))
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Skipping corrupt spilled MQTT message: {e}")
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+        os.remove(replay_path)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif not self._running:
+                break
+
+            if self._running and self._has_spill and self.depth < self.max_queue_size // 2:
+                try:
+                    self._replay_spill()
+                except OSError as e:
+                    logger.error(f"Failed to replay spilled MQTT messages: {e}")
@@ -0,0 +1,126 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'mqtt:lv:'
+
+
+class LastValueCache:
+    """Latest message of every topic, kept by the ingest path
+
+    Entries are held in this process and mirrored to the Django cache
+    MQTT_LAST_VALUE_CACHE, one key per topic written with one ``set_many``
+    per batch. The default local-memory cache is the stand-in for a single
+    process; point the alias at a shared backend (Redis, Memcached) so web
+    processes read what the ``mqtt_client`` process stored. Payloads longer
+    than MQTT_LAST_VALUE_MAX_SIZE characters are truncated.
+
+    Retained messages replayed by the broker on subscribe (``retain`` set)
+    can be older than what was received live, so they only fill a topic
+    without a value or replace another replayed value. Live messages always
+    win.
+    """
+
+    def __init__(self, alias: Optional[str] = None, timeout: Optional[float] = None,
+                 max_size: Optional[int] = None):
+        self.alias = alias if alias is not None else getattr(settings, 'MQTT_LAST_VALUE_CACHE', 'default')
+        self.timeout = timeout if timeout is not None else getattr(settings, 'MQTT_LAST_VALUE_TIMEOUT', None)
+        self.max_size = max_size if max_size is not None else getattr(settings, 'MQTT_LAST_VALUE_MAX_SIZE', 65536)
+        self._values: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'updates': 0,
+            'retained_skipped': 0,
+        }
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def __len__(self):
+        return len(self._values)
+
+    def update(self, entries: Iterable[dict]):
+        """Store the entries of one ingest batch (oldest first), see ``entry``"""
+        latest = {}
+        for entry in entries:
+            previous = latest.get(entry['topic_id'])
+            if entry['retain'] and previous is not None and not previous['retain']:
+                self.stats['retained_skipped'] += 1
+                continue
+            latest[entry['topic_id']] = entry
+        if not latest:
+            return
+
+        retained = [topic_id for topic_id, entry in latest.items() if entry['retain']]
+        if retained:
+            current = self.get_many(retained)
+            for topic_id in retained:
+                existing = current.get(topic_id)
+                if existing is not None and not existing['retain']:
+                    del latest[topic_id]
+                    self.stats['retained_skipped'] += 1
+        if not latest:
+            return
+
+        with self._lock:
+            self._values.update(latest)
+        self.stats['updates'] += len(latest)
+        try:
+            self.cache.set_many({KEY_PREFIX + str(topic_id): entry for topic_id, entry in latest.items()},
+                                self.timeout)
+        except Exception as e:
+            logger.error(f"Error caching MQTT last values: {e}")
+
+    def entry(self, topic_id: int, topic: str, payload: str, encoding: str, qos: int, retain: bool,
+              timestamp, received_at) -> dict:
+        truncated = len(payload) > self.max_size
+        return {
+            'topic_id': topic_id,
+            'topic': topic,
+            'payload': payload[:self.max_size] if truncated else payload,
+            'payload_encoding': encoding,
+            'truncated': truncated,
+            'qos': qos,
+            'retain': retain,
+            'timestamp': timestamp.isoformat(),
+            'received_at': received_at.isoformat(),
+        }
+
+    def get(self, topic_id: int) -> Optional[dict]:
+        return self.get_many([topic_id]).get(topic_id)
+
+    def get_many(self, topic_ids: Iterable[int]) -> Dict[int, dict]:
+        """Entries by topic id; values held in this process first, the shared cache for the rest"""
+        topic_ids = list(topic_ids)
+        with self._lock:
+            found = {topic_id: self._values[topic_id] for topic_id in topic_ids if topic_id in self._values}
+        missing = [topic_id for topic_id in topic_ids if topic_id not in found]
+        if missing:
+            try:
+                cached = self.cache.get_many([KEY_PREFIX + str(topic_id) for topic_id in missing])
+            except Exception as e:
+                logger.error(f"Error reading MQTT last values: {e}")
+                cached = {}
+            for key, entry in cached.items():
+                found[int(key[len(KEY_PREFIX):])] = entry
+        return found
+
+    def forget(self, topic_ids: List[int]):
+        """Drop entries of deleted topics"""
+        with self._lock:
+            for topic_id in topic_ids:
+                self._values.pop(topic_id, None)
+        try:
+            self.cache.delete_many([KEY_PREFIX + str(topic_id) for topic_id in topic_ids])
+        except Exception as e:
+            logger.error(f"Error deleting MQTT last values: {e}")
+
+
+# Global last value cache
+last_value_cache = LastValueCache()
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.mqtt.archive import archive_messages
+from apps.mqtt.models import MqttTopic
+
+
+class Command(BaseCommand):
+    help = 'Move old MQTT messages into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=float,
+            required=True,
+            help='Archive messages received more than this many days ago'
+        )
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            help='Only archive this topic name (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Messages moved per transaction'
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['older_than_days'])
+
+        topic_ids = None
+        if options['topic']:
+            topic_ids = list(
+                MqttTopic.objects.filter(name__in=options['topic']).values_list('id', flat=True)
+            )
+
+        archived = archive_messages(before, topic_ids=topic_ids, batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {archived} messages received before {before.isoformat()}')
+        )
@@ -0,0 +1,143 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.mqtt.benchmark import (
+    cleanup_benchmark_data, run_ingest_suite, run_query_benchmark, seed_messages, BENCH_TOPIC_PREFIX
+)
+from apps.mqtt.models import MqttTopic
+
+
+class Command(BaseCommand):
+    help = 'Benchmark MQTT message read paths or the ingest path against synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            choices=['query', 'ingest'],
+            default='query',
+            help='query: read paths over seeded data, ingest: MqttClientService message ingest'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000000,
+            help='Number of synthetic messages to insert'
+        )
+        parser.add_argument(
+            '--topics',
+            type=int,
+            default=100,
+            help='Number of synthetic topics'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Repetitions per query'
+        )
+        parser.add_argument(
+            '--reuse',
+            action='store_true',
+            help='Reuse benchmark data from a previous run instead of seeding'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep benchmark data after the run'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['direct', 'broker'],
+            default='direct',
+            help='Ingest suite: call _on_message directly or go through connect() and an in-process broker'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=20000,
+            help='Ingest suite: messages per scenario'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='Ingest suite: target messages per second (0 = as fast as possible)'
+        )
+        parser.add_argument(
+            '--payload-sizes',
+            type=str,
+            default='64,1024',
+            help='Ingest suite: comma separated payload sizes in bytes'
+        )
+        parser.add_argument(
+            '--topic-counts',
+            type=str,
+            default='10,1000',
+            help='Ingest suite: comma separated topic cardinalities'
+        )
+        parser.add_argument(
+            '--qos',
+            type=str,
+            default='0,1',
+            help='Ingest suite: comma separated QoS levels'
+        )
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'ingest':
+            self.run_ingest(options)
+            return
+
+        if options['reuse']:
+            topic_ids = list(
+                MqttTopic.objects.filter(name__startswith=BENCH_TOPIC_PREFIX).values_list('id', flat=True)
+            )
+            if not topic_ids:
+                self.stdout.write(self.style.ERROR('No benchmark data found, run without --reuse first'))
+                return
+        else:
+            cleanup_benchmark_data()
+            self.stdout.write(f'Seeding {options["rows"]} messages over {options["topics"]} topics...')
+            started = time.perf_counter()
+            topic_ids = seed_messages(
+                options['rows'],
+                options['topics'],
+                progress=lambda n: self.stdout.write(f'  {n} rows', ending='\r'),
+            )
+            self.stdout.write(f'\nSeeded in {time.perf_counter() - started:.1f}s')
+
+        try:
+            results = run_query_benchmark(topic_ids, repeat=options['repeat'])
+            self.stdout.write(f'{"query":<24}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+            for name, timing in results.items():
+                self.stdout.write(f'{name:<24}{timing["p50"]:>10.2f}{timing["p99"]:>10.2f}{timing["max"]:>10.2f}')
+        finally:
+            if not options['keep']:
+                cleanup_benchmark_data()
+
+    def run_ingest(self, options):
+        """Run the ingest scenarios and print one row per scenario"""
+        def parse(value):
+            return [int(item) for item in value.split(',') if item]
+
+        self.stdout.write(
+            f'{"payload":>8}{"topics":>8}{"qos":>5}{"msg/s":>10}{"p50 ms":>10}{"p99 ms":>10}'
+            f'{"queries/msg":>13}{"rss MB":>9}{"lost":>7}'
+        )
+
+        def write_row(result):
+            rss = f'{result["rss_mb"]:.0f}' if result['rss_mb'] is not None else '-'
+            self.stdout.write(
+                f'{result["payload_size"]:>8}{result["topics"]:>8}{result["qos"]:>5}{result["msg_per_s"]:>10.0f}'
+                f'{result["p50_ms"]:>10.2f}{result["p99_ms"]:>10.2f}{result["queries_per_msg"]:>13.4f}'
+                f'{rss:>9}{result["messages"] - result["received"]:>7}'
+            )
+
+        run_ingest_suite(
+            messages=options['messages'],
+            payload_sizes=parse(options['payload_sizes']),
+            topic_counts=parse(options['topic_counts']),
+            qos_levels=parse(options['qos']),
+            rate=options['rate'],
+            mode=options['mode'],
+            progress=write_row,
+        )
@@ -1,9 +1,14 @@
+import asyncio
 import time
 import signal
 import sys
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from apps.mqtt.async_engine import ENGINE_ASYNCIO, ENGINE_THREAD, AsyncMqttEngine, get_engine
+from apps.mqtt.connections import connection_manager
+from apps.mqtt.metrics import start_metrics_server
 from apps.mqtt.mqtt_client import mqtt_service
+from apps.mqtt.workers import SHARDING_HASH, SHARDING_SHARED, WorkerSupervisor, apply_broker_options
 
 
 class Command(BaseCommand):
@@ -43,6 +48,48 @@ class Command(BaseCommand):
             action='store_true',
             help='Automatically subscribe to all active topics in database'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'MQTT_WORKERS', 1),
+            help='Number of client processes, messages are sharded between them'
+        )
+        parser.add_argument(
+            '--sharding',
+            choices=[SHARDING_SHARED, SHARDING_HASH],
+            default=SHARDING_SHARED if getattr(settings, 'MQTT_PROTOCOL', '3.1.1') == '5' else SHARDING_HASH,
+            help='shared: MQTT v5 $share subscriptions, hash: split topics between workers (v3 brokers)'
+        )
+        parser.add_argument(
+            '--share-group',
+            type=str,
+            default=getattr(settings, 'MQTT_SHARED_SUBSCRIPTION_GROUP', 'mqtt-ingest'),
+            help='Shared subscription group name'
+        )
+        parser.add_argument(
+            '--engine',
+            choices=[ENGINE_THREAD, ENGINE_ASYNCIO],
+            default=getattr(settings, 'MQTT_ENGINE', ENGINE_THREAD),
+            help='thread: paho network thread, asyncio: socket I/O on an asyncio event loop'
+        )
+        parser.add_argument(
+            '--all-brokers',
+            action='store_true',
+            help='Run one client per enabled MQTT Connection record'
+        )
+        parser.add_argument(
+            '--broker',
+            type=int,
+            action='append',
+            dest='brokers',
+            help='MQTT Connection id to run a client for (repeatable)'
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=getattr(settings, 'MQTT_METRICS_PORT', None),
+            help='Serve this process\'s Prometheus metrics on this port (workers use port + worker index)'
+        )
     
     def handle(self, *args, **options):
         # Setup signal handlers for graceful shutdown
@@ -54,14 +101,31 @@ class Command(BaseCommand):
         )
         
         # Override settings if provided
-        if options['host']:
-            settings.MQTT_BROKER_HOST = options['host']
-        if options['port']:
-            settings.MQTT_BROKER_PORT = options['port']
-        if options['username']:
-            settings.MQTT_BROKER_USERNAME = options['username']
-        if options['password']:
-            settings.MQTT_BROKER_PASSWORD = options['password']
+        apply_broker_options(options)
+        
+        multi_broker = options['all_brokers'] or bool(options['brokers'])
+        if multi_broker and options['workers'] > 1:
+            self.stdout.write(
+                self.style.ERROR('--all-brokers/--broker cannot be combined with --workers')
+            )
+            sys.exit(1)
+        
+        if options['workers'] > 1:
+            self.run_workers(options)
+            return
+        
+        if options['metrics_port'] and getattr(settings, 'MQTT_METRICS_ENABLED', True):
+            start_metrics_server(options['metrics_port'], getattr(settings, 'MQTT_METRICS_HOST', ''))
+        
+        if options['engine'] == ENGINE_ASYNCIO:
+            # Broker records are read here, the database is not used from the event loop
+            services = connection_manager.enabled_services(options['brokers']) if multi_broker else None
+            asyncio.run(self.run_async(options, services))
+            return
+        
+        if multi_broker:
+            self.run_brokers(options)
+            return
         
         try:
             # Setup and connect MQTT client
@@ -101,6 +165,112 @@ class Command(BaseCommand):
         finally:
             self.cleanup()
     
+    async def run_async(self, options, services=None):
+        """Run the client (or one client per broker in ``services``) on an asyncio loop until SIGINT/SIGTERM"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        
+        engine = AsyncMqttEngine(services) if services is not None else get_engine()
+        if not engine.services:
+            self.stdout.write(self.style.ERROR('No enabled MQTT brokers to run'))
+            return
+        if not all(await engine.start()):
+            self.stdout.write(
+                self.style.ERROR('Failed to connect to MQTT broker, retrying in the background')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Connecting to MQTT broker at {options["host"]}:{options["port"]} (asyncio engine)'
+                )
+            )
+        # Active topics are subscribed on every CONNACK
+        self.stdout.write('MQTT client is running. Press Ctrl+C to stop.')
+        
+        try:
+            await stop.wait()
+        finally:
+            self.stdout.write('Shutting down MQTT client...')
+            await engine.stop()
+            self.stdout.write(
+                self.style.SUCCESS('MQTT client stopped successfully')
+            )
+    
+    def run_brokers(self, options):
+        """Run one client per broker, picking up MQTT Connection changes periodically"""
+        sync_interval = getattr(settings, 'MQTT_BROKER_SYNC_INTERVAL', 30)
+        try:
+            results = connection_manager.start(options['brokers'])
+            if not results:
+                self.stdout.write(self.style.ERROR('No enabled MQTT brokers to run'))
+                sys.exit(1)
+            for label, success in results.items():
+                if success:
+                    self.stdout.write(self.style.SUCCESS(f'Connected to MQTT broker {label}'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Failed to connect to MQTT broker {label}'))
+            
+            self.stdout.write('MQTT clients are running. Press Ctrl+C to stop.')
+            synced_at = time.monotonic()
+            while self.running:
+                time.sleep(1)
+                # --broker pins the set of brokers, --all-brokers follows the table
+                if options['all_brokers'] and sync_interval and time.monotonic() - synced_at >= sync_interval:
+                    connection_manager.sync()
+                    synced_at = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('\nReceived interrupt signal')
+        finally:
+            self.stdout.write('Shutting down MQTT clients...')
+            connection_manager.stop()
+            self.stdout.write(
+                self.style.SUCCESS('MQTT clients stopped successfully')
+            )
+    
+    def run_workers(self, options):
+        """Run a supervised pool of sharded client processes"""
+        supervisor = WorkerSupervisor(
+            options['workers'],
+            sharding=options['sharding'],
+            share_group=options['share_group'],
+            options={key: options[key] for key in ('host', 'port', 'username', 'password', 'metrics_port')},
+        )
+        supervisor.start()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Started {options["workers"]} MQTT workers ({options["sharding"]} sharding) '
+                f'for {options["host"]}:{options["port"]}'
+            )
+        )
+        self.stdout.write('MQTT workers are running. Press Ctrl+C to stop.')
+        try:
+            supervisor.run(lambda: not self.running, on_health=self.write_health)
+        finally:
+            self.stdout.write('Stopping MQTT workers...')
+            supervisor.stop()
+            self.write_health(supervisor.health())
+            self.stdout.write(
+                self.style.SUCCESS('MQTT workers stopped successfully')
+            )
+    
+    def write_health(self, health):
+        """Print aggregated worker health"""
+        totals = health['totals']
+        self.stdout.write(
+            f'workers alive={health["alive"]}/{len(health["workers"])} connected={health["connected"]} '
+            f'written={totals["written"]} queued={totals["depth"]} dropped={totals["dropped"]} '
+            f'spilled={totals["spilled"]} failed_batches={totals["failed_batches"]}'
+        )
+        for worker in health['workers']:
+            if not worker['alive'] or worker['restarts']:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'  worker {worker["index"]}: alive={worker["alive"]} restarts={worker["restarts"]}'
+                    )
+                )
+    
     def signal_handler(self, signum, frame):
         """Handle shutdown signals"""
         self.stdout.write(f'\nReceived signal {signum}')
@@ -0,0 +1,90 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.mqtt.export import FORMAT_CSV, FORMATS, encode, export_rows, parse_bound, resolve_topics
+
+
+class Command(BaseCommand):
+    help = 'Export stored MQTT messages of topics as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            required=True,
+            help='Topic name or filter with + / # wildcards (can be repeated)'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only messages received at or after this ISO datetime or date'
+        )
+        parser.add_argument(
+            '--until',
+            type=str,
+            help='Only messages received before this ISO datetime or date'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default=FORMAT_CSV,
+            help='Output format'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip'
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help='Export from the archive table instead of MqttMessage'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows fetched per database round trip'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='-',
+            help='Output file (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_bound(options['since']) if options['since'] else None
+            until = parse_bound(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        topics = resolve_topics(options['topic'])
+        if not topics:
+            raise CommandError('No topics match')
+
+        exported = 0
+
+        def counted(rows):
+            nonlocal exported
+            for row in rows:
+                exported += 1
+                yield row
+
+        rows = counted(export_rows(topics, since=since, until=until, archive=options['archive'],
+                                   chunk_size=options['chunk_size']))
+        chunks = encode(rows, options['format'], gzip=options['gzip'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+
+        # stdout may carry the export, report on stderr
+        self.stderr.write(
+            self.style.SUCCESS(f'Exported {exported} messages from {len(topics)} topics')
+        )
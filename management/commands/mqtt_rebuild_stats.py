@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from apps.mqtt.models import MqttTopic
+from apps.mqtt.stats import rebuild_topic_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized MqttTopic stats (message count, latest message) from stored messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            help='Only rebuild this topic name (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        topic_ids = None
+        if options['topic']:
+            topic_ids = list(
+                MqttTopic.objects.filter(name__in=options['topic']).values_list('id', flat=True)
+            )
+
+        updated = rebuild_topic_stats(topic_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt stats for {updated} topics')
+        )
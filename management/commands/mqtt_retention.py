@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from apps.mqtt.models import MqttTopic
+from apps.mqtt.retention import RetentionEngine
+
+
+class Command(BaseCommand):
+    help = 'Apply MQTT message retention policies once (e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            help='Only trim this topic name (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine()
+
+        topic_ids = None
+        if options['topic']:
+            topic_ids = list(
+                MqttTopic.objects.filter(name__in=options['topic']).values_list('id', flat=True)
+            )
+
+        deleted = engine.run_once(topic_ids)
+        # Not part of run_once, which also runs on watermark triggers
+        files = engine.sweep_payload_files()
+        entries = engine.sweep_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} messages, {files} payload files, {entries} search entries')
+        )
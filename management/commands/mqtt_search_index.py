@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from apps.mqtt.compression import STORED_PAYLOAD_FIELDS, payload_store
+from apps.mqtt.models import MqttMessage, MqttMessageKey, MqttTopic
+from apps.mqtt.search import SEARCH_TABLE, search_index
+
+
+class Command(BaseCommand):
+    help = 'Index stored messages of search-enabled topics (e.g. after enabling search on a topic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            help='Only index this topic name (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Messages indexed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        topics = MqttTopic.objects.exclude(search_enabled=False, search_keys='')
+        if options['topic']:
+            topics = topics.filter(name__in=options['topic'])
+        topic_ids = list(topics.values_list('id', flat=True))
+        if not topic_ids:
+            raise CommandError('No topics with search_enabled or search_keys selected')
+
+        search_index.refresh()
+        indexed = 0
+        for topic_id in topic_ids:
+            # Entries written by the ingest path are replaced, not duplicated
+            self._clear(topic_id)
+            messages = MqttMessage.objects.filter(topic_id=topic_id).order_by('id') \
+                .values('id', 'received_at', *STORED_PAYLOAD_FIELDS)
+            last_id = 0
+            while True:
+                rows = list(messages.filter(id__gt=last_id)[:options['batch_size']])
+                if not rows:
+                    break
+                with transaction.atomic():
+                    search_index.index(
+                        (row['id'], topic_id, payload_store.unpack_row(row), row['received_at']) for row in rows
+                    )
+                last_id = rows[-1]['id']
+                indexed += len(rows)
+
+        search_index.sweep()
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {indexed} messages from {len(topic_ids)} topics')
+        )
+
+    def _clear(self, topic_id):
+        MqttMessageKey.objects.filter(topic_id=topic_id).delete()
+        if not search_index.full_text_available:
+            return
+        messages = MqttMessage._meta.db_table
+        column = 'message_id' if connection.vendor == 'postgresql' else 'rowid'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE {column} IN (SELECT id FROM {messages} WHERE topic_id = %s)',
+                [topic_id],
+            )
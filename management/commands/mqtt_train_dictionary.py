@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.mqtt.compression import (
+    COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_ZSTD, STORED_PAYLOAD_FIELDS, compress, payload_store,
+    train_dictionary, zstandard,
+)
+from apps.mqtt.models import MqttMessage, MqttPayloadDictionary, MqttTopic
+
+
+class Command(BaseCommand):
+    help = 'Build a compression dictionary for a topic from its recent payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=str,
+            action='append',
+            required=True,
+            help='Topic name (can be repeated)'
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=1000,
+            help='Recent payloads to build the dictionary from'
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=16384,
+            help='Dictionary size in bytes (zlib uses at most 32768)'
+        )
+
+    def handle(self, *args, **options):
+        topics = list(MqttTopic.objects.filter(name__in=options['topic']))
+        missing = set(options['topic']) - {topic.name for topic in topics}
+        if missing:
+            raise CommandError(f'Unknown topics: {", ".join(sorted(missing))}')
+
+        for topic in topics:
+            method = topic.payload_compression
+            if method == COMPRESSION_NONE:
+                self.stdout.write(self.style.WARNING(f'{topic.name}: payload compression is off, skipped'))
+                continue
+            if method == COMPRESSION_ZSTD and zstandard is None:
+                # The ingest path falls back to zlib as well
+                method = COMPRESSION_ZLIB
+
+            rows = MqttMessage.objects.filter(topic_id=topic.id).order_by('-received_at') \
+                .values(*STORED_PAYLOAD_FIELDS)[:options['samples']]
+            # Oldest first, the end of a zlib dictionary is matched most cheaply
+            samples = [payload_store.unpack_row(row).encode('utf-8') for row in rows][::-1]
+            if not samples:
+                self.stdout.write(self.style.WARNING(f'{topic.name}: no stored payloads, skipped'))
+                continue
+
+            try:
+                data = train_dictionary(samples, method, options['size'])
+            except Exception as e:
+                raise CommandError(f'{topic.name}: error training dictionary: {e}')
+
+            plain = sum(len(sample) for sample in samples)
+            before = sum(len(compress(sample, method)) for sample in samples)
+            after = sum(len(compress(sample, method, data)) for sample in samples)
+            MqttPayloadDictionary.objects.create(
+                topic=topic, compression=method, data=data, sample_count=len(samples)
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{topic.name}: {method} dictionary of {len(data)} bytes from {len(samples)} payloads, '
+                    f'{plain} bytes compress to {before} without and {after} with it'
+                )
+            )
@@ -0,0 +1,324 @@
+import bisect
+import hmac
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label value used once a metric reaches its series limit
+OVERFLOW_LABEL = '__other__'
+
+EXPOSITION_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base for labelled metrics, label values are passed positionally"""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), max_series: int = 1000):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple) -> Tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        if labels not in self._series and len(self._series) >= self.max_series:
+            return (OVERFLOW_LABEL,) * len(self.labelnames)
+        return labels
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._series.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in series]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), max_series: int = 1000,
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labels) -> 'HistogramTimer':
+        return HistogramTimer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                bucket = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            bucket = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{bucket} {values[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(values[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}')
+        return lines
+
+
+class HistogramTimer:
+    """Context manager observing elapsed seconds"""
+
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+# A collector returns (name, type, help, [(labelnames, labelvalues, value), ...]) tuples at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Tuple, Tuple, float]]]]]
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, **kwargs))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def register_collector(self, collector: Collector):
+        """Add a function producing values read from live objects at scrape time"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        blocks = [metric.render() for metric in metrics]
+        # Families with the same name from several collectors (e.g. one per broker) are merged
+        families: Dict[str, Tuple[str, str, list]] = {}
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logger.error(f"Error in metrics collector: {e}")
+                continue
+            for name, metric_type, documentation, samples in collected:
+                families.setdefault(name, (metric_type, documentation, []))[2].extend(samples)
+        for name, (metric_type, documentation, samples) in families.items():
+            lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+            lines.extend(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}'
+                         for labelnames, labels, value in samples)
+            blocks.append('\n'.join(lines))
+        return '\n'.join(blocks) + '\n'
+
+
+def bearer_authorized(header: Optional[str], token: Optional[str]) -> bool:
+    """Whether an Authorization header carries the metrics token (constant-time compare)"""
+    if not token or not header:
+        return False
+    return hmac.compare_digest(header.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        token = getattr(settings, 'MQTT_METRICS_TOKEN', None)
+        if token and not bearer_authorized(self.headers.get('Authorization'), token):
+            self.send_error(403)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', EXPOSITION_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_metrics_server(port: int, host: str = '', metrics: Optional['MetricsRegistry'] = None) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` of this process on a daemon thread
+
+    The ingest process (``mqtt_client`` command) records its metrics in its
+    own registry, which the web process cannot see, so it exposes them here.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = metrics or registry
+    thread = threading.Thread(target=server.serve_forever, name=f'mqtt-metrics-{port}', daemon=True)
+    thread.start()
+    logger.info(f"Serving MQTT metrics on {host or '0.0.0.0'}:{server.server_address[1]}")
+    return server
+
+
+class RateLimitedLogger:
+    """Log at most once per interval per key, reporting how many similar lines were skipped
+
+    Arguments are %-formatted only when the line is actually emitted, so
+    suppressed calls on hot paths stay cheap.
+    """
+
+    def __init__(self, log: logging.Logger, interval: Optional[float] = None):
+        self.log = log
+        self.interval = interval if interval is not None else getattr(settings, 'MQTT_LOG_INTERVAL', 10)
+        self._last: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _emit(self, level: int, key: str, msg: str, args):
+        if not self.log.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, float('-inf')) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg = f'{msg} (+{suppressed} similar in the last {self.interval:g}s)'
+        self.log.log(level, msg, *args)
+
+    def info(self, key: str, msg: str, *args):
+        self._emit(logging.INFO, key, msg, args)
+
+    def warning(self, key: str, msg: str, *args):
+        self._emit(logging.WARNING, key, msg, args)
+
+    def error(self, key: str, msg: str, *args):
+        self._emit(logging.ERROR, key, msg, args)
+
+
+# Global registry and the metrics recorded by the client service
+registry = MetricsRegistry()
+
+_max_topics = getattr(settings, 'MQTT_METRICS_MAX_TOPICS', 1000)
+
+messages_received = registry.counter(
+    'mqtt_messages_received_total', 'Messages received from the broker', ('topic', 'qos'), max_series=_max_topics)
+messages_published = registry.counter(
+    'mqtt_messages_published_total', 'Messages published to the broker', ('topic', 'qos'), max_series=_max_topics)
+publish_failures = registry.counter(
+    'mqtt_publish_failures_total', 'Publish calls rejected by the client', ('topic',), max_series=_max_topics)
+connects = registry.counter(
+    'mqtt_connects_total', 'CONNACKs received from the broker', ('result',))
+disconnects = registry.counter(
+    'mqtt_disconnects_total', 'Disconnects from the broker', ('reason',))
+batch_flush_seconds = registry.histogram(
+    'mqtt_ingest_batch_seconds', 'Time to write one ingest batch through its sink', ('pipeline',))
+batch_size = registry.histogram(
+    'mqtt_ingest_batch_size', 'Messages per ingest batch', ('pipeline',),
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+db_write_seconds = registry.histogram(
+    'mqtt_db_write_seconds', 'Database transaction time for one batch of messages', ('sink',))
+callback_seconds = registry.histogram(
+    'mqtt_callback_seconds', 'Message callback duration', ('handler',))
+duplicates_dropped = registry.counter(
+    'mqtt_duplicates_dropped_total', 'Redelivered messages dropped before storage', ('stage',))
+reconnect_attempts = registry.counter(
+    'mqtt_reconnect_attempts_total', 'Reconnect attempts after losing the broker', ('broker',))
+recovery_seconds = registry.histogram(
+    'mqtt_recovery_seconds', 'Time from losing the broker to being connected and resubscribed', ('broker',),
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_size',
+            field=models.PositiveIntegerField(default=0, help_text='Payload size in bytes'),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='max_age',
+            field=models.DurationField(blank=True, help_text='Delete messages older than this (empty uses MQTT_MAX_MESSAGE_AGE)', null=True),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='max_bytes',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Max total payload size in bytes (empty uses MQTT_MAX_STORED_BYTES)', null=True),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='max_messages',
+            field=models.PositiveIntegerField(blank=True, help_text='Max stored messages (empty uses MQTT_MAX_STORED_MESSAGES)', null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0002_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MqttMessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(help_text='Message payload')),
+                ('payload_size', models.PositiveIntegerField(default=0, help_text='Payload size in bytes')),
+                ('qos', models.IntegerField(default=1)),
+                ('retain', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField()),
+                ('received_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'MQTT Archived Message',
+                'verbose_name_plural': 'MQTT Archived Messages',
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessage',
+            index=models.Index(fields=['topic', '-received_at'], name='mqtt_msg_topic_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessage',
+            index=models.Index(fields=['received_at'], name='mqtt_msg_received_idx'),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='topic',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='mqtt.mqtttopic'),
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessagearchive',
+            index=models.Index(fields=['topic', '-received_at'], name='mqtt_arch_topic_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessagearchive',
+            index=models.Index(fields=['received_at'], name='mqtt_arch_received_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+def backfill_topic_stats(apps, schema_editor):
+    MqttTopic = apps.get_model('mqtt', 'MqttTopic')
+    MqttMessage = apps.get_model('mqtt', 'MqttMessage')
+    for topic_id in MqttTopic.objects.values_list('id', flat=True).iterator():
+        messages = MqttMessage.objects.filter(topic_id=topic_id)
+        latest = messages.order_by('-received_at').values('received_at', 'payload').first()
+        if latest is None:
+            continue
+        MqttTopic.objects.filter(id=topic_id).update(
+            message_count=messages.count(),
+            last_received_at=latest['received_at'],
+            last_payload=latest['payload'][:1000],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0003_message_indexes_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='last_payload',
+            field=models.TextField(blank=True, editable=False, help_text='Payload of the latest message (truncated)'),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='last_received_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the latest message was received', null=True),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='message_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Stored messages, maintained by the ingest path'),
+        ),
+        migrations.RunPython(backfill_topic_stats, migrations.RunPython.noop),
+    ]
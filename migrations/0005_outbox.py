@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0004_topic_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MqttOutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(help_text='Topic to publish to', max_length=255)),
+                ('payload', models.TextField(blank=True, help_text='Message payload')),
+                ('qos', models.IntegerField(choices=[(0, 'At most once'), (1, 'At least once'), (2, 'Exactly once')], default=1)),
+                ('retain', models.BooleanField(default=False)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Replay attempts so far')),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'MQTT Outbox Message',
+                'verbose_name_plural': 'MQTT Outbox Messages',
+                'ordering': ['id'],
+            },
+        ),
+    ]
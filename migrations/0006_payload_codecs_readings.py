@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0005_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_encoding',
+            field=models.CharField(choices=[('text', 'Text'), ('json', 'JSON (transcoded from a binary codec)'), ('base64', 'Base64')], default='text', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='payload_encoding',
+            field=models.CharField(choices=[('text', 'Text'), ('json', 'JSON (transcoded from a binary codec)'), ('base64', 'Base64')], default='text', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='payload_codec',
+            field=models.CharField(choices=[('text', 'Text (UTF-8)'), ('json', 'JSON'), ('number', 'Numeric scalar'), ('raw', 'Raw bytes'), ('cbor', 'CBOR'), ('msgpack', 'MessagePack')], default='text', help_text='How payloads are decoded at ingest', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='value_path',
+            field=models.CharField(blank=True, help_text='Dotted path to a numeric value stored as a reading (e.g. sensor.temp)', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='MqttReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.DateTimeField()),
+                ('value', models.FloatField()),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='mqtt.mqtttopic')),
+            ],
+            options={
+                'verbose_name': 'MQTT Reading',
+                'verbose_name_plural': 'MQTT Readings',
+                'ordering': ['-ts'],
+                'indexes': [models.Index(fields=['topic', '-ts'], name='mqtt_reading_topic_ts_idx'), models.Index(fields=['ts'], name='mqtt_reading_ts_idx')],
+            },
+        ),
+    ]
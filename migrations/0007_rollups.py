@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0006_payload_codecs_readings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MqttRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField(help_text='Start of the bucket (UTC)')),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('sum', models.FloatField(default=0)),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='mqtt.mqtttopic')),
+            ],
+            options={
+                'verbose_name': 'MQTT Rollup',
+                'verbose_name_plural': 'MQTT Rollups',
+                'ordering': ['topic', 'resolution', 'bucket'],
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='mqtt_rollup_res_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topic', 'resolution', 'bucket'), name='mqtt_rollup_bucket_uniq')],
+            },
+        ),
+    ]
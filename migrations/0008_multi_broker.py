@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0007_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='mqttconnection',
+            options={'ordering': ['id'], 'verbose_name': 'MQTT Connection', 'verbose_name_plural': 'MQTT Connections'},
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='client_id',
+            field=models.CharField(blank=True, help_text='Empty lets the broker assign one', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='is_enabled',
+            field=models.BooleanField(default=True, help_text='Run a client for this broker in the connection manager'),
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='keepalive',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='name',
+            field=models.CharField(blank=True, help_text='Display name (e.g. eu-west)', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='password',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mqttconnection',
+            name='username',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mqttoutboxmessage',
+            name='connection',
+            field=models.ForeignKey(blank=True, help_text='Broker to publish to (empty: the default broker)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='mqtt.mqttconnection'),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='connections',
+            field=models.ManyToManyField(blank=True, help_text='Brokers to subscribe on (none subscribes on every broker)', related_name='topics', to='mqtt.mqttconnection'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0008_multi_broker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Set with MQTT_DEDUP_CONTENT_HASH, rejects redelivered copies', max_length=64, null=True, unique=True),
+        ),
+    ]
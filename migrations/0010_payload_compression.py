@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0009_message_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_blob',
+            field=models.BinaryField(blank=True, help_text='Compressed payload (payload is empty)', null=True),
+        ),
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_compression',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], default='', editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_file',
+            field=models.CharField(blank=True, editable=False, help_text='Storage name of an offloaded payload (payload is empty)', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='payload_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='payload_compression',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], default='', editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='payload_file',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='payload_compression',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], default='', help_text='How stored payloads are compressed', max_length=8),
+        ),
+        migrations.CreateModel(
+            name='MqttPayloadDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compression', models.CharField(choices=[('', 'None'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], max_length=8)),
+                ('data', models.BinaryField(help_text='Dictionary bytes, needed to read every payload compressed with it')),
+                ('sample_count', models.PositiveIntegerField(default=0, help_text='Payloads the dictionary was built from')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payload_dictionaries', to='mqtt.mqtttopic')),
+            ],
+            options={
+                'verbose_name': 'MQTT Payload Dictionary',
+                'verbose_name_plural': 'MQTT Payload Dictionaries',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='mqttmessage',
+            name='payload_dictionary',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='mqtt.mqttpayloaddictionary'),
+        ),
+        migrations.AddField(
+            model_name='mqttmessagearchive',
+            name='payload_dictionary',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='mqtt.mqttpayloaddictionary'),
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessage',
+            index=models.Index(condition=models.Q(('payload_file__isnull', False)), fields=['payload_file'], name='mqtt_msg_payload_file_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mqttmessagearchive',
+            index=models.Index(condition=models.Q(('payload_file__isnull', False)), fields=['payload_file'], name='mqtt_arch_payload_file_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models
+
+
+def create_search_table(apps, schema_editor):
+    # Full-text table outside the ORM: FTS5 on SQLite, tsvector + GIN on PostgreSQL
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute('CREATE VIRTUAL TABLE mqtt_message_search USING fts5(payload, tokenize="unicode61")')
+        except DatabaseError:
+            # SQLite built without FTS5, search falls back to icontains
+            pass
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE TABLE mqtt_message_search (message_id bigint PRIMARY KEY, document tsvector NOT NULL)')
+        schema_editor.execute('CREATE INDEX mqtt_message_search_document_idx ON mqtt_message_search USING gin (document)')
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS mqtt_message_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt', '0010_payload_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='search_enabled',
+            field=models.BooleanField(default=False, help_text='Index payloads for full-text search'),
+        ),
+        migrations.AddField(
+            model_name='mqtttopic',
+            name='search_keys',
+            field=models.CharField(blank=True, help_text='Comma separated JSON paths indexed for exact lookups (e.g. device_id,meta.site)', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='MqttMessageKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.BigIntegerField()),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+                ('received_at', models.DateTimeField()),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mqtt.mqtttopic')),
+            ],
+            options={
+                'verbose_name': 'MQTT Message Key',
+                'verbose_name_plural': 'MQTT Message Keys',
+                'indexes': [models.Index(fields=['key', 'value', '-received_at'], name='mqtt_msgkey_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -1,16 +1,39 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib.auth import get_user_model
 
+from .compression import COMPRESSION_CHOICES, COMPRESSION_NONE, payload_store
+from .payloads import CODEC_CHOICES, CODEC_TEXT, ENCODING_CHOICES, ENCODING_TEXT
+
 User = get_user_model()
 
 
+def unpack_payload(message) -> str:
+    """Text of a stored (MqttMessage or MqttMessageArchive) payload"""
+    return payload_store.unpack(message.payload, message.payload_blob, message.payload_compression,
+                                message.payload_file, message.payload_dictionary_id)
+
+
 class MqttTopic(models.Model):
     """Model untuk menyimpan MQTT topics yang dimonitor"""
     name = models.CharField(max_length=255, unique=True, help_text="MQTT topic name (e.g., sensor/temperature)")
     description = models.TextField(blank=True, help_text="Description of this topic")
     is_active = models.BooleanField(default=True, help_text="Whether to monitor this topic")
     qos = models.IntegerField(default=1, choices=[(0, 'At most once'), (1, 'At least once'), (2, 'Exactly once')])
+    max_messages = models.PositiveIntegerField(null=True, blank=True, help_text="Max stored messages (empty uses MQTT_MAX_STORED_MESSAGES)")
+    max_age = models.DurationField(null=True, blank=True, help_text="Delete messages older than this (empty uses MQTT_MAX_MESSAGE_AGE)")
+    max_bytes = models.PositiveBigIntegerField(null=True, blank=True, help_text="Max total payload size in bytes (empty uses MQTT_MAX_STORED_BYTES)")
+    payload_codec = models.CharField(max_length=10, choices=CODEC_CHOICES, default=CODEC_TEXT, help_text="How payloads are decoded at ingest")
+    value_path = models.CharField(max_length=255, blank=True, help_text="Dotted path to a numeric value stored as a reading (e.g. sensor.temp)")
+    payload_compression = models.CharField(max_length=8, choices=COMPRESSION_CHOICES, default=COMPRESSION_NONE, blank=True, help_text="How stored payloads are compressed")
+    search_enabled = models.BooleanField(default=False, help_text="Index payloads for full-text search")
+    search_keys = models.CharField(max_length=255, blank=True, help_text="Comma separated JSON paths indexed for exact lookups (e.g. device_id,meta.site)")
+    connections = models.ManyToManyField('MqttConnection', blank=True, related_name='topics', help_text="Brokers to subscribe on (none subscribes on every broker)")
+    message_count = models.PositiveBigIntegerField(default=0, editable=False, help_text="Stored messages, maintained by the ingest path")
+    last_received_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the latest message was received")
+    last_payload = models.TextField(blank=True, editable=False, help_text="Payload of the latest message (truncated)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -19,39 +42,192 @@ class MqttTopic(models.Model):
         verbose_name = "MQTT Topic"
         verbose_name_plural = "MQTT Topics"
 
+    # Maintained with queryset updates by the ingest path and retention engine
+    STATS_FIELDS = ('message_count', 'last_received_at', 'last_payload')
+    LAST_PAYLOAD_LENGTH = 1000
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Never write back stats loaded before the ingest path updated them
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def latest_message(self):
         return self.messages.first()
 
-    @property
-    def message_count(self):
-        return self.messages.count()
-
 
 class MqttMessage(models.Model):
     """Model untuk menyimpan MQTT messages yang diterima"""
     topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='messages')
     payload = models.TextField(help_text="Message payload")
+    payload_size = models.PositiveIntegerField(default=0, help_text="Payload size in bytes")
+    payload_encoding = models.CharField(max_length=10, choices=ENCODING_CHOICES, default=ENCODING_TEXT)
     qos = models.IntegerField(default=1)
     retain = models.BooleanField(default=False)
     timestamp = models.DateTimeField(default=timezone.now)
     received_at = models.DateTimeField(auto_now_add=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False, help_text="Set with MQTT_DEDUP_CONTENT_HASH, rejects redelivered copies")
+    payload_compression = models.CharField(max_length=8, choices=COMPRESSION_CHOICES, default=COMPRESSION_NONE, blank=True, editable=False)
+    payload_blob = models.BinaryField(null=True, blank=True, help_text="Compressed payload (payload is empty)")
+    payload_file = models.CharField(max_length=255, null=True, blank=True, editable=False, help_text="Storage name of an offloaded payload (payload is empty)")
+    payload_dictionary = models.ForeignKey('MqttPayloadDictionary', on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+')
 
     class Meta:
         ordering = ['-received_at']
         verbose_name = "MQTT Message"
         verbose_name_plural = "MQTT Messages"
+        indexes = [
+            models.Index(fields=['topic', '-received_at'], name='mqtt_msg_topic_received_idx'),
+            models.Index(fields=['received_at'], name='mqtt_msg_received_idx'),
+            models.Index(fields=['payload_file'], name='mqtt_msg_payload_file_idx', condition=models.Q(payload_file__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.topic.name} - {self.timestamp}"
 
+    @cached_property
+    def payload_text(self):
+        """Payload as text, decompressed or read from storage when needed"""
+        return unpack_payload(self)
+
     @property
     def payload_preview(self):
         """Return first 100 characters of payload"""
-        return self.payload[:100] + "..." if len(self.payload) > 100 else self.payload
+        payload = self.payload_text
+        return payload[:100] + "..." if len(payload) > 100 else payload
+
+
+class MqttMessageArchive(models.Model):
+    """Model untuk menyimpan MQTT messages lama yang dipindahkan dari MqttMessage"""
+    topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='archived_messages')
+    payload = models.TextField(help_text="Message payload")
+    payload_size = models.PositiveIntegerField(default=0, help_text="Payload size in bytes")
+    payload_encoding = models.CharField(max_length=10, choices=ENCODING_CHOICES, default=ENCODING_TEXT)
+    qos = models.IntegerField(default=1)
+    retain = models.BooleanField(default=False)
+    timestamp = models.DateTimeField()
+    received_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload_compression = models.CharField(max_length=8, choices=COMPRESSION_CHOICES, default=COMPRESSION_NONE, blank=True, editable=False)
+    payload_blob = models.BinaryField(null=True, blank=True)
+    payload_file = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    payload_dictionary = models.ForeignKey('MqttPayloadDictionary', on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+')
+
+    class Meta:
+        ordering = ['-received_at']
+        verbose_name = "MQTT Archived Message"
+        verbose_name_plural = "MQTT Archived Messages"
+        indexes = [
+            models.Index(fields=['topic', '-received_at'], name='mqtt_arch_topic_received_idx'),
+            models.Index(fields=['received_at'], name='mqtt_arch_received_idx'),
+            models.Index(fields=['payload_file'], name='mqtt_arch_payload_file_idx', condition=models.Q(payload_file__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.topic.name} - {self.timestamp}"
+
+    @cached_property
+    def payload_text(self):
+        """Payload as text, decompressed or read from storage when needed"""
+        return unpack_payload(self)
+
+
+class MqttPayloadDictionary(models.Model):
+    """Model untuk menyimpan compression dictionaries per topic (mqtt_train_dictionary)"""
+    topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='payload_dictionaries')
+    compression = models.CharField(max_length=8, choices=COMPRESSION_CHOICES)
+    data = models.BinaryField(help_text="Dictionary bytes, needed to read every payload compressed with it")
+    sample_count = models.PositiveIntegerField(default=0, help_text="Payloads the dictionary was built from")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "MQTT Payload Dictionary"
+        verbose_name_plural = "MQTT Payload Dictionaries"
+
+    def __str__(self):
+        return f"{self.topic.name} - {self.compression} ({len(self.data)} bytes)"
+
+
+class MqttMessageKey(models.Model):
+    """Model untuk menyimpan JSON values dari payload yang di-index (MqttTopic.search_keys)"""
+    # No foreign key to MqttMessage: rows of deleted messages are swept by retention, keeping its deletes fast
+    message_id = models.BigIntegerField()
+    topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)
+    received_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "MQTT Message Key"
+        verbose_name_plural = "MQTT Message Keys"
+        indexes = [
+            models.Index(fields=['key', 'value', '-received_at'], name='mqtt_msgkey_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key}={self.value}"
+
+
+class MqttReading(models.Model):
+    """Model untuk menyimpan numeric readings yang di-decode dari payload"""
+    topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='readings')
+    ts = models.DateTimeField()
+    value = models.FloatField()
+
+    class Meta:
+        ordering = ['-ts']
+        verbose_name = "MQTT Reading"
+        verbose_name_plural = "MQTT Readings"
+        indexes = [
+            models.Index(fields=['topic', '-ts'], name='mqtt_reading_topic_ts_idx'),
+            models.Index(fields=['ts'], name='mqtt_reading_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic.name} - {self.ts}: {self.value}"
+
+
+class MqttRollup(models.Model):
+    """Model untuk menyimpan agregat readings per menit, jam atau hari"""
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    topic = models.ForeignKey(MqttTopic, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the bucket (UTC)")
+    count = models.PositiveBigIntegerField(default=0)
+    sum = models.FloatField(default=0)
+    min = models.FloatField()
+    max = models.FloatField()
+
+    class Meta:
+        ordering = ['topic', 'resolution', 'bucket']
+        verbose_name = "MQTT Rollup"
+        verbose_name_plural = "MQTT Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'resolution', 'bucket'], name='mqtt_rollup_bucket_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket'], name='mqtt_rollup_res_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic.name} [{self.resolution}] {self.bucket}"
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
 
 
 class MqttConnection(models.Model):
@@ -63,8 +239,14 @@ class MqttConnection(models.Model):
         ('error', 'Error'),
     ]
     
+    name = models.CharField(max_length=100, blank=True, help_text="Display name (e.g. eu-west)")
     broker_host = models.CharField(max_length=255)
     broker_port = models.IntegerField(default=1883)
+    is_enabled = models.BooleanField(default=True, help_text="Run a client for this broker in the connection manager")
+    username = models.CharField(max_length=255, blank=True)
+    password = models.CharField(max_length=255, blank=True)
+    client_id = models.CharField(max_length=255, blank=True, help_text="Empty lets the broker assign one")
+    keepalive = models.PositiveIntegerField(default=60)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='disconnected')
     last_connected = models.DateTimeField(null=True, blank=True)
     last_error = models.TextField(blank=True)
@@ -72,8 +254,47 @@ class MqttConnection(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        ordering = ['id']
         verbose_name = "MQTT Connection"
         verbose_name_plural = "MQTT Connections"
 
     def __str__(self):
-        return f"{self.broker_host}:{self.broker_port} - {self.status}"
+        return f"{self.name or self.broker_host}:{self.broker_port} - {self.status}"
+
+    @classmethod
+    def default(cls):
+        """Record of the broker configured in settings (MQTT_BROKER_HOST/PORT)"""
+        return cls.objects.filter(
+            broker_host=getattr(settings, 'MQTT_BROKER_HOST', 'localhost'),
+            broker_port=getattr(settings, 'MQTT_BROKER_PORT', 1883),
+        ).order_by('id').first()
+
+    def is_default(self) -> bool:
+        return (self.broker_host == getattr(settings, 'MQTT_BROKER_HOST', 'localhost')
+                and self.broker_port == getattr(settings, 'MQTT_BROKER_PORT', 1883))
+
+
+class MqttOutboxMessage(models.Model):
+    """Model untuk menyimpan messages yang di-publish saat tidak terkoneksi ke broker"""
+    QOS_CHOICES = [
+        (0, 'At most once'),
+        (1, 'At least once'),
+        (2, 'Exactly once'),
+    ]
+
+    connection = models.ForeignKey('MqttConnection', null=True, blank=True, on_delete=models.CASCADE, related_name='outbox', help_text="Broker to publish to (empty: the default broker)")
+    topic = models.CharField(max_length=255, help_text="Topic to publish to")
+    payload = models.TextField(blank=True, help_text="Message payload")
+    qos = models.IntegerField(choices=QOS_CHOICES, default=1)
+    retain = models.BooleanField(default=False)
+    attempts = models.PositiveIntegerField(default=0, help_text="Replay attempts so far")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "MQTT Outbox Message"
+        verbose_name_plural = "MQTT Outbox Messages"
+
+    def __str__(self):
+        return f"{self.topic} - {self.created_at}"
@@ -1,212 +1,907 @@
 import json
 import logging
+import socket
 import threading
+import time
 from datetime import datetime
-from typing import Optional, Callable
+from typing import Callable, Dict, Iterable, List, Optional
 
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
 from django.utils import timezone
 
-from .models import MqttTopic, MqttMessage, MqttConnection
+from . import metrics
+from .compression import payload_store
+from .dispatch import MessageDispatcher
+from .connection_state import ConnectionStateWriter
+from .dedup import MessageDeduplicator
+from .ingest import IngestPipeline, IngestRecord
+from .last_value import last_value_cache
+from .models import MqttTopic, MqttMessage, MqttConnection, MqttOutboxMessage, MqttReading
+from .payloads import codec_registry, decode_payload
+from .publish import PublishResult, PublishTracker, STATUS_FAILED, STATUS_QUEUED, STATUS_SENT, normalize_payload
+from .reconnect import ReconnectBackoff
+from .retention import RetentionEngine
+from .rollups import accumulate, apply_rollups
+from .search import search_index
+from .sinks import SinkRouter
+from .status import status_snapshot
+from .stats import record_topic_activity
+from .topic_cache import topic_cache
+from .topics import is_wildcard, shard_for, shared_subscription
 
 logger = logging.getLogger(__name__)
+# Per-message events are logged at most once per MQTT_LOG_INTERVAL seconds
+hot_path_logger = metrics.RateLimitedLogger(logger)
+
+# publish() return codes that no retry fixes, anything else (no connection, queue full) is retried
+PERMANENT_PUBLISH_ERRORS = (mqtt.MQTT_ERR_INVAL, mqtt.MQTT_ERR_PAYLOAD_SIZE)
 
 
 class MqttClientService:
-    """Service untuk handle MQTT client operations"""
+    """Service untuk handle MQTT client operations
+    
+    Without ``broker`` the service talks to the broker from settings
+    (MQTT_BROKER_HOST etc.); ConnectionManager creates one service per
+    additional MqttConnection row, each with its own client, ingest
+    pipelines, outbox and status.
+    """
     
-    def __init__(self):
+    def __init__(self, broker: Optional[MqttConnection] = None):
+        self.broker = broker
         self.client: Optional[mqtt.Client] = None
         self.is_connected = False
-        self.connection_record: Optional[MqttConnection] = None
-        self._message_callbacks = []
+        self.connection_record: Optional[MqttConnection] = broker
+        # Status transitions are applied in memory and written to connection_record in the background
+        self.connection_state = ConnectionStateWriter()
+        # QoS 1/2 redeliveries are dropped in _on_message, and optionally by content hash in the writers
+        self.dedup = MessageDeduplicator()
+        self.dedup_enabled = getattr(settings, 'MQTT_DEDUP_ENABLED', True)
+        self.content_hashes = getattr(settings, 'MQTT_DEDUP_CONTENT_HASH', False)
+        self.dispatcher = MessageDispatcher()
+        self.publisher = PublishTracker(getattr(settings, 'MQTT_PUBLISH_MAX_INFLIGHT', 100))
+        # Serializes publishers so outbox replay keeps publish order
+        self._publish_lock = threading.Lock()
+        self._outbox_pending: Optional[bool] = None
+        self._outbox_thread: Optional[threading.Thread] = None
+        # Outbox row id -> result of replayed rows waiting for their ack
+        self._outbox_sent: Dict[int, PublishResult] = {}
+        self._status_callbacks = []
         self._lock = threading.Lock()
+        self.pipeline: Optional[IngestPipeline] = None
+        self.sinks: Optional[SinkRouter] = None
+        self.topic_cache = topic_cache
+        self.codecs = codec_registry
+        self.payloads = payload_store
+        self.search = search_index
+        self.status = status_snapshot
+        # Latest message per topic for /mqtt/snapshot/, updated after each stored batch
+        self.last_values = last_value_cache
+        self.last_values_enabled = getattr(settings, 'MQTT_LAST_VALUE_ENABLED', True)
+        # Set by AsyncMqttEngine when it drives this service's network I/O
+        self.engine = None
+        # Readings are folded into MqttRollup in the same transaction
+        self.rollups_enabled = getattr(settings, 'MQTT_ROLLUPS_ENABLED', True)
+        self.retention = RetentionEngine()
+        # Age expiry across all topics is left to the default broker's service
+        self.retention.global_expiry = broker is None
+        # Worker sharding, see configure_shard
+        self.shard_index = 0
+        self.shard_count = 1
+        self.share_group: Optional[str] = None
+        # Broker keeps subscriptions and queued QoS 1/2 messages while we are away
+        self.persistent_session = not getattr(settings, 'MQTT_CLEAN_SESSION', False)
+        self.backoff = ReconnectBackoff()
+        # Topic filter -> QoS subscribed in the current broker session
+        self._subscriptions: Dict[str, int] = {}
+        self._disconnected_at: Optional[float] = None
+        self.last_recovery_seconds: Optional[float] = None
         
+    @property
+    def name_suffix(self) -> str:
+        """Suffix keeping pipeline, spill file and metric names apart per broker and worker"""
+        suffix = f'-b{self.broker.pk}' if self.broker else ''
+        if self.shard_count > 1:
+            suffix = f'{suffix}-w{self.shard_index}'
+        return suffix
+    
+    @property
+    def label(self) -> str:
+        """Broker name for logs and metrics"""
+        if self.broker is None:
+            return 'default'
+        return self.broker.name or f'{self.broker.broker_host}:{self.broker.broker_port}'
+    
+    def broker_options(self) -> dict:
+        """host, port, keepalive, username, password and client_id for this service's broker"""
+        if self.broker is not None:
+            return {
+                'host': self.broker.broker_host,
+                'port': self.broker.broker_port,
+                'keepalive': self.broker.keepalive,
+                'username': self.broker.username or None,
+                'password': self.broker.password or None,
+                'client_id': self.broker.client_id,
+            }
+        return {
+            'host': getattr(settings, 'MQTT_BROKER_HOST', 'localhost'),
+            'port': getattr(settings, 'MQTT_BROKER_PORT', 1883),
+            'keepalive': getattr(settings, 'MQTT_KEEPALIVE', 60),
+            'username': getattr(settings, 'MQTT_BROKER_USERNAME', None),
+            'password': getattr(settings, 'MQTT_BROKER_PASSWORD', None),
+            'client_id': getattr(settings, 'MQTT_CLIENT_ID', None) or '',
+        }
+    
+    def client_id(self) -> str:
+        """MQTT_CLIENT_ID (or the broker row's), else a per-host id that stays stable across restarts
+        
+        Persistent sessions are keyed by client id, so without a configured
+        one the id is derived from the host name (plus broker and worker)
+        instead of letting paho pick a random one.
+        """
+        client_id = self.broker_options()['client_id']
+        if not client_id:
+            if not self.persistent_session:
+                return ''
+            client_id = f'{socket.gethostname()}-mqtt'
+            if self.broker is not None:
+                client_id = f'{client_id}-b{self.broker.pk}'
+        if self.shard_count > 1:
+            client_id = f"{client_id}-w{self.shard_index}"
+        return client_id
+    
+    def connect_options(self) -> dict:
+        """Extra ``client.connect`` arguments, MQTT v5 asks for session persistence per connect"""
+        if getattr(settings, 'MQTT_PROTOCOL', '3.1.1') != '5' or not self.persistent_session:
+            return {}
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = getattr(settings, 'MQTT_SESSION_EXPIRY', 3600)
+        return {'clean_start': False, 'properties': properties}
+    
     def setup_client(self):
-        """Setup MQTT client dengan konfigurasi dari settings"""
+        """Setup MQTT client dengan konfigurasi dari settings (atau dari MqttConnection broker)"""
         if self.client:
             self.disconnect()
             
-        self.client = mqtt.Client()
+        options = self.broker_options()
+        client_id = self.client_id()
+        if getattr(settings, 'MQTT_PROTOCOL', '3.1.1') == '5':
+            self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=client_id, clean_session=not self.persistent_session,
+                                      protocol=mqtt.MQTTv311)
         
         # Set callbacks
         self.client.on_connect = self._on_connect
+        self.client.on_connect_fail = self._on_connect_fail
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
         self.client.on_subscribe = self._on_subscribe
         self.client.on_publish = self._on_publish
+        self.client.max_inflight_messages_set(self.publisher.max_inflight)
         
         # Set credentials if provided
-        username = getattr(settings, 'MQTT_BROKER_USERNAME', None)
-        password = getattr(settings, 'MQTT_BROKER_PASSWORD', None)
+        username = options['username']
+        password = options['password']
         if username and password:
             self.client.username_pw_set(username, password)
             
         return self.client
-    
+
+    def setup_pipeline(self) -> IngestPipeline:
+        """Setup batched ingest pipeline dengan konfigurasi dari settings"""
+        if self.pipeline:
+            self.pipeline.stop()
+
+        self.pipeline = IngestPipeline(
+            self._write_batch,
+            batch_size=getattr(settings, 'MQTT_INGEST_BATCH_SIZE', 500),
+            flush_interval=getattr(settings, 'MQTT_INGEST_FLUSH_INTERVAL', 1.0),
+            max_queue_size=getattr(settings, 'MQTT_INGEST_QUEUE_SIZE', 10000),
+            backpressure=getattr(settings, 'MQTT_INGEST_BACKPRESSURE', 'block'),
+            spill_dir=getattr(settings, 'MQTT_INGEST_SPILL_DIR', None),
+            name=f'ingest{self.name_suffix}',
+        )
+        return self.pipeline
+
+    def setup_sinks(self) -> SinkRouter:
+        """Setup per-topic sinks dari MQTT_SINKS"""
+        if self.sinks:
+            self.sinks.stop()
+
+        self.sinks = SinkRouter(self)
+        return self.sinks
+
+    def configure_shard(self, index: int, count: int, share_group: Optional[str] = None):
+        """Run as worker ``index`` of ``count``
+
+        With ``share_group`` every worker subscribes to ``$share/<group>/<topic>``
+        and the broker balances messages between them. Without it topics are
+        hash-sharded: each worker subscribes only to the topics it owns, and
+        wildcard filters (subscribed by every worker) are filtered by shard on
+        receipt. Only worker 0 runs the global age expiry.
+        """
+        self.shard_index = index
+        self.shard_count = max(1, count)
+        self.share_group = share_group
+        self.retention.global_expiry = index == 0
+
+    def subscription_for(self, topic_name: str) -> Optional[str]:
+        """Topic filter this worker subscribes with, None if another worker owns the topic"""
+        if self.shard_count <= 1:
+            return topic_name
+        if self.share_group:
+            return shared_subscription(self.share_group, topic_name)
+        if is_wildcard(topic_name) or shard_for(topic_name, self.shard_count) == self.shard_index:
+            return topic_name
+        return None
+
+    def owns_topic(self, topic_name: str) -> bool:
+        """Whether a received message belongs to this worker's hash shard"""
+        if self.shard_count <= 1 or self.share_group:
+            return True
+        return shard_for(topic_name, self.shard_count) == self.shard_index
+
     def connect(self) -> bool:
         """Connect to MQTT broker"""
+        if self.engine is not None:
+            # Owned by an asyncio engine, which runs the network I/O on its loop
+            return self.engine.connect_threadsafe(self)
         try:
-            if not self.client:
-                self.setup_client()
-                
-            host = getattr(settings, 'MQTT_BROKER_HOST', 'localhost')
-            port = getattr(settings, 'MQTT_BROKER_PORT', 1883)
-            keepalive = getattr(settings, 'MQTT_KEEPALIVE', 60)
-            
-            # Update or create connection record
-            self.connection_record, created = MqttConnection.objects.get_or_create(
-                broker_host=host,
-                broker_port=port,
-                defaults={'status': 'connecting'}
-            )
-            if not created:
-                self.connection_record.status = 'connecting'
-                self.connection_record.save()
-            
-            self.client.connect(host, port, keepalive)
+            host, port, keepalive = self.prepare_connect()
+            self.client.connect(host, port, keepalive, **self.connect_options())
             self.client.loop_start()
             
             logger.info(f"Connecting to MQTT broker at {host}:{port}")
             return True
             
         except Exception as e:
-            logger.error(f"Failed to connect to MQTT broker: {e}")
-            if self.connection_record:
-                self.connection_record.status = 'error'
-                self.connection_record.last_error = str(e)
-                self.connection_record.save()
+            self.connect_failed(e)
             return False
     
+    def prepare_connect(self):
+        """Everything before opening the socket: client, pipelines, connection record
+        
+        Returns (host, port, keepalive). Shared by the paho thread loop and the
+        asyncio engine, which runs it in an executor because it queries the database.
+        """
+        if not self.client:
+            self.setup_client()
+        if not self.pipeline:
+            self.setup_pipeline()
+        if not self.sinks:
+            self.setup_sinks()
+        self.topic_cache.warm()
+        self.pipeline.start()
+        self.sinks.start()
+        self.retention.start()
+            
+        options = self.broker_options()
+        host, port, keepalive = options['host'], options['port'], options['keepalive']
+        
+        # Update or create connection record (oldest one if concurrent connects created duplicates)
+        if self.broker is not None:
+            self.connection_record = self.broker
+        else:
+            self.connection_record = MqttConnection.objects.filter(
+                broker_host=host, broker_port=port
+            ).order_by('id').first()
+        if self.connection_record is None:
+            self.connection_record = MqttConnection.objects.create(
+                broker_host=host, broker_port=port, status='connecting'
+            )
+        else:
+            self.connection_state.transition(self.connection_record, 'connecting', status='connecting')
+        return host, port, keepalive
+    
+    def connect_failed(self, error: Exception):
+        """Record a failed connection attempt"""
+        logger.error(f"Failed to connect to MQTT broker: {error}")
+        if self.connection_record:
+            self.connection_state.transition(self.connection_record, 'connect_failed',
+                                             status='error', last_error=str(error))
+        self._notify_status()
+    
     def disconnect(self):
         """Disconnect from MQTT broker"""
         if self.client and self.is_connected:
             self.client.loop_stop()
             self.client.disconnect()
             
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.sinks:
+            self.sinks.stop()
+        self.dispatcher.shutdown()
+        self.publisher.reset()
+        self.retention.stop()
+            
         if self.connection_record:
-            self.connection_record.status = 'disconnected'
-            self.connection_record.save()
+            if self.connection_record.status != 'disconnected':
+                self.connection_state.transition(self.connection_record, 'disconnected', status='disconnected')
+            # Shutting down, do not leave the final state to the timer
+            self.connection_state.flush()
             
         self.is_connected = False
+        self._notify_status()
         logger.info("Disconnected from MQTT broker")
     
-    def subscribe_to_topics(self):
-        """Subscribe to all active topics in database"""
+    def subscribe_to_topics(self, force: bool = False):
+        """Subscribe to all active topics in database
+        
+        Filters already subscribed in the current broker session (e.g. a
+        resumed persistent session) are skipped unless ``force``.
+        """
         if not self.is_connected:
             logger.warning("Not connected to MQTT broker")
             return
             
-        active_topics = MqttTopic.objects.filter(is_active=True)
-        for topic in active_topics:
-            self.client.subscribe(topic.name, topic.qos)
-            logger.info(f"Subscribed to topic: {topic.name}")
+        # Topics without brokers are subscribed on every broker
+        active_topics = MqttTopic.objects.filter(is_active=True).filter(
+            Q(connections__isnull=True) | Q(connections=self.connection_record)
+        ).distinct().values_list('name', 'qos')
+        filters = {}
+        for name, qos in active_topics:
+            topic_filter = self.subscription_for(name)
+            if topic_filter is not None:
+                filters[topic_filter] = qos
+        self._subscribe(filters, force)
+    
+    def subscribe(self, topic_name: str, qos: int = 1) -> bool:
+        """Subscribe one topic right away, False when disconnected or owned by another worker"""
+        topic_filter = self.subscription_for(topic_name)
+        if topic_filter is None or not self.is_connected:
+            return False
+        return self._subscribe({topic_filter: qos}, force=True)
+    
+    def _subscribe(self, filters: Dict[str, int], force: bool = False) -> bool:
+        """Send filters in multi-topic SUBSCRIBE packets of MQTT_SUBSCRIBE_BATCH_SIZE"""
+        if not force:
+            filters = {topic_filter: qos for topic_filter, qos in filters.items()
+                       if self._subscriptions.get(topic_filter) != qos}
+        items = list(filters.items())
+        batch_size = max(1, getattr(settings, 'MQTT_SUBSCRIBE_BATCH_SIZE', 100))
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            rc, _ = self.client.subscribe(batch)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.error(f"Failed to subscribe to {len(batch)} topics: {mqtt.error_string(rc)}")
+                return False
+            self._subscriptions.update(batch)
+        if items:
+            packets = (len(items) + batch_size - 1) // batch_size
+            logger.info(f"Subscribed to {len(items)} topics in {packets} SUBSCRIBE packets")
+        return True
     
     def publish_message(self, topic_name: str, payload: str, qos: int = 1, retain: bool = False) -> bool:
-        """Publish message to MQTT topic"""
+        """Publish message to MQTT topic (queued in the outbox while disconnected)"""
+        return self.publish_many([(topic_name, payload, qos, retain)])[0].status != STATUS_FAILED
+    
+    def publish_many(self, messages: Iterable[tuple], wait: bool = False,
+                     timeout: Optional[float] = None) -> List[PublishResult]:
+        """Publish (topic, payload, qos, retain) tuples in order
+        
+        While disconnected, or while older outbox messages are still being
+        replayed, messages go to the MqttOutboxMessage outbox (if
+        MQTT_OUTBOX_ENABLED). Otherwise at most MQTT_PUBLISH_MAX_INFLIGHT
+        messages are unacknowledged at a time. With ``wait`` this returns
+        once every sent message is acknowledged or ``timeout`` expires.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'MQTT_PUBLISH_TIMEOUT', 10)
+        deadline = time.monotonic() + timeout
+        messages = [(topic, normalize_payload(payload), qos, retain) for topic, payload, qos, retain in messages]
+        
+        results = []
+        with self._publish_lock:
+            if getattr(settings, 'MQTT_OUTBOX_ENABLED', True) and (not self.is_connected or self._has_outbox()):
+                MqttOutboxMessage.objects.bulk_create([
+                    MqttOutboxMessage(connection=self.broker, topic=topic, payload=payload, qos=qos, retain=retain)
+                    for topic, payload, qos, retain in messages
+                ])
+                self._outbox_pending = True
+                results = [PublishResult(topic, qos, STATUS_QUEUED) for topic, _, qos, _ in messages]
+                if self.is_connected:
+                    self._start_outbox_replay()
+            else:
+                for topic, payload, qos, retain in messages:
+                    results.append(self._send(topic, payload, qos, retain, deadline))
+        
+        if wait:
+            self.publisher.wait(results, max(0, deadline - time.monotonic()))
+        return results
+    
+    def _send(self, topic: str, payload: str, qos: int, retain: bool, deadline: float) -> PublishResult:
+        """Hand one message to paho inside the in-flight window"""
         if not self.is_connected:
-            logger.warning("Not connected to MQTT broker")
-            return False
-            
+            return PublishResult(topic, qos, STATUS_FAILED, error='Not connected to MQTT broker', retryable=True)
+        if not self.publisher.acquire(max(0, deadline - time.monotonic())):
+            metrics.publish_failures.inc(topic)
+            return PublishResult(topic, qos, STATUS_FAILED, error='Timed out waiting for the in-flight window',
+                                 retryable=True)
+        
         try:
-            result = self.client.publish(topic_name, payload, qos, retain)
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"Published message to {topic_name}")
-                return True
-            else:
-                logger.error(f"Failed to publish message to {topic_name}: {result.rc}")
-                return False
+            info = self.client.publish(topic, payload, qos, retain)
         except Exception as e:
+            self.publisher.release()
+            metrics.publish_failures.inc(topic)
             logger.error(f"Error publishing message: {e}")
-            return False
+            # paho raises ValueError for an invalid topic, QoS or payload, which no retry fixes
+            return PublishResult(topic, qos, STATUS_FAILED, error=str(e),
+                                 retryable=not isinstance(e, (ValueError, TypeError)))
+        
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.publisher.release()
+            metrics.publish_failures.inc(topic)
+            hot_path_logger.error('publish_failed', "Failed to publish message to %s: %s", topic, info.rc)
+            return PublishResult(topic, qos, STATUS_FAILED, error=mqtt.error_string(info.rc),
+                                 retryable=info.rc not in PERMANENT_PUBLISH_ERRORS)
+        
+        result = PublishResult(topic, qos, STATUS_SENT, mid=info.mid)
+        self.publisher.track(result)
+        metrics.messages_published.inc(topic, qos)
+        hot_path_logger.info('published', "Published message to %s", topic)
+        return result
     
-    def add_message_callback(self, callback: Callable):
-        """Add callback untuk handle incoming messages"""
+    def _has_outbox(self) -> bool:
+        if self._outbox_pending is None:
+            self._outbox_pending = self._outbox().exists()
+        return self._outbox_pending
+    
+    def _outbox(self):
+        """Outbox rows of this service's broker (rows without a broker belong to the default one)"""
+        if self.broker is not None:
+            return MqttOutboxMessage.objects.filter(connection=self.broker)
+        return MqttOutboxMessage.objects.filter(connection__isnull=True)
+    
+    def _start_outbox_replay(self):
+        """Replay the outbox on a background thread (the network thread must keep running for acks)"""
+        if not getattr(settings, 'MQTT_OUTBOX_ENABLED', True):
+            return
+        if self._outbox_thread and self._outbox_thread.is_alive():
+            return
+        self._outbox_thread = threading.Thread(target=self._replay_outbox, name='mqtt-outbox', daemon=True)
+        self._outbox_thread.start()
+    
+    def _replay_outbox(self):
+        """Publish outbox messages oldest first, deleting them once acknowledged
+        
+        Rows still waiting for their ack are not sent again. Transient
+        failures (full in-flight window, lost connection) are counted in
+        ``attempts``/``last_error`` and retried; only a permanent error (e.g.
+        an invalid topic) drops a row.
+        """
+        close_old_connections()
+        timeout = getattr(settings, 'MQTT_PUBLISH_TIMEOUT', 10)
+        sent = self._outbox_sent
+        replayed = 0
+        try:
+            while self.is_connected:
+                replayed += self._settle_outbox()
+                room = self.publisher.max_inflight - len(sent)
+                rows = []
+                if room > 0:
+                    rows = list(self._outbox().exclude(id__in=list(sent)).order_by('id')[:room])
+                if not rows:
+                    if sent:
+                        self.publisher.wait(list(sent.values()), timeout)
+                        continue
+                    with self._publish_lock:
+                        # Checked under the publish lock so no new message can slip in behind the replay
+                        if not self._outbox().exists():
+                            self._outbox_pending = False
+                            break
+                    continue
+                
+                deadline = time.monotonic() + timeout
+                sent_ids = []
+                dropped = []
+                for row in rows:
+                    result = self._send(row.topic, row.payload, row.qos, row.retain, deadline)
+                    if result.status == STATUS_SENT:
+                        sent[row.id] = result
+                        sent_ids.append(row.id)
+                    elif result.retryable:
+                        # Stop here so the outbox keeps its order, the row is tried again next round
+                        MqttOutboxMessage.objects.filter(id=row.id).update(attempts=F('attempts') + 1,
+                                                                          last_error=result.error)
+                        break
+                    else:
+                        # Permanent error, do not block the rest of the outbox
+                        logger.error(f"Dropping outbox message {row.id} for {row.topic}: {result.error}")
+                        dropped.append(row.id)
+                
+                MqttOutboxMessage.objects.filter(id__in=sent_ids).update(attempts=F('attempts') + 1)
+                MqttOutboxMessage.objects.filter(id__in=dropped).delete()
+                replayed += len(dropped)
+                self.publisher.wait(list(sent.values()), max(0, deadline - time.monotonic()))
+            
+            replayed += self._settle_outbox()
+            if replayed:
+                logger.info(f"Replayed {replayed} outbox messages")
+        except Exception as e:
+            logger.error(f"Error replaying MQTT outbox: {e}")
+        finally:
+            close_old_connections()
+    
+    def _settle_outbox(self) -> int:
+        """Delete acknowledged outbox rows, returns how many
+        
+        Rows the tracker forgot without an ack (``reset`` after a clean
+        session) become due again.
+        """
+        sent = self._outbox_sent
+        acked = [row_id for row_id, result in sent.items() if result.acknowledged]
+        lost = [row_id for row_id, result in sent.items()
+                if not result.acknowledged and not self.publisher.is_tracked(result)]
+        for row_id in acked + lost:
+            sent.pop(row_id, None)
+        if acked:
+            MqttOutboxMessage.objects.filter(id__in=acked).delete()
+        return len(acked)
+    
+    def add_message_callback(self, callback: Callable, topic_filter: str = '#'):
+        """Add callback untuk handle incoming messages on topics matching topic_filter"""
+        self.dispatcher.add(callback, topic_filter)
+    
+    def remove_message_callback(self, callback: Callable, topic_filter: Optional[str] = None):
+        """Remove message callback (for every topic filter unless one is given)"""
+        self.dispatcher.remove(callback, topic_filter)
+    
+    def callback_stats(self) -> list:
+        """Per-callback call counts and timings"""
+        return self.dispatcher.stats()
+    
+    def add_status_callback(self, callback: Callable):
+        """Add callback untuk handle connection status changes"""
         with self._lock:
-            self._message_callbacks.append(callback)
+            self._status_callbacks.append(callback)
     
-    def remove_message_callback(self, callback: Callable):
-        """Remove message callback"""
+    def remove_status_callback(self, callback: Callable):
+        """Remove status callback"""
         with self._lock:
-            if callback in self._message_callbacks:
-                self._message_callbacks.remove(callback)
+            if callback in self._status_callbacks:
+                self._status_callbacks.remove(callback)
+    
+    def get_status(self) -> dict:
+        """Current connection status from memory"""
+        record = self.connection_record
+        return {
+            'connection_id': record.pk if record else None,
+            'is_connected': self.is_connected,
+            'status': record.status if record else 'disconnected',
+            'broker_host': record.broker_host if record else '',
+            'broker_port': record.broker_port if record else 1883,
+            'last_connected': record.last_connected.isoformat() if record and record.last_connected else None,
+            'last_error': record.last_error if record else '',
+        }
+    
+    def pipelines(self) -> list:
+        """(name, pipeline) for the default ORM pipeline and every sink route"""
+        pipelines = []
+        if self.pipeline:
+            pipelines.append((self.pipeline.name, self.pipeline))
+        if self.sinks:
+            pipelines.extend((route.pipeline.name, route.pipeline) for route in self.sinks.routes)
+        return pipelines
+    
+    def collect_metrics(self):
+        """Scrape-time values for the metrics registry"""
+        pipelines = self.pipelines()
+
+        yield ('mqtt_connected', 'gauge', 'Whether the client is connected to the broker',
+               [((), (), int(self.is_connected))])
+        yield ('mqtt_ingest_queue_depth', 'gauge', 'Messages waiting in an ingest queue',
+               [(('pipeline',), (name,), pipeline.depth) for name, pipeline in pipelines])
+        yield ('mqtt_ingest_records_total', 'counter', 'Ingest queue records by outcome',
+               [(('pipeline', 'state'), (name, state), pipeline.stats[state])
+                for name, pipeline in pipelines for state in ('enqueued', 'written', 'dropped', 'spilled')])
+        yield ('mqtt_ingest_failed_batches_total', 'counter', 'Ingest batches whose write raised',
+               [(('pipeline',), (name,), pipeline.stats['failed_batches']) for name, pipeline in pipelines])
+        yield ('mqtt_publish_inflight', 'gauge', 'Published messages waiting for acknowledgement',
+               [((), (), self.publisher.inflight)])
+        yield ('mqtt_callback_pending', 'gauge', 'Messages waiting for message callbacks',
+               [((), (), self.dispatcher.pending)])
+        yield ('mqtt_callback_dropped_total', 'counter', 'Messages dropped because callbacks fell behind',
+               [(('handler',), (stats['handler'],), stats['dropped']) for stats in self.dispatcher.stats()])
+        yield ('mqtt_topic_cache_hits_total', 'counter', 'Topic id cache hits',
+               [((), (), self.topic_cache.hits)])
+        yield ('mqtt_topic_cache_misses_total', 'counter', 'Topic id cache misses',
+               [((), (), self.topic_cache.misses)])
+        yield ('mqtt_retention_deleted_total', 'counter', 'Messages deleted by the retention engine',
+               [((), (), self.retention.stats['deleted'])])
+        yield ('mqtt_payloads_compressed_total', 'counter', 'Stored payloads compressed with the topic compression',
+               [((), (), self.payloads.stats['compressed'])])
+        yield ('mqtt_payloads_offloaded_total', 'counter', 'Stored payloads offloaded to file storage',
+               [((), (), self.payloads.stats['offloaded'])])
+        yield ('mqtt_payload_compression_ratio', 'gauge', 'Stored bytes per payload byte, for payloads checked for compression',
+               [((), (), self.payloads.stats['bytes_stored'] / self.payloads.stats['bytes_in']
+                 if self.payloads.stats['bytes_in'] else 1.0)])
+        yield ('mqtt_search_documents_total', 'counter', 'Payloads added to the full-text index',
+               [((), (), self.search.stats['documents'])])
+        yield ('mqtt_search_keys_total', 'counter', 'JSON key values added to the key index',
+               [((), (), self.search.stats['keys'])])
+        yield ('mqtt_last_value_topics', 'gauge', 'Topics with a value in the last value cache of this process',
+               [((), (), len(self.last_values))])
+        yield ('mqtt_dedup_checked_total', 'counter', 'QoS 1/2 messages checked against the dedup filter',
+               [((), (), self.dedup.stats['checked'])])
+        yield ('mqtt_connection_transitions_total', 'counter', 'Connection status changes',
+               [((), (), self.connection_state.stats['transitions'])])
+        yield ('mqtt_connection_writes_total', 'counter', 'Coalesced connection status writes to the database',
+               [((), (), self.connection_state.stats['writes'])])
     
-    def _on_connect(self, client, userdata, flags, rc):
+    def _notify_status(self):
+        status = self.get_status()
+        # The status snapshot describes the default broker, see ConnectionManager for the others
+        if self.broker is None:
+            self.status.publish_connection(status)
+        with self._lock:
+            callbacks = list(self._status_callbacks)
+        if not callbacks:
+            return
+        for callback in callbacks:
+            try:
+                callback(status)
+            except Exception as e:
+                logger.error(f"Error in status callback: {e}")
+    
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback when connected to broker"""
+        metrics.connects.inc('success' if rc == 0 else 'failure')
         if rc == 0:
             self.is_connected = True
+            self.backoff.reset()
+            session_present = self.persistent_session and bool(flags.get('session present'))
+            if not session_present:
+                # New session on the broker, nothing is subscribed yet
+                self._subscriptions.clear()
             if self.connection_record:
-                self.connection_record.status = 'connected'
-                self.connection_record.last_connected = timezone.now()
-                self.connection_record.last_error = ''
-                self.connection_record.save()
+                self.connection_state.transition(self.connection_record, 'connected', status='connected',
+                                                 last_connected=timezone.now(), last_error='')
             
-            logger.info("Connected to MQTT broker")
+            logger.info(f"Connected to MQTT broker{' (session resumed)' if session_present else ''}")
+            self._notify_status()
             self.subscribe_to_topics()
+            self._record_recovery()
+            self._start_outbox_replay()
         else:
             logger.error(f"Failed to connect to MQTT broker: {rc}")
             if self.connection_record:
-                self.connection_record.status = 'error'
-                self.connection_record.last_error = f"Connection failed with code {rc}"
-                self.connection_record.save()
+                self.connection_state.transition(self.connection_record, 'refused', status='error',
+                                                 last_error=f"Connection failed with code {rc}")
+            self._notify_status()
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback when disconnected from broker"""
+        metrics.disconnects.inc('clean' if rc == 0 else 'unexpected')
         self.is_connected = False
+        if rc == 0:
+            self._disconnected_at = None
+        else:
+            if self._disconnected_at is None:
+                self._disconnected_at = time.monotonic()
+            self._next_reconnect_delay()
         if self.connection_record:
-            self.connection_record.status = 'disconnected'
-            self.connection_record.save()
+            self.connection_state.transition(self.connection_record, 'disconnected' if rc == 0 else 'lost',
+                                             status='disconnected')
+        self._notify_status()
         logger.info("Disconnected from MQTT broker")
     
+    def _on_connect_fail(self, client, userdata):
+        """Callback when paho's reconnect attempt could not open a connection"""
+        hot_path_logger.error('reconnect', "MQTT reconnect to %s failed", self.label)
+        self._next_reconnect_delay()
+    
+    def _next_reconnect_delay(self):
+        """Give paho's network thread the next jittered delay (the asyncio engine schedules its own)"""
+        if self.engine is not None or not self.client:
+            return
+        delay = self.backoff.next_delay()
+        # paho waits min(previous * 2, max_delay), pinning both bounds applies our delay
+        self.client.reconnect_delay_set(delay, delay)
+        metrics.reconnect_attempts.inc(self.label)
+    
+    def _record_recovery(self):
+        """Time from losing the broker to being connected and resubscribed"""
+        if self._disconnected_at is None:
+            return
+        self.last_recovery_seconds = time.monotonic() - self._disconnected_at
+        self._disconnected_at = None
+        metrics.recovery_seconds.observe(self.last_recovery_seconds, self.label)
+        logger.info(f"Recovered MQTT connection to {self.label} in {self.last_recovery_seconds:.1f}s")
+    
     def _on_message(self, client, userdata, msg):
-        """Callback when message received"""
+        """Callback when message received, only enqueues for the writer thread"""
         try:
-            topic_name = msg.topic
-            payload = msg.payload.decode('utf-8')
+            if not self.owns_topic(msg.topic):
+                return
+            metrics.messages_received.inc(msg.topic, msg.qos)
+            if self.dedup_enabled and self.dedup.is_duplicate(msg.topic, msg.payload, msg.qos, msg.mid, msg.dup):
+                metrics.duplicates_dropped.inc('filter')
+                return
+            if not self.pipeline:
+                self.setup_pipeline()
+            if not self.sinks:
+                self.setup_sinks()
             
-            # Get or create topic
-            topic, created = MqttTopic.objects.get_or_create(
-                name=topic_name,
-                defaults={'description': f'Auto-created topic for {topic_name}'}
-            )
-            
-            # Save message
-            message = MqttMessage.objects.create(
-                topic=topic,
-                payload=payload,
+            # Topics matching MQTT_SINKS go to their own sink, the rest to the ORM pipeline
+            route = self.sinks.route_for(msg.topic)
+            pipeline = route.pipeline if route else self.pipeline
+            if not pipeline.is_running:
+                pipeline.start()
+                
+            # Waiting for room would stall the asyncio engine's event loop, so it never blocks
+            pipeline.submit(IngestRecord(
+                topic=msg.topic,
+                payload=msg.payload,
                 qos=msg.qos,
                 retain=msg.retain,
-                timestamp=timezone.now()
-            )
-            
-            # Clean up old messages if needed
-            max_messages = getattr(settings, 'MQTT_MAX_STORED_MESSAGES', 1000)
-            if topic.messages.count() > max_messages:
-                old_messages = topic.messages.all()[max_messages:]
-                MqttMessage.objects.filter(id__in=[m.id for m in old_messages]).delete()
-            
-            logger.info(f"Received message from {topic_name}: {payload[:100]}...")
-            
-            # Call registered callbacks
-            with self._lock:
-                for callback in self._message_callbacks:
-                    try:
-                        callback(topic, message)
-                    except Exception as e:
-                        logger.error(f"Error in message callback: {e}")
-                        
+                timestamp=timezone.now(),
+                packet_id=msg.mid,
+                dup=bool(msg.dup),
+            ), block=self.engine is None)
         except Exception as e:
-            logger.error(f"Error processing MQTT message: {e}")
+            logger.error(f"Error queueing MQTT message: {e}")
+    
+    def filter_stored(self, records: List[IngestRecord]):
+        """Drop redeliveries whose content hash is already stored, returns (records, hashes)
+        
+        Only with MQTT_DEDUP_CONTENT_HASH, otherwise every record is kept and
+        the hashes are None. A record that is not a redelivery (no DUP flag,
+        see ``MessageDeduplicator.drops``) but repeats a stored hash, e.g.
+        after its packet id wrapped, is kept without a hash. Costs one
+        indexed lookup per batch.
+        """
+        if not self.content_hashes:
+            return records, [None] * len(records)
+        hashes = [
+            self.dedup.content_hash(record.topic, record.payload, record.packet_id, record.timestamp)
+            for record in records
+        ]
+        stored = set(MqttMessage.objects.filter(content_hash__in=set(hashes)).values_list('content_hash', flat=True))
+        kept, kept_hashes = [], []
+        for record, value in zip(records, hashes):
+            if value in stored:
+                if self.dedup.drops(record.dup):
+                    continue
+                value = None
+            # Also catches repeats within the batch
+            stored.add(value)
+            kept.append(record)
+            kept_hashes.append(value)
+        if len(kept) < len(records):
+            metrics.duplicates_dropped.inc('stored', amount=len(records) - len(kept))
+        return kept, kept_hashes
+    
+    def forget_topics(self, records: List[IngestRecord]):
+        """Drop the cached ids of a batch's topics, one may have been deleted by another process"""
+        for name in {record.topic for record in records}:
+            self.topic_cache.invalidate(name=name)
     
-    def _on_subscribe(self, client, userdata, mid, granted_qos):
+    def _insert_batch(self, records):
+        """Insert messages, readings and search entries in one transaction, returns (messages, topics, written)
+        
+        Returns None when every record was a stored duplicate.
+        """
+        records, hashes = self.filter_stored(records)
+        if not records:
+            return None
+        # Resolve topic ids from the cache, only unknown topics hit the database
+        topic_ids = self.topic_cache.resolve(record.topic for record in records)
+        # Lightweight topic instances for callbacks, avoids loading full rows
+        topics = {name: MqttTopic(id=topic_id, name=name) for name, topic_id in topic_ids.items()}
+        
+        messages = []
+        texts = []
+        readings = []
+        received_at = timezone.now()
+        for record, value in zip(records, hashes):
+            topic = topics[record.topic]
+            # Decoded once here, readers use payload_encoding and MqttReading
+            decoded = decode_payload(record.payload, *self.codecs.codec_for(topic.id))
+            packed = self.payloads.pack(topic.id, decoded.text, received_at)
+            messages.append(MqttMessage(
+                content_hash=value,
+                topic=topic,
+                payload=packed.payload,
+                payload_size=len(record.payload),
+                payload_encoding=decoded.encoding,
+                payload_compression=packed.compression,
+                payload_blob=packed.blob,
+                payload_file=packed.file,
+                payload_dictionary_id=packed.dictionary_id,
+                qos=record.qos,
+                retain=record.retain,
+                timestamp=record.timestamp
+            ))
+            texts.append(decoded.text)
+            if decoded.number is not None:
+                readings.append(MqttReading(topic_id=topic.id, ts=record.timestamp, value=decoded.number))
+        
+        # Per-topic totals for the denormalized stats and the retention engine
+        written = {}
+        activity = {}
+        for message in messages:
+            count, size = written.get(message.topic_id, (0, 0))
+            written[message.topic_id] = (count + 1, size + message.payload_size)
+        
+        with metrics.db_write_seconds.time('orm'), transaction.atomic():
+            MqttMessage.objects.bulk_create(messages)
+            if readings:
+                MqttReading.objects.bulk_create(readings)
+                if self.rollups_enabled:
+                    apply_rollups(accumulate((r.topic_id, r.ts, r.value) for r in readings))
+            try:
+                # Savepoint: a failed index write must not lose the batch
+                with transaction.atomic():
+                    self.search.index((message.id, message.topic_id, text, message.received_at)
+                                      for message, text in zip(messages, texts))
+            except Exception as e:
+                logger.error(f"Error indexing MQTT messages for search: {e}")
+            # Callbacks and topic stats get the full text, not the stored form
+            for message, text in zip(messages, texts):
+                message.payload = message.payload_text = text
+            for message in messages:
+                activity[message.topic_id] = (written[message.topic_id][0], message.received_at, message.payload)
+            record_topic_activity(activity)
+        return messages, topics, written
+    
+    def _write_batch(self, records):
+        """Persist a batch of queued messages (runs on the ingest writer thread)"""
+        close_old_connections()
+        try:
+            try:
+                stored = self._insert_batch(records)
+            except IntegrityError as e:
+                # Another writer stored one of the content hashes after filter_stored looked, or
+                # a topic was deleted by another process while its id was cached. The transaction
+                # rolled back, so check the hashes again, re-resolve the topics and retry once
+                logger.warning(f"Retrying MQTT batch after integrity error: {e}")
+                self.forget_topics(records)
+                stored = self._insert_batch(records)
+            if stored is None:
+                return
+            messages, topics, written = stored
+            
+            # Retention only counts here, trimming happens on its own thread
+            for topic_id, (count, size) in written.items():
+                self.retention.record(topic_id, count, size)
+            
+            if self.last_values_enabled:
+                self.last_values.update(
+                    self.last_values.entry(message.topic_id, message.topic.name, message.payload,
+                                           message.payload_encoding, message.qos, message.retain,
+                                           message.timestamp, message.received_at)
+                    for message in messages
+                )
+            
+            logger.debug(f"Stored {len(messages)} messages from {len(topics)} topics")
+            self.status.refresh_stats()
+            
+            # Hand off to the callbacks registered for each topic
+            self.dispatcher.dispatch(messages)
+        finally:
+            close_old_connections()
+    
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
         """Callback when subscribed to topic"""
-        logger.info(f"Subscribed to topic with QoS: {granted_qos}")
+        # 0x80 and above is a refused filter
+        rejected = sum(1 for qos in granted_qos if getattr(qos, 'value', qos) >= 0x80)
+        if rejected:
+            logger.error(f"Broker refused {rejected} of {len(granted_qos)} topic filters (mid {mid})")
+        else:
+            logger.info(f"Subscribed to {len(granted_qos)} topic filters (mid {mid})")
     
     def _on_publish(self, client, userdata, mid):
-        """Callback when message published"""
-        logger.info(f"Message published with mid: {mid}")
+        """Callback when message published (QoS 0 sent, QoS 1/2 acknowledged)"""
+        self.publisher.on_publish(mid)
+        hot_path_logger.info('publish_ack', "Message published with mid: %s", mid)
 
 
 # Global MQTT client instance
-mqtt_service = MqttClientService()
\ No newline at end of file
+mqtt_service = MqttClientService()
+metrics.registry.register_collector(mqtt_service.collect_metrics)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(received_at: datetime, message_id: int) -> str:
+    """Opaque cursor for a (received_at, id) position"""
+    raw = f"{received_at.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        received_at, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(received_at), int(message_id)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(queryset, fields: List[str], limit: int, before: Optional[str] = None,
+                after: Optional[str] = None) -> dict:
+    """Page a MqttMessage queryset newest first on (received_at, id)
+
+    ``before`` returns rows older than the cursor, ``after`` rows newer than
+    it. Rows are fetched as dicts with ``.values(*fields)``; cost depends on
+    the page size only, not on how deep the cursor is.
+    """
+    fields = list(dict.fromkeys(list(fields) + ['id', 'received_at']))
+
+    if after:
+        received_at, message_id = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(received_at__gt=received_at) | Q(received_at=received_at, id__gt=message_id)
+        ).order_by('received_at', 'id')
+    else:
+        if before:
+            received_at, message_id = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(received_at__lt=received_at) | Q(received_at=received_at, id__lt=message_id)
+            )
+        queryset = queryset.order_by('-received_at', '-id')
+
+    rows = list(queryset.values(*fields)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+
+    return {
+        'rows': rows,
+        'has_older': has_more if not after else True,
+        'has_newer': has_more if after else bool(before),
+        'next_cursor': encode_cursor(rows[-1]['received_at'], rows[-1]['id']) if rows else None,
+        'prev_cursor': encode_cursor(rows[0]['received_at'], rows[0]['id']) if rows else None,
+    }
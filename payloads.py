@@ -0,0 +1,175 @@
+import base64
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_TEXT = 'text'
+CODEC_JSON = 'json'
+CODEC_NUMBER = 'number'
+CODEC_RAW = 'raw'
+CODEC_CBOR = 'cbor'
+CODEC_MSGPACK = 'msgpack'
+
+CODEC_CHOICES = [
+    (CODEC_TEXT, 'Text (UTF-8)'),
+    (CODEC_JSON, 'JSON'),
+    (CODEC_NUMBER, 'Numeric scalar'),
+    (CODEC_RAW, 'Raw bytes'),
+    (CODEC_CBOR, 'CBOR'),
+    (CODEC_MSGPACK, 'MessagePack'),
+]
+
+# How MqttMessage.payload holds the original bytes
+ENCODING_TEXT = 'text'
+ENCODING_JSON = 'json'
+ENCODING_BASE64 = 'base64'
+
+ENCODING_CHOICES = [
+    (ENCODING_TEXT, 'Text'),
+    (ENCODING_JSON, 'JSON (transcoded from a binary codec)'),
+    (ENCODING_BASE64, 'Base64'),
+]
+
+
+class DecodedPayload:
+    """Result of decoding one payload at ingest"""
+    __slots__ = ('text', 'encoding', 'number')
+
+    def __init__(self, text: str, encoding: str, number: Optional[float] = None):
+        self.text = text
+        self.encoding = encoding
+        self.number = number
+
+
+def _as_number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return number if math.isfinite(number) else None
+    if isinstance(value, str):
+        try:
+            return _as_number(float(value))
+        except ValueError:
+            return None
+    return None
+
+
+def extract_value(value, value_path: str = ''):
+    """Value at a dotted path (``sensor.temp``, ``values.0``) of a decoded document, None when missing"""
+    if value_path:
+        for key in value_path.split('.'):
+            if isinstance(value, dict):
+                value = value.get(key)
+            elif isinstance(value, list) and key.lstrip('-').isdigit():
+                index = int(key)
+                value = value[index] if -len(value) <= index < len(value) else None
+            else:
+                return None
+    return value
+
+
+def extract_number(value, value_path: str = '') -> Optional[float]:
+    """Numeric value at a dotted path of a decoded document"""
+    return _as_number(extract_value(value, value_path))
+
+
+def _base64(payload: bytes) -> DecodedPayload:
+    return DecodedPayload(base64.b64encode(payload).decode('ascii'), ENCODING_BASE64)
+
+
+def _structured(payload: bytes, loads, value_path: str) -> DecodedPayload:
+    """Binary document codecs are stored as JSON text so readers never need the codec"""
+    value = loads(payload)
+    return DecodedPayload(json.dumps(value, default=str), ENCODING_JSON, extract_number(value, value_path))
+
+
+def decode_payload(payload: bytes, codec: str = CODEC_TEXT, value_path: str = '') -> DecodedPayload:
+    """Decode a raw payload once: storable text plus the numeric reading, if any
+
+    Payloads that do not fit their codec are kept instead of dropped: as text
+    when they are UTF-8, otherwise base64.
+    """
+    if codec == CODEC_RAW:
+        return _base64(payload)
+
+    try:
+        if codec == CODEC_CBOR and cbor2 is not None:
+            return _structured(payload, cbor2.loads, value_path)
+        if codec == CODEC_MSGPACK and msgpack is not None:
+            return _structured(payload, lambda data: msgpack.unpackb(data, raw=False), value_path)
+    except Exception as e:
+        logger.debug(f"Could not decode {codec} payload: {e}")
+
+    try:
+        text = payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return _base64(payload)
+
+    number = None
+    if codec == CODEC_JSON:
+        try:
+            number = extract_number(json.loads(text), value_path)
+        except ValueError:
+            pass
+    elif codec == CODEC_NUMBER:
+        number = _as_number(text.strip())
+    return DecodedPayload(text, ENCODING_TEXT, number)
+
+
+class CodecRegistry:
+    """Topic id -> (codec, value_path) for topics that do not use the default text codec
+
+    Loaded with one query and reloaded every MQTT_CODEC_REFRESH_INTERVAL
+    seconds, or on the next lookup after a topic is saved.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'MQTT_CODEC_REFRESH_INTERVAL', 30)
+        self.refresh_interval = refresh_interval
+        self._codecs: Dict[int, Tuple[str, str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def refresh(self):
+        from .models import MqttTopic
+
+        rows = MqttTopic.objects.exclude(payload_codec=CODEC_TEXT).values_list('id', 'payload_codec', 'value_path')
+        codecs = {topic_id: (codec, value_path) for topic_id, codec, value_path in rows}
+        for codec in set(codec for codec, _ in codecs.values()):
+            if (codec == CODEC_CBOR and cbor2 is None) or (codec == CODEC_MSGPACK and msgpack is None):
+                logger.error(f"Topics use the {codec} codec but its package is not installed, storing them as raw")
+        with self._lock:
+            self._codecs = codecs
+            self._loaded_at = time.monotonic()
+
+    def codec_for(self, topic_id: int) -> Tuple[str, str]:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_interval:
+            self.refresh()
+        return self._codecs.get(topic_id, (CODEC_TEXT, ''))
+
+
+# Global codec registry
+codec_registry = CodecRegistry()
@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+STATUS_SENT = 'sent'
+STATUS_QUEUED = 'queued'
+STATUS_FAILED = 'failed'
+
+
+class PublishResult:
+    """Outcome of one publish: sent (with a mid), queued in the outbox, or failed
+
+    ``retryable`` marks failures that may succeed later (not connected, full
+    in-flight window, paho queue full), as opposed to e.g. an invalid topic.
+    """
+    __slots__ = ('topic', 'qos', 'mid', 'status', 'error', 'retryable', '_acked')
+
+    def __init__(self, topic: str, qos: int, status: str, mid: Optional[int] = None, error: str = '',
+                 retryable: bool = False):
+        self.topic = topic
+        self.qos = qos
+        self.status = status
+        self.mid = mid
+        self.error = error
+        self.retryable = retryable
+        self._acked = threading.Event()
+
+    @property
+    def acknowledged(self) -> bool:
+        """PUBACK/PUBCOMP received (for QoS 0: handed to the socket)"""
+        return self._acked.is_set()
+
+    def to_dict(self) -> dict:
+        data = {
+            'topic': self.topic,
+            'status': self.status,
+            'mid': self.mid,
+            'acknowledged': self.acknowledged,
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class PublishTracker:
+    """In-flight window of published messages keyed by mid
+
+    ``acquire`` blocks while ``max_inflight`` messages are unacknowledged,
+    so bulk publishing cannot pile up an unbounded queue inside paho.
+    ``on_publish`` is fed from the client's on_publish callback.
+    """
+
+    def __init__(self, max_inflight: int = 100):
+        self.max_inflight = max(1, max_inflight)
+        self._inflight: Dict[int, PublishResult] = {}
+        # Acks that arrived before publish() returned the mid
+        self._early_acks = set()
+        self._reserved = 0
+        self._cond = threading.Condition()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight) + self._reserved
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Reserve a slot in the window"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.inflight >= self.max_inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._reserved += 1
+            return True
+
+    def release(self):
+        """Give back a reserved slot that was not used"""
+        with self._cond:
+            self._reserved -= 1
+            self._cond.notify_all()
+
+    def track(self, result: PublishResult):
+        """Turn a reserved slot into an in-flight message"""
+        with self._cond:
+            self._reserved -= 1
+            if result.mid in self._early_acks:
+                self._early_acks.discard(result.mid)
+                result._acked.set()
+            else:
+                self._inflight[result.mid] = result
+            self._cond.notify_all()
+
+    def is_tracked(self, result: PublishResult) -> bool:
+        """Whether a sent message is still waiting for its ack (False once acked or after ``reset``)"""
+        with self._cond:
+            return self._inflight.get(result.mid) is result
+
+    def on_publish(self, mid: int):
+        with self._cond:
+            result = self._inflight.pop(mid, None)
+            if result is None:
+                self._early_acks.add(mid)
+                if len(self._early_acks) > 10 * self.max_inflight:
+                    # Acks for messages published outside the tracker
+                    self._early_acks.clear()
+            else:
+                result._acked.set()
+            self._cond.notify_all()
+
+    def reset(self):
+        """Forget in-flight messages, e.g. after a disconnect with a clean session"""
+        with self._cond:
+            self._inflight.clear()
+            self._early_acks.clear()
+            self._cond.notify_all()
+
+    def wait(self, results: Iterable[PublishResult], timeout: Optional[float] = None) -> bool:
+        """Wait until every sent result is acknowledged, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for result in results:
+            if result.status != STATUS_SENT:
+                continue
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not result._acked.wait(remaining):
+                return False
+        return True
+
+
+def normalize_payload(payload) -> str:
+    """Payload as text, JSON-encoding anything that is not already a string"""
+    if isinstance(payload, str):
+        return payload
+    if isinstance(payload, bytes):
+        return payload.decode('utf-8')
+    return json.dumps(payload)
+
+
+def summarize(results: List[PublishResult]) -> Dict[str, int]:
+    summary = {STATUS_SENT: 0, STATUS_QUEUED: 0, STATUS_FAILED: 0, 'acknowledged': 0}
+    for result in results:
+        summary[result.status] += 1
+        summary['acknowledged'] += result.acknowledged
+    return summary
@@ -0,0 +1,35 @@
+import random
+from typing import Optional
+
+from django.conf import settings
+
+
+class ReconnectBackoff:
+    """Exponential reconnect delays with jitter
+
+    The n-th delay after losing the broker is drawn uniformly from
+    ``[min_delay, min(max_delay, min_delay * 2**n)]``, so clients dropped by
+    the same broker restart spread their reconnects out instead of arriving
+    in lockstep. ``reset`` is called once a connection is accepted.
+    """
+
+    # 2**32 * min_delay is beyond any sensible max_delay
+    MAX_EXPONENT = 32
+
+    def __init__(self, min_delay: Optional[float] = None, max_delay: Optional[float] = None):
+        if min_delay is None:
+            min_delay = getattr(settings, 'MQTT_RECONNECT_MIN_DELAY', 1.0)
+        if max_delay is None:
+            max_delay = getattr(settings, 'MQTT_RECONNECT_MAX_DELAY', 120)
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Delay before the next attempt, widening the range with every call"""
+        cap = min(self.max_delay, self.min_delay * 2 ** min(self.attempts, self.MAX_EXPONENT))
+        self.attempts += 1
+        return random.uniform(self.min_delay, cap)
+
+    def reset(self):
+        self.attempts = 0
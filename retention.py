@@ -0,0 +1,366 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archive_messages
+from .compression import payload_store
+from .models import MqttTopic, MqttMessage, MqttReading, MqttRollup
+from .rollups import RESOLUTIONS, retention_for
+from .search import search_index
+from .stats import count_by_topic, decrement_message_counts
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Limits applied to the stored history of one topic"""
+    __slots__ = ('max_messages', 'max_age', 'max_bytes')
+
+    def __init__(self, max_messages: Optional[int] = None, max_age: Optional[timedelta] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def default(cls) -> 'RetentionPolicy':
+        """Policy from MQTT_MAX_STORED_MESSAGES / MQTT_MAX_MESSAGE_AGE / MQTT_MAX_STORED_BYTES"""
+        max_age = getattr(settings, 'MQTT_MAX_MESSAGE_AGE', None)
+        if max_age is not None and not isinstance(max_age, timedelta):
+            max_age = timedelta(seconds=max_age)
+        return cls(
+            max_messages=getattr(settings, 'MQTT_MAX_STORED_MESSAGES', 1000),
+            max_age=max_age,
+            max_bytes=getattr(settings, 'MQTT_MAX_STORED_BYTES', None),
+        )
+
+    def merge(self, max_messages=None, max_age=None, max_bytes=None) -> 'RetentionPolicy':
+        """Return a copy with per-topic overrides applied"""
+        return RetentionPolicy(
+            max_messages=max_messages if max_messages is not None else self.max_messages,
+            max_age=max_age if max_age is not None else self.max_age,
+            max_bytes=max_bytes if max_bytes is not None else self.max_bytes,
+        )
+
+
+class RetentionEngine:
+    """Background trimming of stored messages
+
+    The ingest path only calls ``record`` which updates in-memory counters,
+    seeded from ``MqttTopic.message_count`` the first time a topic is seen. Topics are trimmed by a
+    background thread on a fixed interval, or earlier once a topic grows past
+    its limit by more than the watermark fraction. Each trim is a single
+    ``DELETE ... WHERE topic_id = ? AND received_at <= cutoff`` served by the
+    ``(topic, -received_at)`` index, with the id of the cutoff row breaking
+    ties on received_at. With MQTT_ARCHIVE_EXPIRED enabled,
+    messages past their max_age are moved to MqttMessageArchive instead.
+    """
+
+    def __init__(self, interval: Optional[float] = None, watermark: Optional[float] = None):
+        self.interval = interval if interval is not None else getattr(settings, 'MQTT_RETENTION_INTERVAL', 60)
+        self.watermark = watermark if watermark is not None else getattr(settings, 'MQTT_RETENTION_WATERMARK', 0.1)
+        self.archive_expired = getattr(settings, 'MQTT_ARCHIVE_EXPIRED', False)
+        self.reading_max_age = getattr(settings, 'MQTT_READING_MAX_AGE', None)
+        self.sweep_interval = getattr(settings, 'MQTT_PAYLOAD_SWEEP_INTERVAL', 3600)
+        self._swept_at: Optional[float] = None
+        self.default_policy = RetentionPolicy.default()
+        # Age expiry across all topics; disabled on all but one worker in multi-worker mode
+        self.global_expiry = True
+
+        self._policies: Dict[int, RetentionPolicy] = {}
+        self._counts: Dict[int, int] = {}
+        self._bytes: Dict[int, int] = {}
+        self._seen = set()
+        self._due = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.stats = {
+            'passes': 0,
+            'deleted': 0,
+            'readings_deleted': 0,
+            'rollups_deleted': 0,
+            'payload_files_deleted': 0,
+            'search_entries_deleted': 0,
+        }
+
+    def start(self):
+        """Start the background trim thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='mqtt-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def policy_for(self, topic_id: int) -> RetentionPolicy:
+        return self._policies.get(topic_id, self.default_policy)
+
+    def record(self, topic_id: int, count: int, size: int):
+        """Account for newly stored messages, O(1) per call"""
+        policy = self.policy_for(topic_id)
+        slack = 1 + self.watermark
+        with self._lock:
+            due = False
+            self._seen.add(topic_id)
+            if topic_id in self._counts:
+                self._counts[topic_id] += count
+                if policy.max_messages is not None and self._counts[topic_id] > policy.max_messages * slack:
+                    due = True
+            if topic_id in self._bytes:
+                self._bytes[topic_id] += size
+                if policy.max_bytes is not None and self._bytes[topic_id] > policy.max_bytes * slack:
+                    due = True
+            if due:
+                self._due.add(topic_id)
+        if due:
+            self._wakeup.set()
+
+    def refresh_policies(self):
+        """Reload per-topic overrides (one query)"""
+        self.default_policy = RetentionPolicy.default()
+        rows = MqttTopic.objects.filter(
+            Q(max_messages__isnull=False) | Q(max_age__isnull=False) | Q(max_bytes__isnull=False)
+        ).values_list('id', 'max_messages', 'max_age', 'max_bytes')
+        self._policies = {
+            topic_id: self.default_policy.merge(max_messages, max_age, max_bytes)
+            for topic_id, max_messages, max_age, max_bytes in rows
+        }
+
+    def run_once(self, topic_ids=None) -> int:
+        """Trim the given topics (all topics when None), returns number of deleted messages"""
+        self.refresh_policies()
+        if topic_ids is None:
+            topic_ids = MqttTopic.objects.values_list('id', flat=True)
+
+        deleted = 0
+        for topic_id in topic_ids:
+            try:
+                deleted += self.trim_topic(topic_id)
+            except Exception as e:
+                logger.error(f"Error trimming messages for topic {topic_id}: {e}")
+
+        self.stats['passes'] += 1
+        self.stats['deleted'] += deleted
+        return deleted
+
+    def run_scheduled(self) -> int:
+        """Periodic pass: expire old messages and trim topics written since the last pass"""
+        self.refresh_policies()
+        deleted = 0
+
+        # Topics without their own max_age share one range delete on received_at
+        if self.global_expiry and self.default_policy.max_age is not None:
+            cutoff_time = timezone.now() - self.default_policy.max_age
+            overridden = [topic_id for topic_id, policy in self._policies.items()
+                          if policy.max_age != self.default_policy.max_age]
+            deleted += self._expire(cutoff_time, exclude_topic_ids=overridden)
+
+        if self.global_expiry and self.reading_max_age is not None:
+            self.expire_readings()
+        if self.global_expiry:
+            self.expire_rollups()
+            if self._swept_at is None or time.monotonic() - self._swept_at >= self.sweep_interval:
+                self.sweep_payload_files()
+                self.sweep_search_index()
+
+        with self._lock:
+            topic_ids = set(self._due)
+            self._due.clear()
+            seen, self._seen = self._seen, set()
+            unknown_counts = [topic_id for topic_id in seen if topic_id not in self._counts]
+
+        # Seed counters from the maintained MqttTopic.message_count
+        stored = dict(MqttTopic.objects.filter(id__in=unknown_counts).values_list('id', 'message_count'))
+        with self._lock:
+            for topic_id, count in stored.items():
+                self._counts.setdefault(topic_id, count)
+            for topic_id in seen:
+                policy = self.policy_for(topic_id)
+                if policy.max_messages is not None and self._counts.get(topic_id, 0) > policy.max_messages:
+                    topic_ids.add(topic_id)
+                if policy.max_bytes is not None and topic_id not in self._bytes:
+                    topic_ids.add(topic_id)
+        if self.global_expiry:
+            topic_ids.update(topic_id for topic_id, policy in self._policies.items()
+                             if policy.max_age is not None and policy.max_age != self.default_policy.max_age)
+
+        for topic_id in topic_ids:
+            try:
+                deleted += self.trim_topic(topic_id, expire=topic_id in self._policies)
+            except Exception as e:
+                logger.error(f"Error trimming messages for topic {topic_id}: {e}")
+
+        self.stats['passes'] += 1
+        self.stats['deleted'] += deleted
+        return deleted
+
+    def expire_readings(self) -> int:
+        """Range delete of readings older than MQTT_READING_MAX_AGE (served by the ts index)"""
+        max_age = self.reading_max_age
+        if not isinstance(max_age, timedelta):
+            max_age = timedelta(seconds=max_age)
+        try:
+            deleted = MqttReading.objects.filter(ts__lt=timezone.now() - max_age).delete()[0]
+        except Exception as e:
+            logger.error(f"Error expiring readings: {e}")
+            return 0
+        self.stats['readings_deleted'] += deleted
+        return deleted
+
+    def expire_rollups(self) -> int:
+        """Drop rollup buckets past the MQTT_ROLLUP_RETENTION of their resolution"""
+        deleted = 0
+        for resolution, _ in RESOLUTIONS:
+            retention = retention_for(resolution)
+            if retention is None:
+                continue
+            try:
+                deleted += MqttRollup.objects.filter(
+                    resolution=resolution, bucket__lt=timezone.now() - retention
+                ).delete()[0]
+            except Exception as e:
+                logger.error(f"Error expiring {resolution} rollups: {e}")
+        self.stats['rollups_deleted'] += deleted
+        return deleted
+
+    def sweep_payload_files(self) -> int:
+        """Delete offloaded payload files whose messages were deleted (MQTT_PAYLOAD_OFFLOAD_SIZE)
+
+        Only day directories older than yesterday are checked, a file of the
+        current day may belong to a batch that is not committed yet. Lists
+        the storage, so it runs every MQTT_PAYLOAD_SWEEP_INTERVAL from
+        ``run_scheduled`` and from ``mqtt_retention``, not on every trim.
+        """
+        self._swept_at = time.monotonic()
+        if getattr(settings, 'MQTT_PAYLOAD_OFFLOAD_SIZE', None) is None:
+            return 0
+        try:
+            deleted = payload_store.sweep(timezone.now() - timedelta(days=1))
+        except Exception as e:
+            logger.error(f"Error sweeping offloaded payload files: {e}")
+            return 0
+        self.stats['payload_files_deleted'] += deleted
+        return deleted
+
+    def sweep_search_index(self) -> int:
+        """Delete full-text and key index entries of deleted messages
+
+        An anti-join over the whole index, so like ``sweep_payload_files`` it
+        only runs from ``run_scheduled`` and ``mqtt_retention``.
+        """
+        try:
+            deleted = search_index.sweep()
+        except Exception as e:
+            logger.error(f"Error sweeping MQTT search index: {e}")
+            return 0
+        self.stats['search_entries_deleted'] += deleted
+        return deleted
+
+    def trim_topic(self, topic_id: int, expire: bool = True) -> int:
+        """Apply the age, count and size limits to one topic"""
+        policy = self.policy_for(topic_id)
+        messages = MqttMessage.objects.filter(topic_id=topic_id)
+        expired = 0
+        deleted = 0
+
+        if expire and policy.max_age is not None:
+            cutoff_time = timezone.now() - policy.max_age
+            expired = self._expire(cutoff_time, topic_ids=[topic_id])
+
+        if policy.max_messages is not None:
+            # First message beyond the limit on (received_at, id), reached by walking at most max_messages
+            # index entries; id breaks ties so kept messages sharing its received_at survive
+            cutoff = messages.order_by('-received_at', '-id').values_list(
+                'received_at', 'id'
+            )[policy.max_messages:policy.max_messages + 1].first()
+            if cutoff is not None:
+                deleted += self._through(messages, *cutoff).delete()[0]
+                count = messages.count()
+            else:
+                count = MqttTopic.objects.filter(id=topic_id).values_list('message_count', flat=True).first() or 0
+            with self._lock:
+                self._counts[topic_id] = count
+                self._due.discard(topic_id)
+
+        if policy.max_bytes is not None:
+            total = 0
+            cutoff = None
+            sizes = messages.order_by('-received_at', '-id').values_list('received_at', 'id', 'payload_size')
+            for received_at, message_id, size in sizes.iterator(chunk_size=2000):
+                if total + size > policy.max_bytes:
+                    cutoff = (received_at, message_id)
+                    break
+                total += size
+            if cutoff is not None:
+                deleted += self._through(messages, *cutoff).delete()[0]
+            with self._lock:
+                self._bytes[topic_id] = total
+                self._due.discard(topic_id)
+                if topic_id in self._counts and cutoff is not None:
+                    self._counts.pop(topic_id)
+
+        if deleted:
+            decrement_message_counts({topic_id: deleted})
+            logger.debug(f"Trimmed {deleted} messages from topic {topic_id}")
+        return expired + deleted
+
+    @staticmethod
+    def _through(messages, received_at, message_id):
+        """Messages at or before the (received_at, id) key, the received_at bound keeps it a range scan"""
+        return messages.filter(received_at__lte=received_at).exclude(received_at=received_at, id__gt=message_id)
+
+    def _expire(self, cutoff_time, topic_ids=None, exclude_topic_ids=None) -> int:
+        """Delete (or archive) messages received before cutoff_time"""
+        if self.archive_expired:
+            return archive_messages(cutoff_time, topic_ids=topic_ids, exclude_topic_ids=exclude_topic_ids)
+
+        messages = MqttMessage.objects.filter(received_at__lt=cutoff_time)
+        if topic_ids is not None:
+            messages = messages.filter(topic_id__in=topic_ids)
+        if exclude_topic_ids:
+            messages = messages.exclude(topic_id__in=exclude_topic_ids)
+        with transaction.atomic():
+            deltas = count_by_topic(messages)
+            deleted = messages.delete()[0]
+            decrement_message_counts(deltas)
+        with self._lock:
+            for topic_id, count in deltas.items():
+                if topic_id in self._counts:
+                    self._counts[topic_id] = max(0, self._counts[topic_id] - count)
+        return deleted
+
+    def _run(self):
+        while self._running:
+            triggered = self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self._running:
+                break
+
+            close_old_connections()
+            try:
+                if triggered:
+                    with self._lock:
+                        due, self._due = self._due, set()
+                    self.run_once(due)
+                else:
+                    self.run_scheduled()
+            except Exception as e:
+                logger.error(f"Error in MQTT retention pass: {e}")
+            finally:
+                close_old_connections()
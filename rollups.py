@@ -0,0 +1,194 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncDay, TruncHour, TruncMinute
+
+from .models import MqttReading, MqttRollup
+
+# Resolution -> bucket width in seconds, finest first
+RESOLUTIONS = (
+    ('1m', 60),
+    ('1h', 3600),
+    ('1d', 86400),
+)
+RESOLUTION_SECONDS = dict(RESOLUTIONS)
+
+TRUNC_FUNCTIONS = {
+    '1m': TruncMinute,
+    '1h': TruncHour,
+    '1d': TruncDay,
+}
+
+# Used when MQTT_ROLLUP_RETENTION is not set
+DEFAULT_RETENTION = {
+    '1m': 7 * 24 * 3600,
+    '1h': 400 * 24 * 3600,
+    '1d': None,
+}
+
+# (topic_id, resolution, bucket) -> [count, sum, min, max]
+Buckets = Dict[Tuple[int, str, datetime], list]
+
+
+def bucket_start(ts: datetime, seconds: int) -> datetime:
+    """Start of the UTC bucket of ``seconds`` containing ``ts``"""
+    epoch = int(ts.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def accumulate(readings: Iterable[Tuple[int, datetime, float]], buckets: Optional[Buckets] = None) -> Buckets:
+    """Fold (topic_id, ts, value) readings into per-bucket aggregates for every resolution"""
+    if buckets is None:
+        buckets = {}
+    for topic_id, ts, value in readings:
+        for resolution, seconds in RESOLUTIONS:
+            key = (topic_id, resolution, bucket_start(ts, seconds))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                if value < bucket[2]:
+                    bucket[2] = value
+                if value > bucket[3]:
+                    bucket[3] = value
+    return buckets
+
+
+def apply_rollups(buckets: Buckets):
+    """Merge batch aggregates into MqttRollup, one upsert statement per batch
+
+    Runs inside the ingest transaction. Workers sharing a topic (shared
+    subscriptions) merge into the same rows, so the merge happens in the
+    database instead of read-modify-write in Python.
+    """
+    if not buckets:
+        return
+    if connection.vendor in ('postgresql', 'sqlite', 'mysql'):
+        _upsert(buckets)
+    else:
+        _merge_orm(buckets)
+
+
+def _upsert(buckets: Buckets):
+    quote = connection.ops.quote_name
+    adapt = connection.ops.adapt_datetimefield_value
+    table = quote(MqttRollup._meta.db_table)
+    columns = ('topic_id', 'resolution', 'bucket', 'count', 'sum', 'min', 'max')
+    count, total, low, high = (quote(column) for column in ('count', 'sum', 'min', 'max'))
+
+    if connection.vendor == 'mysql':
+        conflict = (
+            f'ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count}), {total} = {total} + VALUES({total}), '
+            f'{low} = LEAST({low}, VALUES({low})), {high} = GREATEST({high}, VALUES({high}))'
+        )
+    else:
+        # SQLite spells LEAST/GREATEST as the scalar MIN/MAX
+        least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+        conflict = (
+            f'ON CONFLICT (topic_id, resolution, bucket) DO UPDATE SET '
+            f'{count} = {table}.{count} + excluded.{count}, {total} = {table}.{total} + excluded.{total}, '
+            f'{low} = {least}({table}.{low}, excluded.{low}), {high} = {greatest}({table}.{high}, excluded.{high})'
+        )
+    sql = 'INSERT INTO {} ({}) VALUES ({}) {}'.format(
+        table, ', '.join(quote(column) for column in columns), ', '.join(['%s'] * len(columns)), conflict
+    )
+    params = [
+        (topic_id, resolution, adapt(bucket), count_, sum_, min_, max_)
+        for (topic_id, resolution, bucket), (count_, sum_, min_, max_) in buckets.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _merge_orm(buckets: Buckets):
+    for (topic_id, resolution, bucket), (count, total, low, high) in buckets.items():
+        updated = MqttRollup.objects.filter(topic_id=topic_id, resolution=resolution, bucket=bucket).update(
+            count=F('count') + count,
+            sum=F('sum') + total,
+            min=Least(F('min'), low),
+            max=Greatest(F('max'), high),
+        )
+        if not updated:
+            MqttRollup.objects.create(
+                topic_id=topic_id, resolution=resolution, bucket=bucket, count=count, sum=total, min=low, max=high
+            )
+
+
+def rebuild_rollups(topic_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute rollups from MqttReading with GROUP BY per resolution, returns rows written
+
+    Rollups older than the oldest stored reading of a topic are kept, so
+    history survives reading expiry.
+    """
+    readings = MqttReading.objects.all()
+    rollups = MqttRollup.objects.all()
+    if topic_ids is not None:
+        topic_ids = list(topic_ids)
+        readings = readings.filter(topic_id__in=topic_ids)
+        rollups = rollups.filter(topic_id__in=topic_ids)
+
+    oldest = dict(readings.order_by().values('topic_id').annotate(ts=Min('ts')).values_list('topic_id', 'ts'))
+    written = 0
+    for resolution, seconds in RESOLUTIONS:
+        for topic_id, ts in oldest.items():
+            rollups.filter(topic_id=topic_id, resolution=resolution, bucket__gte=bucket_start(ts, seconds)).delete()
+
+        rows = readings.order_by().annotate(
+            rollup_bucket=TRUNC_FUNCTIONS[resolution]('ts', tzinfo=dt_timezone.utc)
+        ).values('topic_id', 'rollup_bucket').annotate(
+            n=Count('id'), total=Sum('value'), low=Min('value'), high=Max('value')
+        )
+        batch = [
+            MqttRollup(topic_id=row['topic_id'], resolution=resolution, bucket=row['rollup_bucket'],
+                       count=row['n'], sum=row['total'], min=row['low'], max=row['high'])
+            for row in rows.iterator()
+        ]
+        MqttRollup.objects.bulk_create(batch, batch_size=1000)
+        written += len(batch)
+    return written
+
+
+def retention_for(resolution: str) -> Optional[timedelta]:
+    """How long rollups of a resolution are kept (MQTT_ROLLUP_RETENTION), None keeps them"""
+    retention = getattr(settings, 'MQTT_ROLLUP_RETENTION', DEFAULT_RETENTION).get(resolution)
+    if retention is not None and not isinstance(retention, timedelta):
+        retention = timedelta(seconds=retention)
+    return retention
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: int, now: datetime) -> str:
+    """Finest resolution that covers [start, end) in at most ``max_points`` buckets
+
+    Resolutions whose retention no longer covers ``start`` are skipped, the
+    coarsest one is the fallback.
+    """
+    span = (end - start).total_seconds()
+    for resolution, seconds in RESOLUTIONS:
+        retention = retention_for(resolution)
+        if retention is not None and start < now - retention:
+            continue
+        if span / seconds <= max_points:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+
+def aggregate_series(topic_id: int, resolution: str, start: datetime, end: datetime) -> List[dict]:
+    """Buckets of one topic in [start, end), oldest first (served by the unique index)"""
+    rows = MqttRollup.objects.filter(
+        topic_id=topic_id,
+        resolution=resolution,
+        bucket__gte=bucket_start(start, RESOLUTION_SECONDS[resolution]),
+        bucket__lt=end,
+    ).order_by('bucket').values_list('bucket', 'count', 'sum', 'min', 'max')
+    return [{
+        'bucket': bucket.isoformat(),
+        'count': count,
+        'min': low,
+        'max': high,
+        'avg': total / count if count else None,
+    } for bucket, count, total, low, high in rows]
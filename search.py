@@ -0,0 +1,212 @@
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef, QuerySet
+from django.db.models.expressions import RawSQL
+
+from .payloads import extract_value
+
+# SQLite: FTS5 virtual table keyed by rowid = message id, PostgreSQL: tsvector table with a GIN index
+SEARCH_TABLE = 'mqtt_message_search'
+SEARCH_VENDORS = ('sqlite', 'postgresql')
+
+# MqttMessageKey.value length
+KEY_VALUE_LENGTH = 255
+
+
+def extract_keys(text: str, paths: List[str]) -> List[Tuple[str, str]]:
+    """(path, value) of the scalar values at ``paths`` of a JSON payload"""
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return []
+    keys = []
+    for path in paths:
+        value = extract_value(document, path)
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        keys.append((path, value[:KEY_VALUE_LENGTH]))
+    return keys
+
+
+def parse_query(search_term: str) -> Tuple[str, Dict[str, str]]:
+    """Split a search box term into the full-text part and ``key=value`` key lookups"""
+    words = []
+    keys = {}
+    for word in search_term.split():
+        key, sep, value = word.partition('=')
+        if sep and key and value:
+            keys[key] = value
+        else:
+            words.append(word)
+    return ' '.join(words), keys
+
+
+def _fts5_query(query: str) -> str:
+    """Every term as a quoted FTS5 string, so user input never hits the query syntax (``term*`` keeps prefix search)"""
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*') and len(term) > 1
+        term = term.rstrip('*') if prefix else term
+        terms.append('"{}"{}'.format(term.replace('"', '""'), '*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    """Full-text index of payloads and exact-match index of JSON keys, maintained by the ingest path
+
+    Topics with ``search_enabled`` get their decoded payload text indexed in
+    the vendor full-text table (SQLite FTS5 or a PostgreSQL tsvector with a
+    GIN index) in the same transaction as the messages. Topics with
+    ``search_keys`` get the values at those JSON paths stored in
+    MqttMessageKey, indexed on (key, value, received_at). Other databases
+    only get the key index; full-text search falls back to ``icontains``.
+
+    Entries of deleted messages are removed by ``sweep`` (from retention),
+    not per row, so message deletes keep Django's fast delete path. Topic
+    settings are loaded with one query and reloaded like the codec registry.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'MQTT_CODEC_REFRESH_INTERVAL', 30)
+        self.refresh_interval = refresh_interval
+        self.config = getattr(settings, 'MQTT_SEARCH_CONFIG', 'simple')
+        self.max_length = getattr(settings, 'MQTT_SEARCH_MAX_LENGTH', 65536)
+        self._topics: Dict[int, Tuple[bool, List[str]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._available: Optional[bool] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'documents': 0,
+            'keys': 0,
+        }
+
+    @property
+    def full_text_available(self) -> bool:
+        """Whether the full-text table exists on this database"""
+        if self._available is None:
+            self._available = connection.vendor in SEARCH_VENDORS \
+                and SEARCH_TABLE in connection.introspection.table_names()
+        return self._available
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def refresh(self):
+        from .models import MqttTopic
+
+        rows = MqttTopic.objects.exclude(search_enabled=False, search_keys='') \
+            .values_list('id', 'search_enabled', 'search_keys')
+        topics = {
+            topic_id: (enabled, [path.strip() for path in keys.split(',') if path.strip()])
+            for topic_id, enabled, keys in rows
+        }
+        with self._lock:
+            self._topics = topics
+            self._loaded_at = time.monotonic()
+
+    def config_for(self, topic_id: int) -> Tuple[bool, List[str]]:
+        """(full text, key paths) of a topic"""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_interval:
+            self.refresh()
+        return self._topics.get(topic_id, (False, []))
+
+    def index(self, rows: Iterable[Tuple[int, int, str, datetime]]):
+        """Index (message id, topic id, text, received_at) rows, inside the writer's transaction"""
+        from .models import MqttMessageKey
+
+        documents = []
+        keys = []
+        for message_id, topic_id, text, received_at in rows:
+            full_text, paths = self.config_for(topic_id)
+            if message_id is None or not (full_text or paths):
+                continue
+            if full_text:
+                documents.append((message_id, text[:self.max_length]))
+            for key, value in extract_keys(text, paths) if paths else ():
+                keys.append(MqttMessageKey(message_id=message_id, topic_id=topic_id, key=key, value=value,
+                                           received_at=received_at))
+
+        if documents and self.full_text_available:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.executemany(
+                        f'INSERT INTO {SEARCH_TABLE} (message_id, document) VALUES (%s, to_tsvector(%s::regconfig, %s))',
+                        [(message_id, self.config, text) for message_id, text in documents],
+                    )
+                else:
+                    cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, payload) VALUES (%s, %s)', documents)
+            self.stats['documents'] += len(documents)
+        if keys:
+            MqttMessageKey.objects.bulk_create(keys)
+            self.stats['keys'] += len(keys)
+
+    def matching_ids(self, query: str) -> RawSQL:
+        """Subquery of message ids whose payload matches ``query`` (needs ``full_text_available``)"""
+        if connection.vendor == 'postgresql':
+            return RawSQL(
+                f'SELECT message_id FROM {SEARCH_TABLE} WHERE document @@ websearch_to_tsquery(%s::regconfig, %s)',
+                (self.config, query),
+            )
+        return RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', (_fts5_query(query),))
+
+    def filter(self, queryset: QuerySet, query: str = '', keys: Optional[Dict[str, str]] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> QuerySet:
+        """Messages of ``queryset`` matching the full-text ``query`` and every ``key = value``
+
+        ``since``/``until`` bound received_at on the messages and on the key
+        lookups, so "device_id = X in the last hour" is one range scan of
+        the (key, value, received_at) index.
+        """
+        from .models import MqttMessageKey
+
+        if since is not None:
+            queryset = queryset.filter(received_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(received_at__lt=until)
+        if query.strip():
+            if self.full_text_available:
+                queryset = queryset.filter(id__in=self.matching_ids(query))
+            else:
+                queryset = queryset.filter(payload__icontains=query)
+        for key, value in (keys or {}).items():
+            lookups = MqttMessageKey.objects.filter(key=key, value=value)
+            if since is not None:
+                lookups = lookups.filter(received_at__gte=since)
+            if until is not None:
+                lookups = lookups.filter(received_at__lt=until)
+            queryset = queryset.filter(id__in=lookups.values('message_id'))
+        return queryset
+
+    def sweep(self) -> int:
+        """Delete index entries of messages that no longer exist, returns entries deleted"""
+        from .models import MqttMessage, MqttMessageKey
+
+        deleted = MqttMessageKey.objects.filter(
+            ~Exists(MqttMessage.objects.filter(id=OuterRef('message_id')))
+        ).delete()[0]
+        if self.full_text_available:
+            messages = MqttMessage._meta.db_table
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        f'DELETE FROM {SEARCH_TABLE} s WHERE NOT EXISTS '
+                        f'(SELECT 1 FROM {messages} m WHERE m.id = s.message_id)'
+                    )
+                else:
+                    cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT id FROM {messages})')
+                deleted += cursor.rowcount
+        return deleted
+
+
+# Global search index
+search_index = SearchIndex()
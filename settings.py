@@ -14,11 +14,136 @@ MQTT_RETAIN_MESSAGES = True
 MQTT_MAX_STORED_MESSAGES = 1000
 
 # WebSocket Configuration for Real-time Updates
+# Live updates are served as server-sent events from /mqtt/stream/ on the Django port,
+# MQTT_WEBSOCKET_ENABLED switches the push channel on/off (MQTT_WEBSOCKET_PORT is unused)
 MQTT_WEBSOCKET_ENABLED = True
 MQTT_WEBSOCKET_PORT = 8001
+MQTT_STREAM_MIN_INTERVAL = 0.5  # Seconds between pushes to one client (events are batched)
+MQTT_STREAM_MAX_BATCH = 100  # Max messages per push, older ones are reported as dropped
+MQTT_STREAM_QUEUE_SIZE = 1000  # Max events buffered per client
+MQTT_STREAM_KEEPALIVE = 15  # Seconds between keepalive comments
+MQTT_STREAM_MAX_DURATION = 300  # Seconds before the server closes a stream (client reconnects)
 
 # Logging Configuration for MQTT
 MQTT_LOG_LEVEL = 'INFO'
 
-# MQTT Client ID (will be auto-generated if not set)
-MQTT_CLIENT_ID = None
\ No newline at end of file
+# MQTT Client ID (derived from the host name if not set, random with MQTT_CLEAN_SESSION = True)
+MQTT_CLIENT_ID = None
+
+# Reconnect and Session Configuration
+MQTT_CLEAN_SESSION = False  # False: broker keeps subscriptions and queued QoS 1/2 messages across reconnects
+MQTT_SESSION_EXPIRY = 3600  # Seconds the broker keeps a persistent session (MQTT v5 only)
+MQTT_RECONNECT_MIN_DELAY = 1.0  # First reconnect delay in seconds
+MQTT_RECONNECT_MAX_DELAY = 120  # Upper bound of the jittered exponential reconnect delay
+MQTT_SUBSCRIBE_BATCH_SIZE = 100  # Topic filters per SUBSCRIBE packet
+MQTT_CONNECTION_FLUSH_DELAY = 2.0  # Seconds connection status changes are coalesced before one write, 0 writes immediately
+MQTT_CONNECTION_HISTORY_SIZE = 100  # Connection events kept in memory per broker (/mqtt/brokers/ history)
+
+# Ingest Pipeline Configuration
+MQTT_INGEST_BATCH_SIZE = 500  # Max messages per bulk insert
+MQTT_INGEST_FLUSH_INTERVAL = 1.0  # Seconds before a partial batch is flushed
+MQTT_INGEST_QUEUE_SIZE = 10000  # Max messages buffered in memory
+MQTT_INGEST_BACKPRESSURE = 'block'  # 'block', 'drop_oldest' or 'spill' ('block' spills under MQTT_ENGINE = 'asyncio')
+MQTT_INGEST_SPILL_DIR = None  # Directory for spilled messages (defaults to system temp dir)
+
+# Deduplication of QoS 1/2 redeliveries
+MQTT_DEDUP_ENABLED = True  # Drop redelivered messages in memory before they are queued
+MQTT_DEDUP_KEY = 'packet'  # 'packet': topic + payload + packet id, DUP-flagged only, 'payload': topic + payload (drops identical payloads)
+MQTT_DEDUP_WINDOW = 600  # Seconds a key is remembered (one to two windows)
+MQTT_DEDUP_CAPACITY = 100000  # Keys per Bloom filter generation (two generations are kept)
+MQTT_DEDUP_ERROR_RATE = 0.0001  # False positive rate per generation, a false positive drops a genuine message
+MQTT_DEDUP_CONTENT_HASH = False  # Also store MqttMessage.content_hash (unique) and skip redeliveries already stored
+MQTT_DEDUP_HASH_WINDOW = 3600  # Seconds per time bucket included in the content hash
+
+# Payload storage (compression per topic with MqttTopic.payload_compression)
+MQTT_PAYLOAD_COMPRESS_MIN_SIZE = 256  # Smaller payloads are stored as plain text
+MQTT_PAYLOAD_ZLIB_LEVEL = 6  # zlib compression level (1-9)
+MQTT_PAYLOAD_ZSTD_LEVEL = 3  # Zstandard compression level (needs the zstandard package)
+MQTT_PAYLOAD_OFFLOAD_SIZE = None  # Stored payloads above this many bytes go to file storage (None disables)
+MQTT_PAYLOAD_STORAGE = 'default'  # STORAGES alias for offloaded payloads
+MQTT_PAYLOAD_SWEEP_INTERVAL = 3600  # Seconds between sweeps of offloaded files and search entries of deleted messages
+
+# Search (per topic with MqttTopic.search_enabled / search_keys)
+MQTT_SEARCH_CONFIG = 'simple'  # PostgreSQL text search configuration
+MQTT_SEARCH_MAX_LENGTH = 65536  # Characters of a payload added to the full-text index
+
+# Export (/mqtt/export/ and mqtt_export)
+MQTT_EXPORT_CHUNK_SIZE = 2000  # Rows fetched per database round trip (server-side cursor on PostgreSQL)
+
+# Last value cache (/mqtt/snapshot/)
+MQTT_LAST_VALUE_ENABLED = True  # Keep the latest message of every topic in memory
+MQTT_LAST_VALUE_CACHE = 'default'  # Django cache alias mirroring the values (use Redis/Memcached to share across processes)
+MQTT_LAST_VALUE_TIMEOUT = None  # Seconds the cached values live (None keeps them until replaced)
+MQTT_LAST_VALUE_MAX_SIZE = 65536  # Longer payloads are truncated in the cache
+
+# Topic Cache Configuration
+MQTT_TOPIC_CACHE_SIZE = 10000  # Max topic name -> id entries kept in memory (LRU)
+
+# Retention Configuration (per-topic overrides live on MqttTopic)
+MQTT_MAX_MESSAGE_AGE = None  # Seconds (or timedelta) to keep messages, None keeps forever
+MQTT_MAX_STORED_BYTES = None  # Max total payload bytes per topic, None disables
+MQTT_RETENTION_INTERVAL = 60  # Seconds between scheduled retention passes
+MQTT_RETENTION_WATERMARK = 0.1  # Trim early once a topic exceeds its limit by this fraction
+MQTT_ARCHIVE_EXPIRED = False  # Move messages past max_age to MqttMessageArchive instead of deleting
+
+# Message History API
+MQTT_MESSAGES_PAGE_SIZE = 50  # Default page size for /mqtt/topic/<id>/messages/
+MQTT_MESSAGES_MAX_PAGE_SIZE = 500  # Upper bound for the limit parameter
+
+# Multi-worker mode (manage.py mqtt_client --workers N)
+MQTT_PROTOCOL = '3.1.1'  # '3.1.1' or '5'
+MQTT_WORKERS = 1  # Default number of client processes
+MQTT_SHARED_SUBSCRIPTION_GROUP = 'mqtt-ingest'  # $share group used with --sharding shared (MQTT v5)
+MQTT_WORKER_HEALTH_INTERVAL = 10  # Seconds between worker health reports
+MQTT_WORKER_RESTART_BACKOFF = 1.0  # Initial delay before restarting a crashed worker (doubles per crash)
+MQTT_WORKER_MAX_BACKOFF = 60  # Max restart delay in seconds
+
+# Message Sinks
+# Route topics to other sinks than the default ORM pipeline (first match wins), e.g.
+# MQTT_SINKS = [
+#     {'name': 'telemetry', 'topics': ['telemetry/#'], 'sink': 'sql', 'batch_size': 5000},
+#     {'name': 'raw', 'topics': ['raw/#'], 'sink': 'jsonl', 'options': {'directory': '/var/lib/mqtt'}},
+#     {'name': 'debug', 'topics': ['debug/#'], 'sink': 'null'},
+# ]
+MQTT_SINKS = []
+
+# Message Callbacks
+MQTT_CALLBACK_WORKERS = 4  # Threads running message callbacks (0 runs them on the ingest writer thread)
+MQTT_CALLBACK_QUEUE_SIZE = 10000  # Max messages waiting for callbacks before new ones are dropped
+
+# Metrics (GET /mqtt/metrics/, Prometheus text format)
+MQTT_METRICS_ENABLED = True
+MQTT_METRICS_TOKEN = None  # Bearer token for scrapers, staff sessions are always allowed
+MQTT_METRICS_PORT = None  # Port for the mqtt_client command's own /metrics endpoint (worker N uses port + N)
+MQTT_METRICS_HOST = ''  # Interface for that endpoint, '' listens on all interfaces
+MQTT_METRICS_MAX_TOPICS = 1000  # Max topic label values per metric, the rest is reported as __other__
+MQTT_LOG_INTERVAL = 10  # Seconds between repeated per-message log lines (publish acks etc.)
+
+# Publishing
+MQTT_PUBLISH_MAX_INFLIGHT = 100  # Max unacknowledged published messages (QoS 1/2)
+MQTT_PUBLISH_TIMEOUT = 10  # Seconds to wait for the in-flight window / acknowledgements
+MQTT_PUBLISH_BULK_MAX = 10000  # Max messages per /mqtt/publish/bulk/ request
+MQTT_OUTBOX_ENABLED = True  # Queue publishes in MqttOutboxMessage while disconnected, replayed on reconnect
+
+# Payload Codecs
+MQTT_CODEC_REFRESH_INTERVAL = 30  # Seconds between reloads of per-topic payload codecs
+MQTT_READING_MAX_AGE = None  # Seconds to keep MqttReading rows (None keeps them)
+
+# Rollups (GET /mqtt/topic/<id>/aggregate/)
+MQTT_ROLLUPS_ENABLED = True  # Maintain per minute/hour/day aggregates of readings at ingest
+MQTT_ROLLUP_RETENTION = {  # Seconds to keep buckets per resolution (None keeps them)
+    '1m': 7 * 24 * 3600,
+    '1h': 400 * 24 * 3600,
+    '1d': None,
+}
+MQTT_AGGREGATE_MAX_POINTS = 1000  # Max buckets per aggregate response
+
+# Status Snapshot (GET /mqtt/status/)
+MQTT_STATUS_CACHE_TIMEOUT = 60  # Seconds a status snapshot stays in the Django cache
+MQTT_STATUS_STATS_INTERVAL = 10  # Min seconds between topic stats refreshes by the client service
+
+# Client Engine
+MQTT_ENGINE = 'thread'  # 'thread' (paho network thread) or 'asyncio' (event loop, see apps.mqtt.asgi.MqttLifespan)
+
+# Multi-broker (mqtt_client --all-brokers)
+MQTT_BROKER_SYNC_INTERVAL = 30  # Seconds between re-reads of MQTT Connection records, 0 disables
@@ -0,0 +1,61 @@
+from django.db.models.signals import class_prepared, post_delete, post_save
+from django.dispatch import receiver
+
+from .compression import payload_store
+from .last_value import last_value_cache
+from .models import MqttPayloadDictionary, MqttTopic
+from .payloads import codec_registry
+from .search import search_index
+from .status import status_snapshot
+from .topic_cache import topic_cache
+
+
+def invalidate_topic_cache_on_save(sender, instance, created, **kwargs):
+    """Drop cached topic id when a topic is saved (it may have been renamed)"""
+    if not created:
+        topic_cache.invalidate(topic_id=instance.pk)
+    # The payload codec, compression or search settings may have changed
+    codec_registry.invalidate()
+    payload_store.invalidate()
+    search_index.invalidate()
+    status_snapshot.invalidate()
+
+
+def invalidate_topic_cache_on_delete(sender, instance, **kwargs):
+    """Drop cached topic id when a topic is deleted"""
+    topic_cache.invalidate(name=instance.name, topic_id=instance.pk)
+    last_value_cache.forget([instance.pk])
+    codec_registry.invalidate()
+    payload_store.invalidate()
+    search_index.invalidate()
+    status_snapshot.invalidate()
+
+
+@receiver(post_save, sender=MqttPayloadDictionary, dispatch_uid='mqtt_payload_dictionary_post_save')
+def use_new_payload_dictionary(sender, instance, created, **kwargs):
+    """New payloads of the topic are compressed with the newest dictionary"""
+    payload_store.invalidate()
+
+
+def connect_topic_signals(model):
+    """Connect cache invalidation for MqttTopic or one of its proxies
+
+    Receivers are bound per sender on purpose: a sender-less post_delete
+    receiver would disable Django's fast delete path for MqttMessage.
+    """
+    post_save.connect(invalidate_topic_cache_on_save, sender=model,
+                      dispatch_uid=f'mqtt_topic_cache_post_save_{model._meta.label}')
+    post_delete.connect(invalidate_topic_cache_on_delete, sender=model,
+                        dispatch_uid=f'mqtt_topic_cache_post_delete_{model._meta.label}')
+
+
+@receiver(class_prepared, dispatch_uid='mqtt_topic_proxy_signals')
+def connect_topic_proxy_signals(sender, **kwargs):
+    """Proxy models (e.g. the Wagtail snippet) send signals with the proxy as sender"""
+    if issubclass(sender, MqttTopic):
+        connect_topic_signals(sender)
+
+
+connect_topic_signals(MqttTopic)
+for proxy in MqttTopic.__subclasses__():
+    connect_topic_signals(proxy)
@@ -0,0 +1,379 @@
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .ingest import IngestPipeline, IngestRecord
+from .models import MqttMessage, MqttReading
+from .payloads import decode_payload
+from .rollups import accumulate, apply_rollups
+from .stats import record_topic_activity
+from .topics import topic_matches
+
+logger = logging.getLogger(__name__)
+
+
+class MessageSink:
+    """Destination for batches of received messages
+
+    ``write`` is called on the sink's own ingest writer thread with a list of
+    ``IngestRecord``. Subclasses only implement ``write`` (and ``close`` if
+    they hold resources).
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.service = None
+        self.stats = {
+            'batches': 0,
+            'records': 0,
+            'bytes': 0,
+        }
+
+    def bind(self, service):
+        """Attach the client service (topic cache, retention, shard index)"""
+        self.service = service
+
+    def write(self, records: List[IngestRecord]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def count(self, records: List[IngestRecord]):
+        self.stats['batches'] += 1
+        self.stats['records'] += len(records)
+        self.stats['bytes'] += sum(len(record.payload) for record in records)
+
+
+class OrmSink(MessageSink):
+    """MqttMessage rows through the ORM bulk insert path, with stats and message callbacks"""
+
+    def write(self, records: List[IngestRecord]):
+        self.service._write_batch(records)
+        self.count(records)
+
+
+class SqlSink(MessageSink):
+    """MqttMessage rows written without model instances
+
+    Uses ``COPY ... FROM STDIN`` on PostgreSQL and ``executemany`` elsewhere.
+    Rows with a content hash skip hashes stored by another writer after
+    ``filter_stored`` looked (``ON CONFLICT DO NOTHING``, ``INSERT OR
+    IGNORE``); COPY cannot skip rows, so it fills a temporary table that is
+    then inserted from. Payloads are decoded with the topic codec and numeric values go to
+    MqttReading. Topic stats and retention counters are maintained, message
+    callbacks (and so the live stream) are not fired.
+    """
+
+    COLUMNS = ('topic_id', 'payload', 'payload_size', 'payload_encoding', 'qos', 'retain', 'timestamp', 'received_at',
+               'content_hash', 'payload_compression', 'payload_blob', 'payload_file', 'payload_dictionary_id')
+    READING_COLUMNS = ('topic_id', 'ts', 'value')
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.table = options.get('table') or MqttMessage._meta.db_table
+        self.readings_table = MqttReading._meta.db_table
+
+    def write(self, records: List[IngestRecord]):
+        close_old_connections()
+        try:
+            try:
+                self._write(records)
+            except IntegrityError as e:
+                # A topic was deleted by another process while its id was cached, re-resolve and retry once
+                logger.warning(f"Retrying MQTT batch after integrity error: {e}")
+                self.service.forget_topics(records)
+                self._write(records)
+        finally:
+            close_old_connections()
+
+    def _write(self, records: List[IngestRecord]):
+        records, hashes = self.service.filter_stored(records)
+        if not records:
+            return
+        topic_ids = self.service.topic_cache.resolve(record.topic for record in records)
+        received_at = timezone.now()
+        rows = []
+        readings = []
+        last_values = []
+        activity = {}
+        written = Counter()
+        sizes = Counter()
+        for record, value in zip(records, hashes):
+            topic_id = topic_ids[record.topic]
+            decoded = decode_payload(record.payload, *self.service.codecs.codec_for(topic_id))
+            packed = self.service.payloads.pack(topic_id, decoded.text, received_at)
+            rows.append((topic_id, packed.payload, len(record.payload), decoded.encoding, record.qos, record.retain,
+                         record.timestamp, received_at, value, packed.compression, packed.blob, packed.file,
+                         packed.dictionary_id))
+            if decoded.number is not None:
+                readings.append((topic_id, record.timestamp, decoded.number))
+            if self.service.last_values_enabled:
+                last_values.append(self.service.last_values.entry(
+                    topic_id, record.topic, decoded.text, decoded.encoding, record.qos, record.retain,
+                    record.timestamp, received_at
+                ))
+            written[topic_id] += 1
+            sizes[topic_id] += len(record.payload)
+            activity[topic_id] = (written[topic_id], received_at, decoded.text)
+
+        insert = self._copy if connection.vendor == 'postgresql' else self._executemany
+        ignore_conflicts = any(value is not None for value in hashes)
+        with metrics.db_write_seconds.time('sql'), transaction.atomic():
+            insert(self.table, self.COLUMNS, rows, ignore_conflicts=ignore_conflicts)
+            if readings:
+                insert(self.readings_table, self.READING_COLUMNS, readings)
+                if self.service.rollups_enabled:
+                    apply_rollups(accumulate(readings))
+            record_topic_activity(activity)
+
+        for topic_id, count in written.items():
+            self.service.retention.record(topic_id, count, sizes[topic_id])
+        self.service.last_values.update(last_values)
+        self.service.status.refresh_stats()
+        self.count(records)
+
+    def _executemany(self, table, columns, rows, ignore_conflicts=False):
+        quote = connection.ops.quote_name
+        adapt = connection.ops.adapt_datetimefield_value
+        on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            connection.ops.insert_statement(on_conflict=on_conflict),
+            quote(table),
+            ', '.join(quote(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+            connection.ops.on_conflict_suffix_sql(None, on_conflict, None, None),
+        ).rstrip()
+        params = [tuple(adapt(value) if isinstance(value, datetime) else value for value in row) for row in rows]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    def _copy(self, table, columns, rows, ignore_conflicts=False):
+        if not ignore_conflicts:
+            self._copy_into(table, columns, rows)
+            return
+        quote = connection.ops.quote_name
+        column_list = ', '.join(quote(column) for column in columns)
+        staging = quote(table + '_staging')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {quote(table)} WITH NO DATA'
+            )
+        self._copy_into(table + '_staging', columns, rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(table)} ({column_list}) SELECT {column_list} FROM {staging} ON CONFLICT DO NOTHING'
+            )
+            cursor.execute(f'DROP TABLE {staging}')
+
+    def _copy_into(self, table, columns, rows):
+        quote = connection.ops.quote_name
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            quote(table), ', '.join(quote(column) for column in columns)
+        )
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                # psycopg2, text format needs escaping of the payload
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write('\t'.join(self._copy_value(value) for value in row) + '\n')
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+
+    @staticmethod
+    def _copy_value(value) -> str:
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, bytes):
+            # bytea hex format, the backslash itself escaped for the text format
+            return '\\\\x' + value.hex()
+        if isinstance(value, str):
+            return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                    .replace('\n', '\\n').replace('\r', '\\r'))
+        return str(value)
+
+
+class JsonlFileSink(MessageSink):
+    """Append-only JSON lines files, rotated by size or age
+
+    Options: ``directory`` (required), ``prefix`` (default ``mqtt``),
+    ``max_bytes`` (default 64 MB) and ``max_age`` seconds (default 3600).
+    Payloads are stored as text, or base64 under ``payload_b64`` when they
+    are not valid UTF-8.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.directory = options['directory']
+        self.prefix = options.get('prefix', 'mqtt')
+        self.max_bytes = options.get('max_bytes', 64 * 1024 * 1024)
+        self.max_age = options.get('max_age', 3600)
+        self.path: Optional[str] = None
+        self._fh = None
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, records: List[IngestRecord]):
+        lines = []
+        for record in records:
+            line = {
+                'topic': record.topic,
+                'qos': record.qos,
+                'retain': record.retain,
+                'timestamp': record.timestamp.isoformat(),
+            }
+            try:
+                line['payload'] = record.payload.decode('utf-8')
+            except UnicodeDecodeError:
+                line['payload_b64'] = base64.b64encode(record.payload).decode('ascii')
+            lines.append(json.dumps(line))
+
+        with self._lock:
+            self._rotate_if_needed()
+            self._fh.write('\n'.join(lines) + '\n')
+            self._fh.flush()
+        self.count(records)
+
+    def close(self):
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+    def _rotate_if_needed(self):
+        if self._fh and self._fh.tell() < self.max_bytes and time.monotonic() - self._opened_at < self.max_age:
+            return
+        if self._fh:
+            self._fh.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.prefix
+        if self.service:
+            name = f'{name}{self.service.name_suffix}'
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+        self.path = os.path.join(self.directory, f'{name}-{stamp}.jsonl')
+        self._fh = open(self.path, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+
+
+class NullSink(MessageSink):
+    """Discards messages, only keeps the counters in ``stats``"""
+
+    def write(self, records: List[IngestRecord]):
+        self.count(records)
+
+
+SINK_CLASSES = {
+    'orm': OrmSink,
+    'sql': SqlSink,
+    'jsonl': JsonlFileSink,
+    'null': NullSink,
+}
+
+
+class SinkRoute:
+    """Topic filters routed to one sink, with its own batching pipeline"""
+
+    def __init__(self, name: str, topics: List[str], sink: MessageSink, pipeline: IngestPipeline):
+        self.name = name
+        self.topics = topics
+        self.sink = sink
+        self.pipeline = pipeline
+
+    def matches(self, topic: str) -> bool:
+        return any(topic_matches(topic_filter, topic) for topic_filter in self.topics)
+
+
+class SinkRouter:
+    """Picks the ingest pipeline for a topic from MQTT_SINKS
+
+    Each entry is a dict with ``name``, ``topics`` (list of topic filters),
+    ``sink`` (``orm``, ``sql``, ``jsonl``, ``null`` or a dotted path to a
+    MessageSink subclass) and optional ``options``, ``batch_size``,
+    ``flush_interval``, ``max_queue_size`` and ``backpressure``. The first
+    matching entry wins; other topics use the service's default ORM pipeline.
+    """
+
+    # Max topic -> route decisions remembered
+    CACHE_SIZE = 10000
+
+    def __init__(self, service, config: Optional[List[dict]] = None):
+        self.service = service
+        self.routes: List[SinkRoute] = []
+        self._routes_by_topic: Dict[str, Optional[SinkRoute]] = {}
+
+        config = config if config is not None else getattr(settings, 'MQTT_SINKS', [])
+        for entry in config:
+            self.routes.append(self._build_route(entry))
+
+    def _build_route(self, entry: dict) -> SinkRoute:
+        name = entry['name']
+        sink_class = SINK_CLASSES.get(entry['sink'])
+        if sink_class is None:
+            sink_class = import_string(entry['sink'])
+        sink = sink_class(**entry.get('options', {}))
+        sink.bind(self.service)
+
+        pipeline_name = f'sink-{name}{self.service.name_suffix}'
+        pipeline = IngestPipeline(
+            sink.write,
+            batch_size=entry.get('batch_size', getattr(settings, 'MQTT_INGEST_BATCH_SIZE', 500)),
+            flush_interval=entry.get('flush_interval', getattr(settings, 'MQTT_INGEST_FLUSH_INTERVAL', 1.0)),
+            max_queue_size=entry.get('max_queue_size', getattr(settings, 'MQTT_INGEST_QUEUE_SIZE', 10000)),
+            backpressure=entry.get('backpressure', getattr(settings, 'MQTT_INGEST_BACKPRESSURE', 'block')),
+            spill_dir=getattr(settings, 'MQTT_INGEST_SPILL_DIR', None),
+            name=pipeline_name,
+        )
+        return SinkRoute(name, list(entry['topics']), sink, pipeline)
+
+    def route_for(self, topic: str) -> Optional[SinkRoute]:
+        """Matching route, None for the default pipeline"""
+        try:
+            return self._routes_by_topic[topic]
+        except KeyError:
+            pass
+        route = next((route for route in self.routes if route.matches(topic)), None)
+        if len(self._routes_by_topic) >= self.CACHE_SIZE:
+            self._routes_by_topic.clear()
+        self._routes_by_topic[topic] = route
+        return route
+
+    def start(self):
+        for route in self.routes:
+            route.pipeline.start()
+
+    def stop(self):
+        """Flush every pipeline, then release sink resources"""
+        for route in self.routes:
+            route.pipeline.stop()
+            route.sink.close()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            route.name: dict(route.sink.stats, depth=route.pipeline.depth, **route.pipeline.stats)
+            for route in self.routes
+        }
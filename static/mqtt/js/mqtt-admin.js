@@ -1,17 +1,179 @@
 // MQTT Admin Dashboard JavaScript
 
+// Live updates over server-sent events. Incoming events are coalesced and
+// rendered at most once per animation frame / minInterval.
+class MqttLiveStream {
+    constructor(url, { topics = [], coalesce = false, minInterval = 250, onMessages, onStatus, onFallback } = {}) {
+        this.url = url;
+        this.topics = topics;
+        this.coalesce = coalesce;
+        this.minInterval = minInterval;
+        this.onMessages = onMessages || (() => {});
+        this.onStatus = onStatus || (() => {});
+        this.onFallback = onFallback || (() => {});
+        this.source = null;
+        this.pendingMessages = [];
+        this.pendingStatus = null;
+        this.renderScheduled = false;
+        this.lastRender = 0;
+        this.failures = 0;
+    }
+
+    static isSupported() {
+        return typeof window.EventSource !== 'undefined';
+    }
+
+    start() {
+        const params = new URLSearchParams();
+        this.topics.forEach((topic) => params.append('topic', topic));
+        if (this.coalesce) params.set('coalesce', '1');
+        const query = params.toString();
+
+        this.source = new EventSource(query ? `${this.url}?${query}` : this.url);
+        this.source.addEventListener('open', () => {
+            this.failures = 0;
+        });
+        this.source.addEventListener('messages', (e) => {
+            const data = JSON.parse(e.data);
+            this.pendingMessages.push(...data.messages);
+            this.scheduleRender();
+        });
+        this.source.addEventListener('status', (e) => {
+            this.pendingStatus = JSON.parse(e.data);
+            this.scheduleRender();
+        });
+        this.source.addEventListener('error', () => {
+            // EventSource reconnects by itself, give up after repeated failures
+            this.failures += 1;
+            if (this.failures >= 5 || this.source.readyState === EventSource.CLOSED) {
+                this.stop();
+                this.onFallback();
+            }
+        });
+    }
+
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+
+    scheduleRender() {
+        if (this.renderScheduled) return;
+        this.renderScheduled = true;
+
+        const wait = Math.max(0, this.minInterval - (Date.now() - this.lastRender));
+        setTimeout(() => {
+            window.requestAnimationFrame(() => this.render());
+        }, wait);
+    }
+
+    render() {
+        this.renderScheduled = false;
+        this.lastRender = Date.now();
+
+        if (this.pendingStatus) {
+            this.onStatus(this.pendingStatus);
+            this.pendingStatus = null;
+        }
+        if (this.pendingMessages.length) {
+            let messages = this.pendingMessages;
+            this.pendingMessages = [];
+            if (this.coalesce) {
+                const latest = new Map();
+                messages.forEach((message) => latest.set(message.topic, message));
+                messages = Array.from(latest.values());
+            }
+            this.onMessages(messages);
+        }
+    }
+}
+
 class MqttDashboard {
     constructor() {
         this.isConnected = false;
         this.statusCheckInterval = null;
         this.messageRefreshInterval = null;
+        this.stream = null;
+        this.maxRecentMessages = 20;
         this.init();
     }
 
     init() {
         this.bindEvents();
-        this.startStatusCheck();
-        this.startMessageRefresh();
+
+        const root = document.querySelector('.mqtt-dashboard');
+        const streamUrl = root ? root.dataset.streamUrl : null;
+        if (streamUrl && MqttLiveStream.isSupported()) {
+            this.startStream(streamUrl);
+        } else {
+            this.startStatusCheck();
+            this.startMessageRefresh();
+        }
+    }
+
+    startStream(url) {
+        this.stream = new MqttLiveStream(url, {
+            onMessages: (messages) => this.renderMessages(messages),
+            onStatus: (status) => {
+                this.updateConnectionStatus(status.is_connected);
+                this.updateConnectionInfo(status);
+            },
+            onFallback: () => {
+                this.stream = null;
+                this.startStatusCheck();
+            }
+        });
+        this.stream.start();
+    }
+
+    renderMessages(messages) {
+        const container = document.getElementById('recent-messages') || document.getElementById('mqtt-recent-messages');
+        if (!container) return;
+
+        const placeholder = container.querySelector('p');
+        if (placeholder && !container.querySelector('.mqtt-message')) placeholder.remove();
+
+        const fragment = document.createDocumentFragment();
+        messages.slice(-this.maxRecentMessages).reverse().forEach((message) => {
+            const item = document.createElement('div');
+            item.className = 'mqtt-message';
+
+            const topic = document.createElement('div');
+            topic.className = 'message-topic';
+            topic.textContent = message.topic;
+
+            const time = document.createElement('div');
+            time.className = 'message-time';
+            time.textContent = message.received_at ? new Date(message.received_at).toLocaleString() : '';
+
+            const payload = document.createElement('div');
+            payload.className = 'message-payload';
+            payload.textContent = message.payload;
+
+            item.append(topic, time, payload);
+            fragment.appendChild(item);
+
+            this.bumpTopicCount(message);
+        });
+        container.prepend(fragment);
+
+        const items = container.querySelectorAll('.mqtt-message');
+        for (let i = this.maxRecentMessages; i < items.length; i++) {
+            items[i].remove();
+        }
+    }
+
+    bumpTopicCount(message) {
+        const card = document.querySelector(`[data-topic-id="${message.topic_id}"]`);
+        if (!card) return;
+
+        const count = card.querySelector('[data-topic-count]');
+        if (count) count.textContent = (parseInt(count.textContent, 10) || 0) + 1;
+
+        const latest = card.querySelector('[data-topic-latest]');
+        if (latest && message.received_at) latest.textContent = new Date(message.received_at).toLocaleString();
     }
 
     bindEvents() {
@@ -209,6 +371,9 @@ class MqttDashboard {
     }
 
     async refreshMessages() {
+        // New messages arrive through the live stream
+        if (this.stream) return;
+
         const messagesContainer = document.getElementById('mqtt-recent-messages');
         if (!messagesContainer) return;
 
@@ -222,12 +387,26 @@ class MqttDashboard {
     }
 
     async refreshTopics() {
-        // Reload topics section
-        location.reload();
+        // Topic cards are updated in place by the live stream
+        if (!this.stream) location.reload();
     }
 
     updateConnectionStatus(connected) {
         this.isConnected = connected;
+
+        // Dashboard template status block
+        const statusBlock = document.getElementById('connection-status');
+        if (statusBlock) {
+            statusBlock.className = `mqtt-status ${connected ? 'connected' : 'disconnected'}`;
+        }
+        const templateStatusText = document.getElementById('status-text');
+        if (templateStatusText) {
+            templateStatusText.textContent = connected ? 'Connected' : 'Disconnected';
+        }
+        const templateConnectBtn = document.getElementById('connect-btn');
+        const templateDisconnectBtn = document.getElementById('disconnect-btn');
+        if (templateConnectBtn) templateConnectBtn.style.display = connected ? 'none' : 'inline-block';
+        if (templateDisconnectBtn) templateDisconnectBtn.style.display = connected ? 'inline-block' : 'none';
         
         // Update status indicator
         const indicator = document.querySelector('.mqtt-status-indicator');
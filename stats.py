@@ -0,0 +1,74 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db.models import Case, Count, DateTimeField, F, Max, PositiveBigIntegerField, TextField, Value, When
+from django.db.models.functions import Greatest
+
+from .compression import STORED_PAYLOAD_FIELDS, payload_store
+from .models import MqttTopic, MqttMessage
+
+# Topics per UPDATE statement, keeps the CASE expressions a reasonable size
+UPDATE_CHUNK_SIZE = 200
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def record_topic_activity(activity: Dict[int, Tuple[int, object, str]]):
+    """Apply per-topic (new_messages, last_received_at, last_payload) from one ingest batch
+
+    Uses one UPDATE with CASE expressions per chunk of topics instead of one
+    statement per topic.
+    """
+    for chunk in _chunks(activity.items(), UPDATE_CHUNK_SIZE):
+        counts = [When(id=topic_id, then=Value(count)) for topic_id, (count, _, _) in chunk]
+        received = [When(id=topic_id, then=Value(received_at)) for topic_id, (_, received_at, _) in chunk]
+        payloads = [
+            When(id=topic_id, then=Value(payload[:MqttTopic.LAST_PAYLOAD_LENGTH]))
+            for topic_id, (_, _, payload) in chunk
+        ]
+        MqttTopic.objects.filter(id__in=[topic_id for topic_id, _ in chunk]).update(
+            message_count=F('message_count') + Case(*counts, default=Value(0), output_field=PositiveBigIntegerField()),
+            last_received_at=Case(*received, default=F('last_received_at'), output_field=DateTimeField()),
+            last_payload=Case(*payloads, default=F('last_payload'), output_field=TextField()),
+        )
+
+
+def decrement_message_counts(deltas: Dict[int, int]):
+    """Subtract deleted messages from MqttTopic.message_count"""
+    deltas = {topic_id: count for topic_id, count in deltas.items() if count}
+    for chunk in _chunks(deltas.items(), UPDATE_CHUNK_SIZE):
+        whens = [When(id=topic_id, then=Value(count)) for topic_id, count in chunk]
+        MqttTopic.objects.filter(id__in=[topic_id for topic_id, _ in chunk]).update(
+            message_count=Greatest(
+                F('message_count') - Case(*whens, default=Value(0), output_field=PositiveBigIntegerField()),
+                Value(0),
+            ),
+        )
+
+
+def count_by_topic(queryset) -> Dict[int, int]:
+    """Messages per topic in a MqttMessage queryset (used before bulk deletes)"""
+    return dict(queryset.order_by().values('topic_id').annotate(n=Count('id')).values_list('topic_id', 'n'))
+
+
+def rebuild_topic_stats(topic_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute stats from MqttMessage, returns the number of topics updated"""
+    topics = MqttTopic.objects.all()
+    if topic_ids is not None:
+        topics = topics.filter(id__in=list(topic_ids))
+
+    updated = 0
+    for topic_id in topics.values_list('id', flat=True).iterator():
+        messages = MqttMessage.objects.filter(topic_id=topic_id)
+        summary = messages.aggregate(count=Count('id'), last_received_at=Max('received_at'))
+        latest = messages.order_by('-received_at').values(*STORED_PAYLOAD_FIELDS).first()
+        MqttTopic.objects.filter(id=topic_id).update(
+            message_count=summary['count'],
+            last_received_at=summary['last_received_at'],
+            last_payload=(payload_store.unpack_row(latest) if latest else '')[:MqttTopic.LAST_PAYLOAD_LENGTH],
+        )
+        updated += 1
+    return updated
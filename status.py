@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from .models import MqttConnection, MqttTopic
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_KEY = 'mqtt:status'
+
+
+def _connection_status(record: Optional[MqttConnection]) -> dict:
+    return {
+        'status': record.status if record else 'disconnected',
+        'broker_host': record.broker_host if record else '',
+        'broker_port': record.broker_port if record else 1883,
+        'last_connected': record.last_connected.isoformat() if record and record.last_connected else None,
+        'last_error': record.last_error if record else '',
+    }
+
+
+def _topic_stats() -> dict:
+    # Single query over the maintained per-topic counters
+    stats = MqttTopic.objects.aggregate(
+        active_topics=Count('id', filter=Q(is_active=True)),
+        total_messages=Sum('message_count'),
+    )
+    return {
+        'active_topics': stats['active_topics'],
+        'total_messages': stats['total_messages'] or 0,
+    }
+
+
+class StatusSnapshot:
+    """Connection status and topic stats served without database queries
+
+    The client service pushes connection changes as they happen and topic
+    stats at most every MQTT_STATUS_STATS_INTERVAL seconds while ingesting.
+    The snapshot lives in the Django cache so web processes see what the
+    ``mqtt_client`` process published (use a shared backend such as Redis or
+    Memcached for that); entries expire after MQTT_STATUS_CACHE_TIMEOUT
+    seconds, after which the next reader rebuilds it from the database.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, stats_interval: Optional[float] = None):
+        self.timeout = timeout if timeout is not None else getattr(settings, 'MQTT_STATUS_CACHE_TIMEOUT', 60)
+        if stats_interval is None:
+            stats_interval = getattr(settings, 'MQTT_STATUS_STATS_INTERVAL', 10)
+        self.stats_interval = stats_interval
+        self._data: Optional[dict] = None
+        self._stats_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        """``{'data': ..., 'etag': ...}``, rebuilt from the database only on a cache miss"""
+        snapshot = cache.get(STATUS_CACHE_KEY)
+        if snapshot is None:
+            connection = _connection_status(MqttConnection.default())
+            snapshot = self._store({
+                'is_connected': connection['status'] == 'connected',
+                'connection': connection,
+                'stats': _topic_stats(),
+            })
+        return snapshot
+
+    def publish_connection(self, status: dict):
+        """Record a connection change from the client service (``get_status`` dict)"""
+        with self._lock:
+            data = self._current()
+            data['is_connected'] = status['is_connected']
+            data['connection'] = {key: status[key] for key in
+                                  ('status', 'broker_host', 'broker_port', 'last_connected', 'last_error')}
+            self._store(data)
+
+    def refresh_stats(self, force: bool = False):
+        """Re-read topic stats, throttled to one query per stats interval"""
+        now = time.monotonic()
+        if not force and now - self._stats_at < self.stats_interval:
+            return
+        self._stats_at = now
+        try:
+            stats = _topic_stats()
+        except Exception as e:
+            logger.error(f"Error refreshing MQTT status stats: {e}")
+            return
+        with self._lock:
+            data = self._current()
+            data['stats'] = stats
+            self._store(data)
+
+    def invalidate(self):
+        """Drop the cached snapshot, e.g. after topics were added or removed"""
+        self._stats_at = float('-inf')
+        self._data = None
+        cache.delete(STATUS_CACHE_KEY)
+
+    def _current(self) -> dict:
+        if self._data is not None:
+            return dict(self._data)
+        return dict(self.get()['data'])
+
+    def _store(self, data: dict) -> dict:
+        body = json.dumps(data, sort_keys=True)
+        snapshot = {
+            'data': data,
+            'etag': hashlib.md5(body.encode('utf-8'), usedforsecurity=False).hexdigest(),
+        }
+        self._data = data
+        try:
+            cache.set(STATUS_CACHE_KEY, snapshot, self.timeout)
+        except Exception as e:
+            logger.error(f"Error caching MQTT status: {e}")
+        return snapshot
+
+
+# Global status snapshot
+status_snapshot = StatusSnapshot()
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Iterator, List, Optional
+
+from django.conf import settings
+
+from .topics import topic_matches
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSubscription:
+    """Bounded per-client event buffer, oldest events are dropped when a client falls behind"""
+
+    def __init__(self, topic_filters: Optional[List[str]] = None, max_queue: int = 1000):
+        self.topic_filters = topic_filters or []
+        self.dropped = 0
+        self._events = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        # Set by adrain, pushes then wake the consuming event loop instead of a thread
+        self._loop = None
+        self._ready = None
+
+    def wants(self, topic: str) -> bool:
+        if not self.topic_filters:
+            return True
+        return any(topic_matches(topic_filter, topic) for topic_filter in self.topic_filters)
+
+    def push(self, event: dict):
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._cond.notify()
+            loop, ready = self._loop, self._ready
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # Event loop already closed, the stream is going away
+                pass
+
+    def drain(self, timeout: float) -> List[dict]:
+        """Wait up to timeout for events and return everything buffered"""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    async def adrain(self, timeout: float) -> List[dict]:
+        """``drain`` for an event loop: waits without holding a thread"""
+        if self._loop is None:
+            self._ready = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        deadline = self._loop.time() + timeout
+        while True:
+            with self._cond:
+                if self._events:
+                    events = list(self._events)
+                    self._events.clear()
+                    return events
+                self._ready.clear()
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+
+class MessageBroadcaster:
+    """Fan out messages from the client service callbacks to live stream subscribers
+
+    Events are built in memory from the message objects the ingest path
+    already has, so live views never query the database.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._registered = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def ensure_registered(self, service, status: bool = True):
+        """Hook into a client service's callbacks once (status events only from the default broker)"""
+        with self._lock:
+            if id(service) in self._registered:
+                return
+            service.add_message_callback(self.on_message)
+            if status:
+                service.add_status_callback(self.on_status)
+            self._registered.add(id(service))
+
+    def subscribe(self, topic_filters: Optional[List[str]] = None) -> StreamSubscription:
+        subscription = StreamSubscription(
+            topic_filters,
+            max_queue=getattr(settings, 'MQTT_STREAM_QUEUE_SIZE', 1000),
+        )
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: StreamSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def on_message(self, topic, message):
+        """Message callback registered on the client service"""
+        if not self._subscribers:
+            return
+        event = {
+            'type': 'message',
+            'id': message.id,
+            'topic': topic.name,
+            'topic_id': topic.id,
+            'payload': message.payload_preview,
+            'qos': message.qos,
+            'retain': message.retain,
+            'received_at': message.received_at.isoformat() if message.received_at else None,
+        }
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(topic.name):
+                subscription.push(event)
+
+    def on_status(self, status: dict):
+        """Status callback registered on the client service"""
+        event = dict(status, type='status')
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event)
+
+
+def coalesce_events(events: List[dict]) -> List[dict]:
+    """Keep only the newest message per topic (and the newest status event)"""
+    latest = OrderedDict()
+    for event in events:
+        key = event['topic'] if event['type'] == 'message' else '$status'
+        latest.pop(key, None)
+        latest[key] = event
+    return list(latest.values())
+
+
+def sse_event(name: str, data) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _batch_events(subscription: StreamSubscription, events: List[dict], coalesce: bool,
+                  max_batch: int) -> List[str]:
+    """SSE chunks for one flush: the newest status and up to max_batch messages"""
+    if coalesce:
+        events = coalesce_events(events)
+
+    chunks = []
+    statuses = [event for event in events if event['type'] == 'status']
+    messages = [event for event in events if event['type'] == 'message']
+    if statuses:
+        chunks.append(sse_event('status', statuses[-1]))
+
+    if messages:
+        dropped = subscription.dropped + max(0, len(messages) - max_batch)
+        subscription.dropped = 0
+        chunks.append(sse_event('messages', {'messages': messages[-max_batch:], 'dropped': dropped}))
+    return chunks
+
+
+def _stream_settings():
+    return (getattr(settings, 'MQTT_STREAM_MIN_INTERVAL', 0.5), getattr(settings, 'MQTT_STREAM_MAX_BATCH', 100),
+            getattr(settings, 'MQTT_STREAM_MAX_DURATION', 300), getattr(settings, 'MQTT_STREAM_KEEPALIVE', 15))
+
+
+def event_stream(broadcaster: MessageBroadcaster, subscription: StreamSubscription, initial_status: dict,
+                 coalesce: bool = False) -> Iterator[str]:
+    """Server-sent events generator
+
+    Events are flushed at most once per MQTT_STREAM_MIN_INTERVAL seconds as a
+    single ``messages`` event holding up to MQTT_STREAM_MAX_BATCH entries. The
+    stream ends after MQTT_STREAM_MAX_DURATION seconds so workers are not held
+    forever; EventSource reconnects automatically.
+    """
+    min_interval, max_batch, max_duration, keepalive = _stream_settings()
+
+    started = time.monotonic()
+    try:
+        yield 'retry: 3000\n\n'
+        yield sse_event('status', dict(initial_status, type='status'))
+
+        while time.monotonic() - started < max_duration:
+            events = subscription.drain(keepalive)
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+
+            last_sent = time.monotonic()
+            yield from _batch_events(subscription, events, coalesce, max_batch)
+            # Rate limit: let events accumulate until the next flush window
+            wait = min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def async_event_stream(broadcaster: MessageBroadcaster, subscription: StreamSubscription,
+                             initial_status: dict, coalesce: bool = False) -> AsyncIterator[str]:
+    """``event_stream`` for ASGI servers, an open stream holds no worker thread"""
+    min_interval, max_batch, max_duration, keepalive = _stream_settings()
+
+    started = time.monotonic()
+    try:
+        yield 'retry: 3000\n\n'
+        yield sse_event('status', dict(initial_status, type='status'))
+
+        while time.monotonic() - started < max_duration:
+            events = await subscription.adrain(keepalive)
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+
+            last_sent = time.monotonic()
+            for chunk in _batch_events(subscription, events, coalesce, max_batch):
+                yield chunk
+            wait = min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+# Global broadcaster instance
+broadcaster = MessageBroadcaster()
@@ -1,3 +1,589 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-# Create your tests here.
+import paho.mqtt.client as mqtt
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.contrib.admin.sites import site
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .compression import COMPRESSION_NONE, COMPRESSION_ZLIB, payload_store
+from .dedup import DEDUP_KEY_PAYLOAD, MessageDeduplicator
+from .export import encode, export_rows, parse_bound, resolve_topics
+from .ingest import BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_SPILL, IngestPipeline, IngestRecord
+from .last_value import last_value_cache
+from .metrics import MetricsRegistry, start_metrics_server
+from .models import MqttConnection, MqttMessage, MqttOutboxMessage, MqttTopic
+from .mqtt_client import MqttClientService
+from .pagination import InvalidCursor, decode_cursor, keyset_page
+from .publish import STATUS_SENT, PublishResult, PublishTracker
+from .payloads import codec_registry
+from .retention import RetentionEngine
+from .search import parse_query, search_index
+from .stream import MessageBroadcaster, async_event_stream
+from .topic_cache import topic_cache
+from . import views
+
+
+def record(topic, payload, qos=0, packet_id=0, dup=False, timestamp=None):
+    return IngestRecord(topic, payload, qos, False, timestamp or timezone.now(), packet_id=packet_id, dup=dup)
+
+
+class MqttTestCase(TestCase):
+    """Resets the process-wide caches, they outlive the rolled back test transaction"""
+
+    def setUp(self):
+        topic_cache.clear()
+        codec_registry.invalidate()
+        payload_store.invalidate()
+        search_index.invalidate()
+        self.service = MqttClientService()
+
+    def create_messages(self, topic, count, start=None):
+        """``count`` messages one second apart, oldest first"""
+        start = start or timezone.now() - timedelta(seconds=count)
+        messages = MqttMessage.objects.bulk_create(
+            MqttMessage(topic=topic, payload=str(i), payload_size=1) for i in range(count)
+        )
+        for i, message in enumerate(messages):
+            message.received_at = start + timedelta(seconds=i)
+        MqttMessage.objects.bulk_update(messages, ['received_at'])
+        return messages
+
+
+class IngestPipelineTests(TestCase):
+    def test_size_triggered_batches(self):
+        batches = []
+        pipeline = IngestPipeline(batches.append, batch_size=10, flush_interval=5, name='test-batches')
+        for i in range(25):
+            pipeline.submit(record('t', str(i).encode()))
+        pipeline.start()
+        pipeline.stop()
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(pipeline.stats['written'], 25)
+
+    def test_drop_oldest_when_full(self):
+        batches = []
+        pipeline = IngestPipeline(batches.append, batch_size=5, max_queue_size=5,
+                                  backpressure=BACKPRESSURE_DROP_OLDEST, name='test-drop')
+        for i in range(8):
+            pipeline.submit(record('t', str(i).encode()))
+        self.assertEqual(pipeline.depth, 5)
+        self.assertEqual(pipeline.stats['dropped'], 3)
+        pipeline.start()
+        pipeline.stop()
+        self.assertEqual([r.payload for r in batches[0]], [b'3', b'4', b'5', b'6', b'7'])
+
+    def test_spill_when_full(self):
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spill_dir)
+        pipeline = IngestPipeline(lambda batch: None, batch_size=2, max_queue_size=2,
+                                  backpressure=BACKPRESSURE_SPILL, spill_dir=spill_dir, name='test-spill')
+        accepted = [pipeline.submit(record('t', b'x', qos=1, packet_id=7, dup=True)) for _ in range(3)]
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(pipeline.stats['spilled'], 1)
+        with open(pipeline.spill_path) as fh:
+            spilled = IngestRecord.from_json(fh.readline())
+        self.assertEqual((spilled.payload, spilled.packet_id, spilled.dup), (b'x', 7, True))
+
+    def test_non_blocking_submit_spills_when_full(self):
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spill_dir)
+        pipeline = IngestPipeline(lambda batch: None, batch_size=2, max_queue_size=2,
+                                  spill_dir=spill_dir, name='test-nonblocking')
+        accepted = [pipeline.submit(record('t', b'x'), block=False) for _ in range(3)]
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual((pipeline.depth, pipeline.stats['spilled']), (2, 1))
+
+    def test_failed_batch_is_counted(self):
+        def fail(batch):
+            raise RuntimeError('boom')
+
+        pipeline = IngestPipeline(fail, batch_size=2, name='test-fail')
+        pipeline.submit(record('t', b'x'))
+        pipeline.start()
+        pipeline.stop()
+        self.assertEqual(pipeline.stats['failed_batches'], 1)
+        self.assertEqual(pipeline.stats['written'], 0)
+
+
+class TopicCacheTests(MqttTestCase):
+    def test_resolve_creates_and_caches(self):
+        ids = topic_cache.resolve(['a/1', 'a/2'])
+        self.assertEqual(set(ids), {'a/1', 'a/2'})
+        with self.assertNumQueries(0):
+            self.assertEqual(topic_cache.resolve(['a/1']), {'a/1': ids['a/1']})
+
+    def test_rename_and_delete_invalidate(self):
+        topic = MqttTopic.objects.create(name='old/name')
+        topic_cache.resolve(['old/name'])
+        topic.name = 'new/name'
+        topic.save()
+        self.assertIsNone(topic_cache.get('old/name'))
+
+        topic_cache.resolve(['new/name'])
+        topic.delete()
+        self.assertIsNone(topic_cache.get('new/name'))
+
+
+class StaleTopicTests(TransactionTestCase):
+    # SQLite checks foreign keys at commit, so this needs real transactions
+
+    def setUp(self):
+        topic_cache.clear()
+        self.service = MqttClientService()
+
+    def test_batch_for_topic_deleted_elsewhere_is_retried(self):
+        self.service._write_batch([record('gone/1', b'1')])
+        topic_id = topic_cache.get('gone/1')
+        # Deleted by another process: no signal reaches this cache
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {MqttMessage._meta.db_table} WHERE topic_id = %s', [topic_id])
+            cursor.execute(f'DELETE FROM {MqttTopic._meta.db_table} WHERE id = %s', [topic_id])
+
+        self.service._write_batch([record('gone/1', b'2')])
+        self.assertNotEqual(topic_cache.get('gone/1'), topic_id)
+        self.assertEqual(list(MqttMessage.objects.filter(topic__name='gone/1').values_list('payload', flat=True)),
+                         ['2'])
+
+
+class RetentionTests(MqttTestCase):
+    def test_max_messages_keeps_newest(self):
+        topic = MqttTopic.objects.create(name='r/count', max_messages=5)
+        messages = self.create_messages(topic, 10)
+        deleted = RetentionEngine().run_once([topic.id])
+        self.assertEqual(deleted, 5)
+        self.assertEqual(set(MqttMessage.objects.filter(topic=topic).values_list('id', flat=True)),
+                         {message.id for message in messages[5:]})
+
+    def test_tied_timestamps(self):
+        topic = MqttTopic.objects.create(name='r/tied', max_messages=3)
+        messages = self.create_messages(topic, 6)
+        MqttMessage.objects.filter(id__in=[m.id for m in messages]).update(received_at=messages[0].received_at)
+        engine = RetentionEngine()
+        self.assertEqual(engine.run_once([topic.id]), 3)
+        self.assertEqual(set(MqttMessage.objects.filter(topic=topic).values_list('id', flat=True)),
+                         {message.id for message in messages[3:]})
+        self.assertEqual(engine._counts[topic.id], 3)
+
+    def test_max_bytes_with_tied_timestamps(self):
+        topic = MqttTopic.objects.create(name='r/bytes', max_bytes=2)
+        messages = self.create_messages(topic, 4)
+        MqttMessage.objects.filter(id__in=[m.id for m in messages]).update(received_at=messages[0].received_at)
+        engine = RetentionEngine()
+        engine.run_once([topic.id])
+        self.assertEqual(set(MqttMessage.objects.filter(topic=topic).values_list('id', flat=True)),
+                         {message.id for message in messages[2:]})
+        self.assertEqual(engine._bytes[topic.id], 2)
+
+    def test_max_age_expires_old_messages(self):
+        topic = MqttTopic.objects.create(name='r/age', max_age=timedelta(hours=1))
+        self.create_messages(topic, 3, start=timezone.now() - timedelta(hours=2))
+        recent = self.create_messages(topic, 2)
+        RetentionEngine().run_once([topic.id])
+        self.assertEqual(set(MqttMessage.objects.filter(topic=topic).values_list('id', flat=True)),
+                         {message.id for message in recent})
+
+    def test_other_topics_untouched(self):
+        limited = MqttTopic.objects.create(name='r/limited', max_messages=1)
+        other = MqttTopic.objects.create(name='r/other')
+        self.create_messages(limited, 3)
+        self.create_messages(other, 3)
+        RetentionEngine().run_once([limited.id])
+        self.assertEqual(MqttMessage.objects.filter(topic=other).count(), 3)
+
+
+class KeysetPaginationTests(MqttTestCase):
+    def setUp(self):
+        super().setUp()
+        topic = MqttTopic.objects.create(name='p/1')
+        self.ids = [message.id for message in self.create_messages(topic, 7)]
+        self.messages = MqttMessage.objects.filter(topic=topic)
+
+    def test_walks_every_row_once_newest_first(self):
+        seen = []
+        page = keyset_page(self.messages, ['id'], 3)
+        seen += [row['id'] for row in page['rows']]
+        while page['has_older']:
+            page = keyset_page(self.messages, ['id'], 3, before=page['next_cursor'])
+            seen += [row['id'] for row in page['rows']]
+        self.assertEqual(seen, list(reversed(self.ids)))
+
+    def test_after_returns_newer_rows(self):
+        older = keyset_page(self.messages, ['id'], 3, before=keyset_page(self.messages, ['id'], 3)['next_cursor'])
+        newer = keyset_page(self.messages, ['id'], 3, after=older['prev_cursor'])
+        self.assertEqual([row['id'] for row in newer['rows']], list(reversed(self.ids[4:])))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not a cursor')
+
+
+class DedupTests(MqttTestCase):
+    def test_packet_id_wraparound_keeps_genuine_repeats(self):
+        dedup = MessageDeduplicator(capacity=200000)
+        # More messages than packet ids: keys repeat, none of them is a redelivery
+        dropped = sum(dedup.is_duplicate('d/1', b'ON', 1, i % 65535 + 1) for i in range(80000))
+        self.assertEqual(dropped, 0)
+
+    def test_drops_dup_redelivery(self):
+        dedup = MessageDeduplicator()
+        self.assertFalse(dedup.is_duplicate('d/1', b'ON', 1, 42))
+        self.assertTrue(dedup.is_duplicate('d/1', b'ON', 1, 42, dup=True))
+        self.assertFalse(dedup.is_duplicate('d/1', b'OFF', 1, 43, dup=True))
+
+    def test_qos0_never_checked(self):
+        dedup = MessageDeduplicator()
+        self.assertFalse(dedup.is_duplicate('d/1', b'ON', 0, 0))
+        self.assertFalse(dedup.is_duplicate('d/1', b'ON', 0, 0, dup=True))
+        self.assertEqual(dedup.stats['checked'], 0)
+
+    def test_payload_key_drops_repeats(self):
+        dedup = MessageDeduplicator(key=DEDUP_KEY_PAYLOAD)
+        self.assertFalse(dedup.is_duplicate('d/1', b'{"seq": 1}', 1, 1))
+        self.assertTrue(dedup.is_duplicate('d/1', b'{"seq": 1}', 1, 2))
+
+    def test_stored_content_hash(self):
+        self.service.content_hashes = True
+        now = timezone.now()
+        self.service._write_batch([record('d/hash', b'ON', qos=1, packet_id=5, timestamp=now)])
+        # A redelivery after a restart is dropped, a wrapped packet id with the same payload is kept
+        self.service._write_batch([record('d/hash', b'ON', qos=1, packet_id=5, dup=True, timestamp=now)])
+        self.service._write_batch([record('d/hash', b'ON', qos=1, packet_id=5, timestamp=now)])
+        hashes = list(MqttMessage.objects.filter(topic__name='d/hash').order_by('id')
+                      .values_list('content_hash', flat=True))
+        self.assertEqual(len(hashes), 2)
+        self.assertIsNotNone(hashes[0])
+        self.assertIsNone(hashes[1])
+
+    def test_content_hash_race_retries_batch(self):
+        self.service.content_hashes = True
+        now = timezone.now()
+        self.service._write_batch([record('d/race', b'ON', qos=1, packet_id=5, timestamp=now)])
+        filter_stored = self.service.filter_stored
+        calls = []
+
+        def racing(records):
+            # The first lookup misses the row another writer just committed
+            calls.append(records)
+            if len(calls) == 1:
+                return records, [self.service.dedup.content_hash(r.topic, r.payload, r.packet_id, r.timestamp)
+                                 for r in records]
+            return filter_stored(records)
+
+        self.service.filter_stored = racing
+        self.service._write_batch([record('d/race', b'ON', qos=1, packet_id=5, dup=True, timestamp=now),
+                                   record('d/race', b'OFF', qos=1, packet_id=6, timestamp=now)])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(MqttMessage.objects.filter(topic__name='d/race').values_list('payload', flat=True)),
+                         ['OFF', 'ON'])
+
+
+class CompressionTests(MqttTestCase):
+    payload = json.dumps({'device_id': 'sensor-1', 'readings': [{'temp': 21.5, 'humidity': 40}] * 40})
+
+    def test_round_trip_through_ingest(self):
+        MqttTopic.objects.create(name='c/zlib', payload_compression=COMPRESSION_ZLIB)
+        self.service._write_batch([record('c/zlib', self.payload.encode())])
+        message = MqttMessage.objects.get(topic__name='c/zlib')
+        self.assertEqual(message.payload_compression, COMPRESSION_ZLIB)
+        self.assertEqual(message.payload, '')
+        self.assertLess(len(message.payload_blob), len(self.payload))
+        self.assertEqual(message.payload_text, self.payload)
+
+    def test_small_payloads_stay_inline(self):
+        topic = MqttTopic.objects.create(name='c/small', payload_compression=COMPRESSION_ZLIB)
+        packed = payload_store.pack(topic.id, 'short', timezone.now())
+        self.assertEqual((packed.payload, packed.compression, packed.blob), ('short', COMPRESSION_NONE, None))
+
+    def test_offload_size_counts_bytes(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storages = {'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                                'OPTIONS': {'location': location}}}
+        with override_settings(STORAGES=storages, MQTT_PAYLOAD_OFFLOAD_SIZE=64):
+            topic = MqttTopic.objects.create(name='c/utf8')
+            # 40 characters, 80 bytes
+            packed = payload_store.pack(topic.id, '\u00e9' * 40, timezone.now())
+            self.assertIsNotNone(packed.file)
+            self.assertEqual(packed.payload, '')
+
+    def test_offloaded_payload_round_trip(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storages = {'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                                'OPTIONS': {'location': location}}}
+        with override_settings(STORAGES=storages, MQTT_PAYLOAD_OFFLOAD_SIZE=64):
+            topic = MqttTopic.objects.create(name='c/file')
+            packed = payload_store.pack(topic.id, self.payload, timezone.now())
+            self.assertTrue(os.path.exists(os.path.join(location, packed.file)))
+            self.assertEqual(payload_store.unpack(packed.payload, packed.blob, packed.compression, packed.file,
+                                                  packed.dictionary_id), self.payload)
+
+
+class SearchTests(MqttTestCase):
+    def setUp(self):
+        super().setUp()
+        MqttTopic.objects.create(name='s/1', search_enabled=True, search_keys='device_id')
+        MqttTopic.objects.create(name='s/2', search_enabled=True, search_keys='device_id')
+        self.service._write_batch([
+            record('s/1', b'{"device_id": "a", "status": "overheating"}'),
+            record('s/1', b'{"device_id": "b", "status": "normal"}'),
+            record('s/2', b'{"device_id": "a", "status": "overheating"}'),
+        ])
+
+    def search(self, queryset, term):
+        query, keys = parse_query(term)
+        return sorted(search_index.filter(queryset, query, keys).values_list('topic__name', 'payload'))
+
+    def test_full_text_and_key_lookups(self):
+        messages = MqttMessage.objects.all()
+        self.assertEqual(len(self.search(messages, 'overheating')), 2)
+        self.assertEqual(self.search(messages, 'device_id=b'),
+                         [('s/1', '{"device_id": "b", "status": "normal"}')])
+        self.assertEqual([name for name, _ in self.search(messages, 'overheating device_id=a')], ['s/1', 's/2'])
+        self.assertEqual(self.search(messages, 'missing'), [])
+
+    def test_quotes_are_not_query_syntax(self):
+        self.assertEqual(self.search(MqttMessage.objects.all(), '"overheating OR'), [])
+
+    def test_admin_search_keeps_changelist_filters(self):
+        admin = site._registry[MqttMessage]
+        filtered = MqttMessage.objects.filter(topic__name='s/2')
+        results, _ = admin.get_search_results(None, filtered, 'overheating')
+        self.assertEqual(set(results.values_list('topic__name', flat=True)), {'s/2'})
+
+    def test_sweep_removes_entries_of_deleted_messages(self):
+        MqttMessage.objects.filter(topic__name='s/1').delete()
+        self.assertGreater(search_index.sweep(), 0)
+        self.assertEqual(self.search(MqttMessage.objects.all(), 'device_id=b'), [])
+
+
+class FakeClient:
+    """paho stand-in that accepts every publish and never acks"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos, retain):
+        self.published.append(payload)
+        return SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS, mid=len(self.published))
+
+
+@override_settings(MQTT_PUBLISH_TIMEOUT=0.05)
+class OutboxReplayTests(TestCase):
+    def setUp(self):
+        self.service = MqttClientService()
+        self.service.publisher = PublishTracker(2)
+        self.service.client = FakeClient()
+        self.service.is_connected = True
+        self.rows = MqttOutboxMessage.objects.bulk_create(
+            MqttOutboxMessage(topic='o/1', payload=str(i)) for i in range(5)
+        )
+        # The replay runs while connected, disconnect after a few rounds
+        wait = self.service.publisher.wait
+        self.rounds = 0
+
+        def counted(results, timeout=None):
+            self.rounds += 1
+            if self.rounds >= 4:
+                self.service.is_connected = False
+            return wait(results, timeout)
+
+        self.service.publisher.wait = counted
+
+    def replay(self):
+        self.rounds = 0
+        self.service.is_connected = True
+        self.service._replay_outbox()
+
+    def test_full_window_is_retried_not_dropped(self):
+        # Another publisher holds the whole window
+        for mid in (101, 102):
+            self.service.publisher.acquire()
+            self.service.publisher.track(PublishResult('other', 1, STATUS_SENT, mid=mid))
+        self.replay()
+        self.assertEqual(self.service.client.published, [])
+        self.assertEqual(MqttOutboxMessage.objects.count(), 5)
+        first = MqttOutboxMessage.objects.get(id=self.rows[0].id)
+        self.assertGreater(first.attempts, 0)
+        self.assertIn('in-flight window', first.last_error)
+
+    def test_unacked_rows_are_not_sent_twice(self):
+        self.replay()
+        self.assertEqual(self.service.client.published, ['0', '1'])
+        self.assertEqual(MqttOutboxMessage.objects.count(), 5)
+
+        for mid in (1, 2):
+            self.service.publisher.on_publish(mid)
+        self.replay()
+        self.assertEqual(self.service.client.published, ['0', '1', '2', '3'])
+        self.assertEqual(list(MqttOutboxMessage.objects.order_by('id').values_list('payload', flat=True)),
+                         ['2', '3', '4'])
+
+
+class ConnectionAdminTests(TestCase):
+    def setUp(self):
+        self.connection = MqttConnection.objects.create(broker_host='broker', password='secret')
+        self.admin = site._registry[MqttConnection]
+        request = RequestFactory().get('/')
+        self.form_class = self.admin.get_form(request, self.connection)
+
+    def data(self, **values):
+        return dict({'broker_host': 'broker', 'broker_port': 1883, 'keepalive': 60, 'is_enabled': True},
+                    **values)
+
+    def test_password_is_not_rendered(self):
+        self.assertNotIn('secret', str(self.form_class(instance=self.connection)))
+
+    def test_blank_password_keeps_stored_value(self):
+        form = self.form_class(self.data(password=''), instance=self.connection)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().password, 'secret')
+
+    def test_new_password_replaces_stored_value(self):
+        form = self.form_class(self.data(password='changed'), instance=self.connection)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().password, 'changed')
+
+
+@override_settings(MQTT_METRICS_TOKEN='token')
+class MetricsExporterTests(TestCase):
+    def setUp(self):
+        metrics = MetricsRegistry()
+        metrics.counter('mqtt_test_total', 'Test counter').inc()
+        self.server = start_metrics_server(0, '127.0.0.1', metrics)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/metrics'
+
+    def test_serves_registry_with_token(self):
+        request = Request(self.url, headers={'Authorization': 'Bearer token'})
+        with urlopen(request, timeout=5) as response:
+            self.assertIn('mqtt_test_total 1', response.read().decode())
+
+    def test_rejects_wrong_token(self):
+        for headers in ({}, {'Authorization': 'Bearer other'}):
+            with self.assertRaises(HTTPError) as raised:
+                urlopen(Request(self.url, headers=headers), timeout=5)
+            self.assertEqual(raised.exception.code, 403)
+
+
+@override_settings(MQTT_STREAM_MIN_INTERVAL=0, MQTT_STREAM_KEEPALIVE=5)
+class AsyncStreamTests(TestCase):
+    def test_events_pushed_from_another_thread_wake_the_stream(self):
+        broadcaster = MessageBroadcaster()
+        subscription = broadcaster.subscribe()
+
+        async def read():
+            stream = async_event_stream(broadcaster, subscription, {'connected': True})
+            chunks = [await stream.__anext__(), await stream.__anext__()]
+            threading.Timer(0.05, broadcaster.on_status, ({'connected': False},)).start()
+            chunks.append(await stream.__anext__())
+            await stream.aclose()
+            return chunks
+
+        chunks = async_to_sync(read)()
+        self.assertIn('"connected": false', chunks[-1])
+        self.assertEqual(broadcaster.subscriber_count, 0)
+
+
+class ViewBoundsTests(MqttTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username='staff', is_staff=True)
+        self.service._write_batch([record('v/1', b'{"device_id": "a"}')])
+
+    def get(self, view, query):
+        request = RequestFactory().get('/', query)
+        request.user = self.user
+        return view(request)
+
+    def test_snapshot_naive_since(self):
+        last_value_cache.update([last_value_cache.entry(
+            topic_cache.get('v/1'), 'v/1', 'x', 'text', 0, False, timezone.now(), timezone.now()
+        )])
+        naive = (timezone.localtime() - timedelta(hours=1)).replace(tzinfo=None).isoformat()
+        response = self.get(views.mqtt_snapshot, {'since': naive, 'topic': 'v/1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['count'], 1)
+
+    def test_invalid_since_is_400(self):
+        for view, query in ((views.mqtt_snapshot, {}), (views.mqtt_search, {'q': 'a'}),
+                            (views.mqtt_export, {'topic': 'v/1'})):
+            response = self.get(view, dict(query, since='yesterday'))
+            self.assertEqual(response.status_code, 400)
+        request = RequestFactory().get('/', {'start': 'yesterday'})
+        request.user = self.user
+        self.assertEqual(views.mqtt_topic_aggregate(request, topic_cache.get('v/1')).status_code, 400)
+
+    def test_search_and_export_accept_dates(self):
+        today = timezone.localdate().isoformat()
+        response = self.get(views.mqtt_search, {'q': 'device_id=a', 'since': today})
+        self.assertEqual(response.status_code, 200)
+        response = self.get(views.mqtt_export, {'topic': 'v/#', 'since': today, 'format': 'ndjson'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(row)['topic'] for row in rows], ['v/1'])
+
+
+class ExportTests(MqttTestCase):
+    def setUp(self):
+        super().setUp()
+        MqttTopic.objects.create(name='e/zlib', payload_compression=COMPRESSION_ZLIB)
+        self.long = 'x' * 1000
+        self.service._write_batch([record('e/plain', b'1,"a"'), record('e/zlib', self.long.encode())])
+
+    def test_resolve_topics_with_wildcards(self):
+        self.assertEqual(set(resolve_topics(['e/#']).values()), {'e/plain', 'e/zlib'})
+        self.assertEqual(set(resolve_topics(['e/plain', 'missing']).values()), {'e/plain'})
+
+    def test_csv_round_trip(self):
+        rows = export_rows(resolve_topics(['e/+']), chunk_size=1)
+        text = b''.join(encode(rows, 'csv')).decode()
+        exported = {row['topic']: row['payload'] for row in csv.DictReader(io.StringIO(text))}
+        self.assertEqual(exported, {'e/plain': '1,"a"', 'e/zlib': self.long})
+
+    def test_gzip_ndjson(self):
+        data = b''.join(encode(export_rows(resolve_topics(['e/zlib'])), 'ndjson', gzip=True))
+        rows = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+        self.assertEqual([row['payload'] for row in rows], [self.long])
+
+    def test_asgi_export_is_async(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/mqtt/export/', 'headers': [],
+                 'query_string': b'topic=e/%2B&format=ndjson'}
+        request = ASGIRequest(scope, io.BytesIO())
+        request.user = get_user_model().objects.create(username='staff', is_staff=True)
+        response = views.mqtt_export(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        rows = [json.loads(line) for line in async_to_sync(read)().decode().splitlines()]
+        self.assertEqual({row['topic'] for row in rows}, {'e/plain', 'e/zlib'})
+
+    def test_bounds(self):
+        topics = resolve_topics(['e/#'])
+        self.assertEqual(list(export_rows(topics, since=timezone.now() + timedelta(minutes=1))), [])
+        self.assertEqual(len(list(export_rows(topics, until=timezone.now() + timedelta(minutes=1)))), 2)
+
+    def test_parse_bound(self):
+        self.assertTrue(timezone.is_aware(parse_bound('2026-01-02T03:04:05')))
+        self.assertEqual(timezone.localtime(parse_bound('2026-01-02')).replace(tzinfo=None), datetime(2026, 1, 2))
+        self.assertEqual(parse_bound('2026-01-02T03:04:05+00:00').utcoffset(), timedelta(0))
+        with self.assertRaises(ValueError):
+            parse_bound('tomorrow')
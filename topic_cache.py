@@ -0,0 +1,106 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+from .models import MqttTopic
+
+logger = logging.getLogger(__name__)
+
+
+class TopicCache:
+    """Bounded LRU cache of topic name -> MqttTopic id"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        if max_size is None:
+            max_size = getattr(settings, 'MQTT_TOPIC_CACHE_SIZE', 10000)
+        self.max_size = max(1, max_size)
+        self._ids = OrderedDict()
+        self._names = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, name: str) -> Optional[int]:
+        with self._lock:
+            topic_id = self._ids.get(name)
+            if topic_id is None:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(name)
+            self.hits += 1
+            return topic_id
+
+    def set(self, name: str, topic_id: int):
+        with self._lock:
+            self._set(name, topic_id)
+
+    def _set(self, name: str, topic_id: int):
+        self._ids[name] = topic_id
+        self._ids.move_to_end(name)
+        self._names[topic_id] = name
+        while len(self._ids) > self.max_size:
+            evicted_name, evicted_id = self._ids.popitem(last=False)
+            self._names.pop(evicted_id, None)
+
+    def invalidate(self, name: Optional[str] = None, topic_id: Optional[int] = None):
+        """Drop an entry by name and/or id (the name may have changed since it was cached)"""
+        with self._lock:
+            if topic_id is not None:
+                old_name = self._names.pop(topic_id, None)
+                if old_name is not None:
+                    self._ids.pop(old_name, None)
+            if name is not None:
+                cached_id = self._ids.pop(name, None)
+                if cached_id is not None:
+                    self._names.pop(cached_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+    def warm(self):
+        """Preload the most recently updated topics from the database"""
+        rows = MqttTopic.objects.order_by('-updated_at').values_list('name', 'id')[:self.max_size]
+        with self._lock:
+            # Insert oldest first so the most recently updated end up as most recently used
+            for name, topic_id in reversed(list(rows)):
+                self._set(name, topic_id)
+        logger.info(f"Warmed MQTT topic cache with {len(self._ids)} topics")
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, int]:
+        """Map topic names to ids, creating missing topics with as few queries as possible"""
+        resolved = {}
+        missing = []
+        for name in set(names):
+            topic_id = self.get(name)
+            if topic_id is None:
+                missing.append(name)
+            else:
+                resolved[name] = topic_id
+
+        if missing:
+            found = dict(MqttTopic.objects.filter(name__in=missing).values_list('name', 'id'))
+            to_create = [name for name in missing if name not in found]
+            if to_create:
+                MqttTopic.objects.bulk_create([
+                    MqttTopic(name=name, description=f'Auto-created topic for {name}')
+                    for name in to_create
+                ], ignore_conflicts=True)
+                found.update(MqttTopic.objects.filter(name__in=to_create).values_list('name', 'id'))
+            with self._lock:
+                for name, topic_id in found.items():
+                    self._set(name, topic_id)
+            resolved.update(found)
+
+        return resolved
+
+
+# Shared by every client service so model signals can invalidate it
+topic_cache = TopicCache()
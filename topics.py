@@ -0,0 +1,114 @@
+import threading
+import zlib
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Check whether an MQTT topic name matches a topic filter with ``+``/``#`` wildcards"""
+    if topic_filter == topic:
+        return True
+
+    # Wildcards never match topics starting with '$' (e.g. $SYS) at the first level
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        return False
+
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def is_wildcard(topic_filter: str) -> bool:
+    return '+' in topic_filter or '#' in topic_filter
+
+
+def shard_for(topic: str, shard_count: int) -> int:
+    """Stable shard index for a topic name (same result in every process)"""
+    return zlib.crc32(topic.encode('utf-8')) % shard_count
+
+
+def shared_subscription(group: str, topic_filter: str) -> str:
+    """MQTT v5 shared subscription filter, the broker load-balances messages across the group"""
+    return f'$share/{group}/{topic_filter}'
+
+
+class _TrieNode:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+
+
+class TopicTrie:
+    """Topic filters indexed by level, matching a topic costs O(topic depth) instead of O(filters)"""
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, topic_filter: str, value):
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split('/'):
+                node = node.children.setdefault(level, _TrieNode())
+            node.values.append(value)
+            self._size += 1
+
+    def remove(self, topic_filter: str, value) -> bool:
+        """Remove one value registered for topic_filter, returns False if it was not there"""
+        with self._lock:
+            path = [self._root]
+            for level in topic_filter.split('/'):
+                node = path[-1].children.get(level)
+                if node is None:
+                    return False
+                path.append(node)
+            if value not in path[-1].values:
+                return False
+            path[-1].values.remove(value)
+            self._size -= 1
+
+            # Prune empty branches
+            levels = topic_filter.split('/')
+            for depth in range(len(levels), 0, -1):
+                node = path[depth]
+                if node.values or node.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            return True
+
+    def match(self, topic: str) -> list:
+        """Values of every filter matching topic"""
+        levels = topic.split('/')
+        matched = []
+        with self._lock:
+            self._match(self._root, levels, 0, matched, topic.startswith('$'))
+        return matched
+
+    def _match(self, node: _TrieNode, levels, depth: int, matched: list, system: bool):
+        # Wildcards never match topics starting with '$' at the first level
+        wildcards = not (system and depth == 0)
+        if wildcards:
+            multi = node.children.get('#')
+            if multi is not None:
+                matched.extend(multi.values)
+        if depth == len(levels):
+            matched.extend(node.values)
+            return
+        if wildcards:
+            single = node.children.get('+')
+            if single is not None:
+                self._match(single, levels, depth + 1, matched, system)
+        exact = node.children.get(levels[depth])
+        if exact is not None:
+            self._match(exact, levels, depth + 1, matched, system)
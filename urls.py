@@ -8,7 +8,17 @@ urlpatterns = [
     path('connect/', views.mqtt_connect, name='connect'),
     path('disconnect/', views.mqtt_disconnect, name='disconnect'),
     path('publish/', views.mqtt_publish, name='publish'),
+    path('publish/bulk/', views.mqtt_publish_bulk, name='publish_bulk'),
     path('subscribe/', views.mqtt_subscribe_topic, name='subscribe'),
     path('status/', views.mqtt_status, name='status'),
+    path('snapshot/', views.mqtt_snapshot, name='snapshot'),
+    path('search/', views.mqtt_search, name='search'),
+    path('export/', views.mqtt_export, name='export'),
+    path('metrics/', views.mqtt_metrics, name='metrics'),
+    path('brokers/', views.mqtt_brokers, name='brokers'),
+    path('brokers/<int:connection_id>/connect/', views.mqtt_broker_connect, name='broker_connect'),
+    path('brokers/<int:connection_id>/disconnect/', views.mqtt_broker_disconnect, name='broker_disconnect'),
     path('topic/<int:topic_id>/messages/', views.mqtt_topic_messages, name='topic_messages'),
+    path('topic/<int:topic_id>/aggregate/', views.mqtt_topic_aggregate, name='topic_aggregate'),
+    path('stream/', views.mqtt_stream, name='stream'),
 ]
\ No newline at end of file
@@ -1,15 +1,31 @@
 import json
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
-from django.core.paginator import Paginator
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 
-from .models import MqttTopic, MqttMessage, MqttConnection
+from .compression import STORED_PAYLOAD_FIELDS, payload_store
+from .connections import connection_manager
+from .export import CONTENT_TYPES, FORMAT_CSV, FORMATS, aiterate, encode, export_rows, parse_bound, resolve_topics
+from .metrics import EXPOSITION_CONTENT_TYPE, bearer_authorized, registry
+from .models import MqttConnection, MqttTopic, MqttMessage
 from .mqtt_client import mqtt_service
+from .pagination import InvalidCursor, keyset_page
+from .publish import STATUS_FAILED, STATUS_QUEUED, STATUS_SENT, summarize
+from .rollups import RESOLUTION_SECONDS, aggregate_series, choose_resolution
+from .search import parse_query, search_index
+from .status import status_snapshot
+from .stream import async_event_stream, broadcaster, event_stream
+from .topics import topic_matches
 
 
 @method_decorator(staff_member_required, name='dispatch')
@@ -20,20 +36,24 @@ class MqttDashboardView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get connection status
-        connection = MqttConnection.objects.first()
+        # Connection status from the status snapshot
+        status = status_snapshot.get()['data']
+        connection = dict(status['connection'])
+        if connection['last_connected']:
+            connection['last_connected'] = parse_datetime(connection['last_connected'])
         
-        # Get topics with latest messages
-        topics = MqttTopic.objects.all()
+        # Get topics with latest messages (evaluated once, counted with |length)
+        topics = list(MqttTopic.objects.all())
         
         # Get recent messages
         recent_messages = MqttMessage.objects.select_related('topic')[:20]
         
         context.update({
-            'connection': connection,
+            'connection': connection if connection['broker_host'] else None,
             'topics': topics,
             'recent_messages': recent_messages,
-            'is_connected': mqtt_service.is_connected,
+            'is_connected': mqtt_service.is_connected or status['is_connected'],
+            'stream_enabled': getattr(settings, 'MQTT_WEBSOCKET_ENABLED', True),
         })
         
         return context
@@ -75,6 +95,20 @@ def mqtt_disconnect(request):
         })
 
 
+def _service_for(connection_id):
+    """Client service for an optional MqttConnection id, the default broker when empty"""
+    if connection_id in (None, ''):
+        return mqtt_service
+    return connection_manager.service_for(int(connection_id))
+
+
+def _unknown_connection():
+    return JsonResponse({
+        'success': False,
+        'message': 'Unknown broker connection'
+    })
+
+
 @staff_member_required
 @require_http_methods(["POST"])
 @csrf_exempt
@@ -93,13 +127,97 @@ def mqtt_publish(request):
                 'message': 'Topic and payload are required'
             })
         
-        success = mqtt_service.publish_message(topic_name, payload, qos, retain)
+        result = _service_for(data.get('connection')).publish_many(
+            [(topic_name, payload, qos, retain)],
+            wait=bool(data.get('wait', False)),
+            timeout=data.get('timeout'),
+        )[0]
+        success = result.status != STATUS_FAILED
+        if result.status == STATUS_QUEUED:
+            message = 'Not connected, message queued in the outbox'
+        elif success:
+            message = 'Message published successfully'
+        else:
+            message = f'Failed to publish message: {result.error}'
         
         return JsonResponse({
             'success': success,
-            'message': 'Message published successfully' if success else 'Failed to publish message'
+            'message': message,
+            'result': result.to_dict(),
+        })
+        
+    except (MqttConnection.DoesNotExist, ValueError):
+        return _unknown_connection()
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid JSON data'
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["POST"])
+@csrf_exempt
+def mqtt_publish_bulk(request):
+    """Publish a list of messages in one request"""
+    try:
+        data = json.loads(request.body)
+        items = data.get('messages')
+        max_messages = getattr(settings, 'MQTT_PUBLISH_BULK_MAX', 10000)
+        
+        if not isinstance(items, list) or not items:
+            return JsonResponse({
+                'success': False,
+                'message': 'messages must be a non-empty list'
+            })
+        if len(items) > max_messages:
+            return JsonResponse({
+                'success': False,
+                'message': f'At most {max_messages} messages per request'
+            })
+        
+        messages = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get('topic') or item.get('payload') is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Message {index}: topic and payload are required'
+                })
+            qos = item.get('qos', 1)
+            if qos not in (0, 1, 2):
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Message {index}: qos must be 0, 1 or 2'
+                })
+            messages.append((item['topic'], item['payload'], qos, bool(item.get('retain', False))))
+        
+        service = _service_for(data.get('connection'))
+        results = service.publish_many(
+            messages,
+            wait=bool(data.get('wait', False)),
+            timeout=data.get('timeout'),
+        )
+        summary = summarize(results)
+        
+        return JsonResponse({
+            'success': summary[STATUS_FAILED] == 0,
+            'sent': summary[STATUS_SENT],
+            'queued': summary[STATUS_QUEUED],
+            'failed': summary[STATUS_FAILED],
+            'acknowledged': summary['acknowledged'],
+            'errors': [
+                {'index': index, 'topic': result.topic, 'error': result.error}
+                for index, result in enumerate(results) if result.status == STATUS_FAILED
+            ],
         })
         
+    except (MqttConnection.DoesNotExist, ValueError):
+        return _unknown_connection()
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -115,34 +233,222 @@ def mqtt_publish(request):
 @staff_member_required
 @require_http_methods(["GET"])
 def mqtt_topic_messages(request, topic_id):
-    """Get messages for a specific topic"""
+    """Get messages for a specific topic (keyset pagination, newest first)"""
     try:
         topic = get_object_or_404(MqttTopic, id=topic_id)
-        messages = topic.messages.all()
-        
-        # Pagination
-        page = request.GET.get('page', 1)
-        paginator = Paginator(messages, 50)
-        page_obj = paginator.get_page(page)
-        
-        messages_data = []
-        for message in page_obj:
-            messages_data.append({
-                'id': message.id,
-                'payload': message.payload,
-                'qos': message.qos,
-                'retain': message.retain,
-                'timestamp': message.timestamp.isoformat(),
-                'received_at': message.received_at.isoformat(),
+        messages = MqttMessage.objects.filter(topic_id=topic.id)
+        
+        since = request.GET.get('since')
+        if since:
+            try:
+                since_at = parse_bound(since)
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Invalid since datetime, use an ISO datetime or date'
+                }, status=400)
+            messages = messages.filter(received_at__gte=since_at)
+        
+        default_size = getattr(settings, 'MQTT_MESSAGES_PAGE_SIZE', 50)
+        max_size = getattr(settings, 'MQTT_MESSAGES_MAX_PAGE_SIZE', 500)
+        try:
+            limit = min(max(int(request.GET.get('limit', default_size)), 1), max_size)
+        except ValueError:
+            limit = default_size
+        
+        page = keyset_page(
+            messages,
+            ['id', 'payload_encoding', 'qos', 'retain', 'timestamp', 'received_at', *STORED_PAYLOAD_FIELDS],
+            limit,
+            before=request.GET.get('before'),
+            after=request.GET.get('after'),
+        )
+        
+        messages_data = [{
+            'id': row['id'],
+            'payload': payload_store.unpack_row(row),
+            'payload_encoding': row['payload_encoding'],
+            'qos': row['qos'],
+            'retain': row['retain'],
+            'timestamp': row['timestamp'].isoformat(),
+            'received_at': row['received_at'].isoformat(),
+        } for row in page['rows']]
+        
+        return JsonResponse({
+            'success': True,
+            'messages': messages_data,
+            'has_next': page['has_older'],
+            'has_previous': page['has_newer'],
+            'next_cursor': page['next_cursor'],
+            'prev_cursor': page['prev_cursor'],
+            'limit': limit,
+        })
+        
+    except InvalidCursor as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_search(request):
+    """Search stored messages (full-text ``q``, ``key=value`` lookups, keyset pagination, newest first)
+
+    ``q`` may mix words and ``key=value`` terms; ``key`` (repeatable,
+    ``path=value``) adds key lookups, ``topic`` (repeatable) limits topics by
+    name and ``since``/``until`` bound received_at.
+    """
+    try:
+        query, keys = parse_query(request.GET.get('q', ''))
+        for item in request.GET.getlist('key'):
+            key, sep, value = item.partition('=')
+            if not sep or not key:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Invalid key lookup: {item}'
+                })
+            keys[key] = value
+        if not query and not keys:
+            return JsonResponse({
+                'success': False,
+                'message': 'Search query or key lookup is required'
             })
         
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.GET.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_bound(value)
+                except ValueError:
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Invalid {name} datetime, use an ISO datetime or date'
+                    }, status=400)
+        
+        messages = MqttMessage.objects.all()
+        topics = request.GET.getlist('topic')
+        if topics:
+            messages = messages.filter(topic__name__in=topics)
+        messages = search_index.filter(messages, query, keys, **bounds)
+        
+        default_size = getattr(settings, 'MQTT_MESSAGES_PAGE_SIZE', 50)
+        max_size = getattr(settings, 'MQTT_MESSAGES_MAX_PAGE_SIZE', 500)
+        try:
+            limit = min(max(int(request.GET.get('limit', default_size)), 1), max_size)
+        except ValueError:
+            limit = default_size
+        
+        page = keyset_page(
+            messages,
+            ['id', 'topic__name', 'payload_encoding', 'qos', 'retain', 'timestamp', 'received_at',
+             *STORED_PAYLOAD_FIELDS],
+            limit,
+            before=request.GET.get('before'),
+            after=request.GET.get('after'),
+        )
+        
+        messages_data = [{
+            'id': row['id'],
+            'topic': row['topic__name'],
+            'payload': payload_store.unpack_row(row),
+            'payload_encoding': row['payload_encoding'],
+            'qos': row['qos'],
+            'retain': row['retain'],
+            'timestamp': row['timestamp'].isoformat(),
+            'received_at': row['received_at'].isoformat(),
+        } for row in page['rows']]
+        
         return JsonResponse({
             'success': True,
             'messages': messages_data,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-            'page_number': page_obj.number,
-            'total_pages': paginator.num_pages,
+            'has_next': page['has_older'],
+            'has_previous': page['has_newer'],
+            'next_cursor': page['next_cursor'],
+            'prev_cursor': page['prev_cursor'],
+            'limit': limit,
+        })
+        
+    except InvalidCursor as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_topic_aggregate(request, topic_id):
+    """Min/max/avg per bucket for a topic from the rollup tables
+
+    Query: ``start``/``end`` (ISO datetimes, default the last 24 hours),
+    ``resolution`` (``auto``, ``1m``, ``1h``, ``1d``) and ``max_points``.
+    ``auto`` picks the finest resolution that fits in ``max_points`` buckets.
+    """
+    try:
+        topic = get_object_or_404(MqttTopic, id=topic_id)
+        now = timezone.now()
+        
+        bounds = {}
+        for name, default in (('end', now), ('start', None)):
+            value = request.GET.get(name)
+            if not value:
+                bounds[name] = default
+                continue
+            try:
+                bounds[name] = parse_bound(value)
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Invalid {name} datetime, use an ISO datetime or date'
+                }, status=400)
+        end = bounds['end']
+        start = bounds['start'] or end - timedelta(days=1)
+        if start >= end:
+            return JsonResponse({
+                'success': False,
+                'message': 'start must be before end'
+            })
+        
+        max_allowed = getattr(settings, 'MQTT_AGGREGATE_MAX_POINTS', 1000)
+        try:
+            max_points = min(max(int(request.GET.get('max_points', max_allowed)), 1), max_allowed)
+        except ValueError:
+            max_points = max_allowed
+        
+        resolution = request.GET.get('resolution', 'auto')
+        if resolution == 'auto':
+            resolution = choose_resolution(start, end, max_points, now)
+        elif resolution not in RESOLUTION_SECONDS:
+            return JsonResponse({
+                'success': False,
+                'message': f'Invalid resolution, use auto or one of {", ".join(RESOLUTION_SECONDS)}'
+            })
+        elif (end - start).total_seconds() / RESOLUTION_SECONDS[resolution] > max_points:
+            return JsonResponse({
+                'success': False,
+                'message': f'Range needs more than {max_points} {resolution} buckets, use a coarser resolution'
+            })
+        
+        return JsonResponse({
+            'success': True,
+            'topic': topic.name,
+            'resolution': resolution,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'buckets': aggregate_series(topic.id, resolution, start, end),
         })
         
     except Exception as e:
@@ -162,6 +468,7 @@ def mqtt_subscribe_topic(request):
         topic_name = data.get('topic')
         description = data.get('description', '')
         qos = data.get('qos', 1)
+        connection_id = data.get('connection')
         
         if not topic_name:
             return JsonResponse({
@@ -185,9 +492,21 @@ def mqtt_subscribe_topic(request):
             topic.description = description
             topic.save()
         
-        # Subscribe if connected
-        if mqtt_service.is_connected:
-            mqtt_service.client.subscribe(topic_name, qos)
+        if connection_id not in (None, ''):
+            # Restrict the topic to this broker (in addition to brokers already listed)
+            service = _service_for(connection_id)
+            topic.connections.add(service.connection_record or MqttConnection.objects.get(pk=connection_id))
+            services = [service]
+        else:
+            broker_ids = set(topic.connections.values_list('id', flat=True))
+            services = [
+                service for service in connection_manager.services()
+                if not broker_ids or (service.connection_record and service.connection_record.pk in broker_ids)
+            ]
+        
+        # Subscribe on every connected broker that carries the topic
+        for service in services:
+            service.subscribe(topic_name, qos)
         
         return JsonResponse({
             'success': True,
@@ -195,6 +514,8 @@ def mqtt_subscribe_topic(request):
             'topic_id': topic.id
         })
         
+    except (MqttConnection.DoesNotExist, ValueError):
+        return _unknown_connection()
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -210,27 +531,245 @@ def mqtt_subscribe_topic(request):
 @staff_member_required
 @require_http_methods(["GET"])
 def mqtt_status(request):
-    """Get current MQTT connection status"""
+    """Get current MQTT connection status from the status snapshot (supports If-None-Match)"""
     try:
-        connection = MqttConnection.objects.first()
-        topics_count = MqttTopic.objects.filter(is_active=True).count()
-        messages_count = MqttMessage.objects.count()
+        snapshot = status_snapshot.get()
+        etag = quote_etag(snapshot['etag'])
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(dict(snapshot['data'], success=True))
+        response['ETag'] = etag
+        # Browsers revalidate every poll, unchanged status costs a 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
         
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_snapshot(request):
+    """Latest payload of every topic from the last value cache (no MqttMessage queries)
+
+    ``topic`` (repeatable, MQTT wildcards allowed) selects topics, ``since``
+    only returns topics received at or after that time. Topics missing from
+    the cache (e.g. after a restart) fall back to the maintained
+    ``MqttTopic.last_payload`` and are marked ``cached: false``.
+    """
+    try:
+        since = request.GET.get('since')
+        since_at = None
+        if since:
+            try:
+                # Naive values are taken in the current time zone, cached entries carry an aware received_at
+                since_at = parse_bound(since)
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Invalid since datetime, use an ISO datetime or date'
+                }, status=400)
+        
+        topics = MqttTopic.objects.all()
+        if request.GET.get('active'):
+            topics = topics.filter(is_active=True)
+        names = dict(topics.values_list('id', 'name'))
+        filters = request.GET.getlist('topic')
+        if filters:
+            names = {topic_id: name for topic_id, name in names.items()
+                     if any(topic_matches(topic_filter, name) for topic_filter in filters)}
+        
+        values = mqtt_service.last_values.get_many(names)
+        snapshot = []
+        for topic_id, entry in values.items():
+            if since_at is not None and parse_datetime(entry['received_at']) < since_at:
+                continue
+            snapshot.append(dict(entry, topic=names[topic_id], cached=True))
+        
+        missing = MqttTopic.objects.filter(id__in=[topic_id for topic_id in names if topic_id not in values],
+                                           last_received_at__isnull=False)
+        if since_at is not None:
+            missing = missing.filter(last_received_at__gte=since_at)
+        for topic_id, payload, received_at in missing.values_list('id', 'last_payload', 'last_received_at'):
+            snapshot.append({
+                'topic_id': topic_id,
+                'topic': names[topic_id],
+                'payload': payload,
+                'truncated': len(payload) >= MqttTopic.LAST_PAYLOAD_LENGTH,
+                'received_at': received_at.isoformat(),
+                'cached': False,
+            })
+        
+        snapshot.sort(key=lambda entry: entry['topic'])
         return JsonResponse({
             'success': True,
-            'is_connected': mqtt_service.is_connected,
-            'connection': {
-                'status': connection.status if connection else 'disconnected',
-                'broker_host': connection.broker_host if connection else '',
-                'broker_port': connection.broker_port if connection else 1883,
-                'last_connected': connection.last_connected.isoformat() if connection and connection.last_connected else None,
-                'last_error': connection.last_error if connection else '',
-            },
-            'stats': {
-                'active_topics': topics_count,
-                'total_messages': messages_count,
-            }
+            'count': len(snapshot),
+            'topics': snapshot,
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
         })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_brokers(request):
+    """Configured brokers with the live status of their clients in this process"""
+    try:
+        return JsonResponse({
+            'success': True,
+            'brokers': connection_manager.status()
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["POST"])
+@csrf_exempt
+def mqtt_broker_connect(request, connection_id):
+    """Connect the client of one broker"""
+    try:
+        service = connection_manager.service_for(connection_id)
+        if not service.client:
+            service.setup_client()
+        success = service.connect()
+        return JsonResponse({
+            'success': success,
+            'message': f'Connected to {service.label}' if success else 'Failed to connect'
+        })
+    except MqttConnection.DoesNotExist:
+        return _unknown_connection()
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@staff_member_required
+@require_http_methods(["POST"])
+@csrf_exempt
+def mqtt_broker_disconnect(request, connection_id):
+    """Disconnect the client of one broker"""
+    try:
+        service = connection_manager.service_for(connection_id)
+        service.disconnect()
+        return JsonResponse({
+            'success': True,
+            'message': f'Disconnected from {service.label}'
+        })
+    except MqttConnection.DoesNotExist:
+        return _unknown_connection()
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@require_http_methods(["GET"])
+def mqtt_metrics(request):
+    """Prometheus metrics for this process (staff session or MQTT_METRICS_TOKEN bearer token)"""
+    if not getattr(settings, 'MQTT_METRICS_ENABLED', True):
+        return JsonResponse({'success': False, 'message': 'Metrics are disabled'}, status=404)
+    
+    token = getattr(settings, 'MQTT_METRICS_TOKEN', None)
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized:
+        authorized = bearer_authorized(request.headers.get('Authorization'), token)
+    if not authorized:
+        return JsonResponse({'success': False, 'message': 'Forbidden'}, status=403)
+    
+    return HttpResponse(registry.render(), content_type=EXPOSITION_CONTENT_TYPE)
+
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_stream(request):
+    """Server-sent events stream of live messages and status changes"""
+    if not getattr(settings, 'MQTT_WEBSOCKET_ENABLED', True):
+        return JsonResponse({
+            'success': False,
+            'message': 'Live stream is disabled'
+        }, status=404)
+    
+    for service in connection_manager.services():
+        broadcaster.ensure_registered(service, status=service is mqtt_service)
+    subscription = broadcaster.subscribe(request.GET.getlist('topic'))
+    coalesce = request.GET.get('coalesce') in ('1', 'true')
+    
+    # Under ASGI the stream waits on the event loop instead of pinning a worker thread
+    stream = async_event_stream if isinstance(request, ASGIRequest) else event_stream
+    response = StreamingHttpResponse(
+        stream(broadcaster, subscription, mqtt_service.get_status(), coalesce=coalesce),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def mqtt_export(request):
+    """Stream topic history as CSV or NDJSON (``topic`` repeatable with wildcards, ``since``/``until``, ``gzip``)"""
+    try:
+        topic_filters = request.GET.getlist('topic')
+        if not topic_filters:
+            return JsonResponse({
+                'success': False,
+                'message': 'At least one topic is required'
+            })
+        
+        export_format = request.GET.get('format', FORMAT_CSV)
+        if export_format not in FORMATS:
+            return JsonResponse({
+                'success': False,
+                'message': f'Invalid format: {export_format}'
+            })
+        
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.GET.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_bound(value)
+                except ValueError:
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Invalid {name} datetime, use an ISO datetime or date'
+                    }, status=400)
+        
+        topics = resolve_topics(topic_filters)
+        if not topics:
+            return JsonResponse({
+                'success': False,
+                'message': 'No topics match'
+            })
+        
+        gzip = request.GET.get('gzip') in ('1', 'true')
+        archive = request.GET.get('archive') in ('1', 'true')
+        rows = export_rows(topics, archive=archive, **bounds)
+        chunks = encode(rows, export_format, gzip=gzip)
+        if isinstance(request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[export_format])
+        filename = f'mqtt-export-{timezone.now():%Y%m%d-%H%M%S}.{export_format}' + ('.gz' if gzip else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
         
     except Exception as e:
         return JsonResponse({
@@ -35,7 +35,22 @@ class MqttTopicSnippet(MqttTopic):
         MultiFieldPanel([
             FieldPanel('is_active'),
             FieldPanel('qos'),
+            FieldPanel('connections'),
         ], heading="Configuration"),
+        MultiFieldPanel([
+            FieldPanel('payload_codec'),
+            FieldPanel('value_path'),
+            FieldPanel('payload_compression'),
+        ], heading="Payload"),
+        MultiFieldPanel([
+            FieldPanel('search_enabled'),
+            FieldPanel('search_keys'),
+        ], heading="Search"),
+        MultiFieldPanel([
+            FieldPanel('max_messages'),
+            FieldPanel('max_age'),
+            FieldPanel('max_bytes'),
+        ], heading="Retention"),
     ]
     
     class Meta:
@@ -0,0 +1,206 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SHARDING_SHARED = 'shared'
+SHARDING_HASH = 'hash'
+
+# A worker that stayed up this long is considered healthy again, its backoff resets
+STABLE_SECONDS = 60
+
+
+def apply_broker_options(options: dict):
+    """Copy command line broker overrides onto settings (also needed in spawned workers)"""
+    for option, setting in (('host', 'MQTT_BROKER_HOST'), ('port', 'MQTT_BROKER_PORT'),
+                            ('username', 'MQTT_BROKER_USERNAME'), ('password', 'MQTT_BROKER_PASSWORD')):
+        if options.get(option):
+            setattr(settings, setting, options[option])
+
+
+def run_worker(index: int, count: int, share_group: Optional[str], options: dict,
+               health_queue, stop_event, health_interval: float):
+    """Worker process entry point: one MqttClientService consuming one shard"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from .metrics import start_metrics_server
+    from .mqtt_client import mqtt_service
+
+    # Ctrl+C reaches the whole process group, the supervisor coordinates shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    apply_broker_options(options)
+    if options.get('metrics_port') and getattr(settings, 'MQTT_METRICS_ENABLED', True):
+        # Each worker has its own registry, scrape them as separate targets
+        start_metrics_server(options['metrics_port'] + index, getattr(settings, 'MQTT_METRICS_HOST', ''))
+    mqtt_service.configure_shard(index, count, share_group)
+    mqtt_service.setup_client()
+    if not mqtt_service.connect():
+        raise SystemExit(1)
+
+    def report():
+        pipeline = mqtt_service.pipeline
+        health_queue.put({
+            'index': index,
+            'connected': mqtt_service.is_connected,
+            'depth': pipeline.depth if pipeline else 0,
+            'stats': dict(pipeline.stats) if pipeline else {},
+            'time': time.time(),
+        })
+
+    try:
+        while not stop_event.wait(health_interval):
+            report()
+    finally:
+        mqtt_service.disconnect()
+        report()
+
+
+class WorkerSupervisor:
+    """Run N client processes, restart crashed ones with backoff and aggregate their health
+
+    Each worker is a separate process with its own paho network loop, ingest
+    writer and database connection, so ingest is not bound to one core.
+    """
+
+    def __init__(self, workers: int, sharding: str = SHARDING_HASH, share_group: Optional[str] = None,
+                 options: Optional[dict] = None, health_interval: Optional[float] = None,
+                 restart_backoff: Optional[float] = None, max_backoff: Optional[float] = None):
+        if sharding not in (SHARDING_SHARED, SHARDING_HASH):
+            raise ValueError(f"Unknown sharding mode: {sharding}")
+
+        self.workers = max(1, workers)
+        self.sharding = sharding
+        self.share_group = share_group or getattr(settings, 'MQTT_SHARED_SUBSCRIPTION_GROUP', 'mqtt-ingest')
+        self.options = options or {}
+        self.health_interval = health_interval or getattr(settings, 'MQTT_WORKER_HEALTH_INTERVAL', 10)
+        self.restart_backoff = restart_backoff or getattr(settings, 'MQTT_WORKER_RESTART_BACKOFF', 1.0)
+        self.max_backoff = max_backoff or getattr(settings, 'MQTT_WORKER_MAX_BACKOFF', 60)
+
+        self._ctx = multiprocessing.get_context()
+        self._health_queue = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self.restarts: Dict[int, int] = {index: 0 for index in range(self.workers)}
+        self.reports: Dict[int, dict] = {}
+
+    def start(self):
+        """Start all workers"""
+        from .models import MqttConnection
+
+        # Create the shared connection row once, workers only update it
+        MqttConnection.objects.get_or_create(
+            broker_host=getattr(settings, 'MQTT_BROKER_HOST', 'localhost'),
+            broker_port=getattr(settings, 'MQTT_BROKER_PORT', 1883),
+            defaults={'status': 'connecting'}
+        )
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        share_group = self.share_group if self.sharding == SHARDING_SHARED else None
+        process = self._ctx.Process(
+            target=run_worker,
+            args=(index, self.workers, share_group, self.options,
+                  self._health_queue, self._stop_event, self.health_interval),
+            name=f'mqtt-worker-{index}',
+            daemon=False,
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Started MQTT worker {index} (pid {process.pid})")
+
+    def supervise(self):
+        """One supervision step: collect health reports and restart dead workers"""
+        self._collect_reports()
+        now = time.monotonic()
+        for index, process in list(self._processes.items()):
+            if process.is_alive() or self._stop_event.is_set():
+                continue
+
+            if index not in self._restart_at:
+                uptime = now - self._started_at[index]
+                backoff = self._backoff.get(index, self.restart_backoff)
+                if uptime >= STABLE_SECONDS:
+                    backoff = self.restart_backoff
+                logger.error(f"MQTT worker {index} exited with code {process.exitcode}, restarting in {backoff:.1f}s")
+                self._restart_at[index] = now + backoff
+                self._backoff[index] = min(backoff * 2, self.max_backoff)
+            elif now >= self._restart_at[index]:
+                del self._restart_at[index]
+                self.restarts[index] += 1
+                self._spawn(index)
+
+    def run(self, should_stop: Callable[[], bool], on_health: Optional[Callable[[dict], None]] = None):
+        """Supervise until should_stop() returns True, reporting health every health_interval"""
+        next_report = time.monotonic() + self.health_interval
+        while not should_stop():
+            self.supervise()
+            if on_health and time.monotonic() >= next_report:
+                on_health(self.health())
+                next_report = time.monotonic() + self.health_interval
+            time.sleep(0.5)
+
+    def stop(self, timeout: float = 30):
+        """Ask workers to flush and exit, terminate the ones that do not"""
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for index, process in self._processes.items():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error(f"MQTT worker {index} did not stop in time, terminating")
+                process.terminate()
+                process.join(5)
+        self._collect_reports()
+
+    def health(self) -> dict:
+        """Aggregated health of all workers"""
+        now = time.time()
+        workers = []
+        totals = {'enqueued': 0, 'written': 0, 'dropped': 0, 'spilled': 0, 'failed_batches': 0, 'depth': 0}
+        for index in range(self.workers):
+            process = self._processes.get(index)
+            report = self.reports.get(index, {})
+            stats = report.get('stats', {})
+            for key in totals:
+                totals[key] += report.get('depth', 0) if key == 'depth' else stats.get(key, 0)
+            workers.append({
+                'index': index,
+                'pid': process.pid if process else None,
+                'alive': bool(process and process.is_alive()),
+                'connected': report.get('connected', False),
+                'restarts': self.restarts[index],
+                'depth': report.get('depth', 0),
+                'stats': stats,
+                'last_report_age': round(now - report['time'], 1) if report else None,
+            })
+        return {
+            'workers': workers,
+            'alive': sum(1 for worker in workers if worker['alive']),
+            'connected': sum(1 for worker in workers if worker['connected']),
+            'totals': totals,
+        }
+
+    def _collect_reports(self):
+        while True:
+            try:
+                report = self._health_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.reports[report['index']] = report